@@ -0,0 +1,617 @@
+#!/usr/bin/env python3
+"""
+Воспроизводимый набор бенчмарков горячего пути бота.
+Каждый сценарий работает на своей временной базе, результаты (p50/p95/p99,
+пропускная способность) пишутся в JSON и сравниваются с сохранённой базовой линией.
+
+    python benchmark.py                      # прогон и сравнение с benchmark_baseline.json
+    python benchmark.py --save-baseline      # сохранить результаты как базовую линию
+    python benchmark.py --threshold 0.3 --only join,refresh --repeat 5
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import signal
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Update
+import config
+import bot as bot_module
+from database import DatabaseManager
+from event_log import EventLogManager
+from memory_storage import MemoryStorage
+from storage import Participant, Storage
+
+DEFAULT_BASELINE = "benchmark_baseline.json"
+DEFAULT_OUTPUT = "benchmark_results.json"
+
+
+def summarize(latencies: List[float], total: float) -> Dict[str, float]:
+    """Перцентили задержки (мс) и пропускная способность (оп/сек)"""
+    values = sorted(latencies)
+    if len(values) > 1:
+        cuts = statistics.quantiles(values, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = values[0]
+    return {
+        "operations": len(values),
+        "throughput": len(values) / total if total else 0.0,
+        "mean_ms": statistics.fmean(values) * 1000,
+        "p50_ms": p50 * 1000,
+        "p95_ms": p95 * 1000,
+        "p99_ms": p99 * 1000,
+        "max_ms": values[-1] * 1000,
+    }
+
+
+async def timed(operation: Callable[[], Awaitable], latencies: List[float]):
+    start = time.perf_counter()
+    await operation()
+    latencies.append(time.perf_counter() - start)
+
+
+async def run_concurrent(operations: List[Callable[[], Awaitable]]) -> Dict[str, float]:
+    """Одновременный запуск операций с замером каждой"""
+    latencies: List[float] = []
+    start = time.perf_counter()
+    await asyncio.gather(*(timed(op, latencies) for op in operations))
+    return summarize(latencies, time.perf_counter() - start)
+
+
+class Benchmark:
+    """Сценарии бенчмарка; каждый получает чистую временную базу"""
+
+    def __init__(self, scale: float, seed: int):
+        self.scale = scale
+        self.seed = seed
+        self.workdir = tempfile.mkdtemp(prefix="organizbot-bench-")
+        self._dbs = 0
+        # Разбивка запуска из лога последнего процесса бота (сценарий cold_start)
+        self.startup_log: List[str] = []
+
+    def size(self, base: int) -> int:
+        return max(1, int(base * self.scale))
+
+    async def fresh_db(self, storage=DatabaseManager, **kwargs) -> Storage:
+        self._dbs += 1
+        if storage is MemoryStorage:
+            db = MemoryStorage(**kwargs)
+        else:
+            db = storage(db_path=os.path.join(self.workdir, f"bench-{self._dbs}.db"), **kwargs)
+        await db.init_database()
+        return db
+
+    async def scenario_join(self, storage=DatabaseManager) -> Dict[str, float]:
+        """Всплеск записей на одно событие (большинство получают «Список полон»)"""
+        db = await self.fresh_db(storage)
+        event_id = await db.create_event("join", 1)
+        result = await run_concurrent([
+            (lambda u=u: db.add_participant(event_id, u, f"user{u}", "User", str(u)))
+            for u in range(self.size(1000))
+        ])
+        await db.close()
+        return result
+
+    async def scenario_join_log(self) -> Dict[str, float]:
+        """То же при хранении журналом операций"""
+        return await self.scenario_join(EventLogManager)
+
+    async def scenario_join_mem(self) -> Dict[str, float]:
+        """То же в хранилище в памяти: нижняя граница стоимости хранения"""
+        return await self.scenario_join(MemoryStorage)
+
+    async def scenario_full(self) -> Dict[str, float]:
+        """
+        Нажатия «Участвовать» после заполнения списка и очереди — путь handle_join:
+        отказ, затем постановка в очередь; оба ответа по кэшу состава
+        """
+        db = await self.fresh_db()
+        event_id = await db.create_event("full", 1)
+        for u in range(config.MAX_PARTICIPANTS):
+            await db.add_participant(event_id, u, f"user{u}", "User", str(u))
+        waiting = range(config.MAX_PARTICIPANTS, config.MAX_PARTICIPANTS + config.WAITLIST_MAX)
+        for u in waiting:
+            await db.wait_for_seat(event_id, u, f"user{u}", "User", str(u))
+        await db.get_roster(event_id)
+        
+        async def tap(u: int):
+            success, position = await db.add_participant(event_id, u, f"user{u}", "User", str(u))
+            if not success and position == -1 and config.WAITLIST_ENABLED:
+                await db.wait_for_seat(event_id, u, f"user{u}", "User", str(u))
+        
+        first = config.MAX_PARTICIPANTS + config.WAITLIST_MAX
+        result = await run_concurrent([
+            (lambda u=u: tap(u)) for u in range(first, first + self.size(5000))
+        ])
+        await db.close()
+        return result
+    
+    async def retry_traffic(self, waitlist: bool) -> Dict[str, float]:
+        """
+        Воскресный всплеск: желающих больше, чем мест, и по ходу раунда кто-то отказывается.
+        Получившие «Список полон!» нажимают снова в следующем раунде; стоящие в листе
+        ожидания не нажимают — их переводят в список при отказе. Операции — все нажатия
+        """
+        db = await self.fresh_db()
+        event_id = await db.create_event("retry", 1)
+        await db.get_roster(event_id)
+        rng = random.Random(self.seed)
+        users = list(range(config.MAX_PARTICIPANTS + self.size(100)))
+        latencies: List[float] = []
+        
+        async def tap(user_id: int) -> bool:
+            """Нажатие «Участвовать»; True — больше нажимать не нужно"""
+            start = time.perf_counter()
+            success, position = await db.add_participant(event_id, user_id, "", "U", str(user_id))
+            settled = success or position > 0
+            if not settled and waitlist:
+                _, place = await db.wait_for_seat(event_id, user_id, "", "U", str(user_id))
+                settled = place > 0
+            latencies.append(time.perf_counter() - start)
+            return settled
+        
+        pending = users
+        start = time.perf_counter()
+        for _ in range(20):
+            settled = await asyncio.gather(*(tap(u) for u in pending))
+            pending = [u for u, done in zip(pending, settled) if not done]
+            # Двое записавшихся отказываются, места достаются следующим
+            roster = await db.get_roster(event_id)
+            for user_id in rng.sample(list(roster.members), min(2, len(roster.members))):
+                await db.remove_participant(event_id, user_id)
+            if not pending:
+                break
+        result = summarize(latencies, time.perf_counter() - start)
+        await db.close()
+        return result
+    
+    async def scenario_retry(self) -> Dict[str, float]:
+        """Повторные нажатия при полном списке без листа ожидания"""
+        return await self.retry_traffic(waitlist=False)
+    
+    async def scenario_retry_wl(self) -> Dict[str, float]:
+        """То же с листом ожидания: ждущие перестают нажимать"""
+        return await self.retry_traffic(waitlist=True)
+    
+    async def scenario_leave(self) -> Dict[str, float]:
+        """Одновременный отказ всех участников заполненных событий"""
+        db = await self.fresh_db()
+        operations = []
+        for e in range(self.size(50)):
+            event_id = await db.create_event(f"leave-{e}", e)
+            for u in range(config.MAX_PARTICIPANTS):
+                await db.add_participant(event_id, u, f"user{u}", "User", str(u))
+                operations.append(lambda ev=event_id, u=u: db.remove_participant(ev, u))
+        result = await run_concurrent(operations)
+        await db.close()
+        return result
+
+    async def scenario_churn(self, storage=DatabaseManager) -> Dict[str, float]:
+        """Перемешанные записи и отказы небольшой группы пользователей"""
+        db = await self.fresh_db(storage)
+        event_id = await db.create_event("churn", 1)
+        rng = random.Random(self.seed)
+        operations = []
+        for _ in range(self.size(2000)):
+            user_id = rng.randrange(40)
+            if rng.random() < 0.6:
+                operations.append(
+                    lambda u=user_id: db.add_participant(event_id, u, f"user{u}", "User", str(u))
+                )
+            else:
+                operations.append(lambda u=user_id: db.remove_participant(event_id, u))
+        result = await run_concurrent(operations)
+        await db.close()
+        return result
+
+    async def scenario_churn_log(self) -> Dict[str, float]:
+        """То же при хранении журналом операций"""
+        return await self.scenario_churn(EventLogManager)
+
+    async def scenario_churn_mem(self) -> Dict[str, float]:
+        """То же в хранилище в памяти"""
+        return await self.scenario_churn(MemoryStorage)
+
+    async def recovery(self, storage) -> Dict[str, float]:
+        """
+        Восстановление после перезапуска: события с долгой историей записей, отказов
+        и очереди, затем новый экземпляр открывает базу и загружает все составы.
+        Операции — загрузки составов, в пропускную способность входит открытие базы
+        """
+        db = await self.fresh_db(storage)
+        rng = random.Random(self.seed)
+        event_ids = [await db.create_event(f"recovery-{e}", e) for e in range(self.size(20))]
+        for event_id in event_ids:
+            for _ in range(self.size(500)):
+                user_id = rng.randrange(40)
+                if rng.random() < 0.6:
+                    await db.wait_for_seat(event_id, user_id, f"user{user_id}", "User", str(user_id))
+                else:
+                    await db.remove_participant(event_id, user_id)
+        await db.close()
+        
+        latencies: List[float] = []
+        start = time.perf_counter()
+        restarted = storage(db_path=db.db_path)
+        await restarted.init_database()
+        for event_id in event_ids:
+            await timed(lambda: restarted.get_roster(event_id), latencies)
+        result = summarize(latencies, time.perf_counter() - start)
+        await restarted.close()
+        return result
+
+    async def scenario_recovery(self) -> Dict[str, float]:
+        """Загрузка составов из таблиц участников и очереди"""
+        return await self.recovery(DatabaseManager)
+
+    async def scenario_recovery_log(self) -> Dict[str, float]:
+        """Сборка составов из последнего снимка и хвоста журнала"""
+        return await self.recovery(EventLogManager)
+
+    async def scenario_refresh(self) -> Dict[str, float]:
+        """Шторм нажатий «Обновить»: чтение состава и подготовка текста"""
+        db = await self.fresh_db()
+        bot_module.db_manager = db
+        event_id = await db.create_event("refresh", 1)
+        for u in range(config.MAX_PARTICIPANTS):
+            await db.add_participant(event_id, u, f"user{u}", "User", str(u))
+        result = await run_concurrent([
+            (lambda: bot_module.render_participants_list(event_id, "refresh"))
+            for _ in range(self.size(5000))
+        ])
+        await db.close()
+        return result
+
+    async def scenario_render(self) -> Dict[str, float]:
+        """Форматирование полного списка без кэша"""
+        participants = [
+            Participant(u, f"user{u}", "User", str(u), u + 1) for u in range(config.MAX_PARTICIPANTS)
+        ]
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(self.size(20000)):
+            t = time.perf_counter()
+            bot_module.format_participants_list(participants, "2024-01-01")
+            latencies.append(time.perf_counter() - t)
+        return summarize(latencies, time.perf_counter() - start)
+
+    async def scenario_handler(self) -> Dict[str, float]:
+        """Полный путь обновления через диспетчер: фильтры, запись, ответ, правка"""
+        bot_module.bot.session = StubSession()
+        db = await self.fresh_db(recorder=bot_module.perf_recorder)
+        bot_module.db_manager = db
+        event_id = await db.create_event("handler", 77)
+        rng = random.Random(self.seed)
+        actions = ["join", "join", "leave", "refresh"]
+        updates = []
+        for i in range(self.size(2000)):
+            data = bot_module.EventCallback(
+                action=rng.choice(actions), event_id=event_id, date="handler"
+            ).pack()
+            updates.append(Update.model_validate({
+                "update_id": i,
+                "callback_query": {
+                    "id": str(i),
+                    "from": {"id": rng.randrange(60), "is_bot": False, "first_name": "User"},
+                    "chat_instance": "bench",
+                    "data": data,
+                    "message": {
+                        "message_id": 77, "date": 0, "text": "",
+                        "chat": {"id": config.CHAT_ID, "type": "supergroup"}
+                    }
+                }
+            }, context={"bot": bot_module.bot}))
+        result = await run_concurrent([
+            (lambda u=u: bot_module.dp.feed_update(bot_module.bot, u)) for u in updates
+        ])
+        await bot_module.edit_coalescer.close()
+        await db.close()
+        return result
+
+    async def scenario_cold_start(self) -> Dict[str, float]:
+        """От запуска процесса бота до ответа на первое нажатие (локальный Bot API)"""
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(self.size(3)):
+            latencies.append(await self.launch_bot())
+        return summarize(latencies, time.perf_counter() - start)
+    
+    async def launch_bot(self) -> float:
+        """
+        Запуск run.py отдельным процессом на базе с будущим событием;
+        нажатие уже ждёт в очереди getUpdates. Возвращает секунды до ответа на него
+        """
+        from fake_telegram import FakeTelegramServer, start_server
+        
+        db = await self.fresh_db()
+        event_date = bot_module.get_next_sunday_date()
+        event_id = await db.create_event(event_date, 77)
+        await db.close()
+        
+        server = FakeTelegramServer()
+        runner, base_url = await start_server(server)
+        data = bot_module.EventCallback(action="join", event_id=event_id, date=event_date).pack()
+        query_id = server.push_callback(1, data, config.CHAT_ID, 77)
+        log_file = os.path.join(self.workdir, f"cold-start-{self._dbs}.log")
+        env = dict(os.environ, TELEGRAM_API_URL=base_url, DATABASE_PATH=db.db_path,
+                   LOG_FILE=log_file, METRICS_ENABLED="false", LOG_JSON="false")
+        
+        start = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "run.py", "polling", env=env,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+        )
+        try:
+            await asyncio.wait_for(server.wait_answered(query_id), 120)
+            elapsed = server.answered_at(query_id) - start
+        finally:
+            process.terminate()
+            await process.wait()
+            await runner.cleanup()
+        
+        with open(log_file, encoding="utf-8") as f:
+            self.startup_log = [line.split(" - ", 3)[-1].strip() for line in f
+                                if "Startup:" in line or "First update handled" in line]
+        return elapsed
+    
+    async def scenario_workers_1(self) -> Dict[str, float]:
+        """Записи и отказы в 8 чатах через маршрутизатор webhook и один процесс-обработчик"""
+        return await self.launch_workers(1)
+    
+    async def scenario_workers_4(self) -> Dict[str, float]:
+        """То же с четырьмя обработчиками; выигрыш ограничен числом ядер машины"""
+        return await self.launch_workers(4)
+    
+    async def launch_workers(self, workers: int) -> Dict[str, float]:
+        """
+        Запуск run.py workers отдельным процессом; нажатия отправляются POST-запросами
+        в маршрутизатор. Задержка — от отправки нажатия до ответа на него в Bot API
+        """
+        import aiohttp
+        from fake_telegram import FakeTelegramServer, callback_update, start_server
+        from webhook import SECRET_HEADER
+        
+        db = await self.fresh_db()
+        event_date = bot_module.get_next_sunday_date()
+        chats = [-1000 - i for i in range(8)]
+        # Лимит не достигается: каждая запись доходит до базы
+        events = {chat_id: await db.create_event(event_date, 77, chat_id=chat_id, capacity=10 ** 6)
+                  for chat_id in chats}
+        await db.close()
+        
+        server = FakeTelegramServer()
+        runner, base_url = await start_server(server)
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        secret = "benchmark-secret"
+        env = dict(os.environ, TELEGRAM_API_URL=base_url, DATABASE_PATH=db.db_path,
+                   LOG_FILE=os.path.join(self.workdir, f"workers-{self._dbs}.log"),
+                   METRICS_ENABLED="false", LOG_JSON="false", KEEP_ALIVE="false",
+                   WORKERS=str(workers), WORKER_BASE_PORT=str(port + 1), PORT=str(port),
+                   WEBHOOK_HOST="127.0.0.1", WEBHOOK_SECRET=secret,
+                   WEBHOOK_BASE_URL=f"http://127.0.0.1:{port}")
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "run.py", "workers", env=env,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+        )
+        router_url = f"http://127.0.0.1:{port}"
+        updates = []
+        for i in range(self.size(2000)):
+            user_id = i // 2
+            chat_id = chats[user_id % len(chats)]
+            data = bot_module.EventCallback(action="leave" if i % 2 else "join",
+                                            event_id=events[chat_id], date=event_date).pack()
+            updates.append(callback_update(i + 1, user_id, data, chat_id, 77))
+        sent_at = {}
+        try:
+            async with aiohttp.ClientSession() as client:
+                # Маршрутизатор начинает слушать, когда готовы все обработчики
+                deadline = time.perf_counter() + 120
+                while True:
+                    try:
+                        async with client.get(f"{router_url}/healthz") as response:
+                            if response.status == 200:
+                                break
+                    except aiohttp.ClientError:
+                        pass
+                    if time.perf_counter() > deadline or process.returncode is not None:
+                        raise RuntimeError("маршрутизатор не запустился")
+                    await asyncio.sleep(0.2)
+                
+                async def post(update: dict):
+                    sent_at[str(update["update_id"])] = time.perf_counter()
+                    async with client.post(f"{router_url}{config.WEBHOOK_PATH}", json=update,
+                                           headers={SECRET_HEADER: secret}) as response:
+                        assert response.status == 200, f"маршрутизатор ответил {response.status}"
+                
+                start = time.perf_counter()
+                await asyncio.gather(*(post(update) for update in updates))
+                await asyncio.wait_for(
+                    asyncio.gather(*(server.wait_answered(query_id) for query_id in sent_at)), 120
+                )
+                total = time.perf_counter() - start
+        finally:
+            process.send_signal(signal.SIGINT)
+            try:
+                await asyncio.wait_for(process.wait(), 30)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+            await runner.cleanup()
+        return summarize([server.answered_at(query_id) - sent for query_id, sent in sent_at.items()],
+                         total)
+    
+    def scenarios(self) -> Dict[str, Callable[[], Awaitable[Dict[str, float]]]]:
+        return {
+            name[len("scenario_"):]: getattr(self, name)
+            for name in dir(self) if name.startswith("scenario_")
+        }
+
+    def cleanup(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class StubSession(BaseSession):
+    """Сессия Bot API без сети: все методы мгновенно «успешны»"""
+
+    def __init__(self):
+        super().__init__()
+        self.middleware(bot_module.api_timing)
+        self.middleware(bot_module.outbound)
+
+    async def make_request(self, bot, method, timeout=None):
+        return True
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """Сравнение с базовой линией; возвращает список регрессий"""
+    regressions = []
+    print(f"\n📏 Сравнение с базовой линией (порог {threshold:.0%})")
+    print(f"{'Сценарий':<13} {'p95, мс':<22} {'оп/сек':<24}")
+    for name, current in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            print(f"{name:<13} нет в базовой линии")
+            continue
+        p95_delta = current["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0.0
+        tput_delta = current["throughput"] / base["throughput"] - 1 if base["throughput"] else 0.0
+        flag = ""
+        if p95_delta > threshold or tput_delta < -threshold:
+            flag = "  ⚠️  РЕГРЕССИЯ"
+            regressions.append(name)
+        print(f"{name:<13} {base['p95_ms']:>8.2f} → {current['p95_ms']:<8.2f} ({p95_delta:+.0%})  "
+              f"{base['throughput']:>8.0f} → {current['throughput']:<8.0f} ({tput_delta:+.0%}){flag}")
+    return regressions
+
+
+def median_summary(runs: List[Dict[str, float]]) -> Dict[str, float]:
+    """Медиана каждой метрики по повторам: один шумный прогон не даёт ложной регрессии"""
+    return {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+
+async def run(args) -> dict:
+    logging.getLogger().setLevel(logging.WARNING)
+    bench = Benchmark(args.scale, args.seed)
+    selected = bench.scenarios()
+    if args.only:
+        wanted = set(args.only.split(","))
+        selected = {name: fn for name, fn in selected.items() if name in wanted}
+
+    results = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "scale": args.scale,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "max_participants": config.MAX_PARTICIPANTS,
+        },
+        "scenarios": {},
+    }
+
+    print("🚀 БЕНЧМАРК ГОРЯЧЕГО ПУТИ")
+    print("=" * 81)
+    print(f"{'Сценарий':<13} {'Операций':<9} {'оп/сек':<10} {'p50, мс':<9} "
+          f"{'p95, мс':<9} {'p99, мс':<9} {'max, мс':<9}")
+    print("-" * 81)
+    try:
+        for name, scenario in selected.items():
+            summary = median_summary([await scenario() for _ in range(args.repeat)])
+            results["scenarios"][name] = summary
+            print(f"{name:<13} {summary['operations']:<9} {summary['throughput']:<10.0f} "
+                  f"{summary['p50_ms']:<9.3f} {summary['p95_ms']:<9.3f} "
+                  f"{summary['p99_ms']:<9.3f} {summary['max_ms']:<9.3f}")
+        for line in bench.startup_log:
+            print(f"   cold_start: {line}")
+        retry = results["scenarios"].get("retry")
+        retry_wl = results["scenarios"].get("retry_wl")
+        if retry and retry_wl:
+            print(f"   Нажатий «Участвовать» за всплеск: без листа ожидания {retry['operations']:.0f}, "
+                  f"с листом {retry_wl['operations']:.0f} ({retry_wl['operations'] / retry['operations'] - 1:+.0%})")
+        single, several = results["scenarios"].get("workers_1"), results["scenarios"].get("workers_4")
+        if single and several:
+            print(f"   workers: 4 обработчика {several['throughput']:.0f} оп/сек против "
+                  f"{single['throughput']:.0f} у одного "
+                  f"({several['throughput'] / single['throughput'] - 1:+.0%}, ядер: {os.cpu_count()})")
+        for name in ("join", "churn", "recovery"):
+            table = results["scenarios"].get(name)
+            for suffix, title in (("log", "журнал операций"), ("mem", "в памяти")):
+                other = results["scenarios"].get(f"{name}_{suffix}")
+                if table and other:
+                    print(f"   {name}: {title} {other['throughput']:.0f} оп/сек против "
+                          f"{table['throughput']:.0f} в таблицах "
+                          f"({other['throughput'] / table['throughput'] - 1:+.0%})")
+    finally:
+        bench.cleanup()
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", help="сценарии через запятую")
+    parser.add_argument("--scale", type=float, default=1.0, help="множитель числа операций")
+    parser.add_argument("--seed", type=int, default=1, help="зерно случайных сценариев")
+    parser.add_argument("--repeat", type=int, default=3, help="повторов каждого сценария")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="куда записать результаты")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="файл базовой линии")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="записать результаты в файл базовой линии")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="допустимое ухудшение p95 и пропускной способности")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    results = asyncio.run(run(args))
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Результаты: {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"💾 Базовая линия сохранена: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"Базовой линии {args.baseline} нет — сохраните её флагом --save-baseline")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n❌ Регрессии: {', '.join(regressions)}")
+        return 1
+    print("\n✅ Регрессий нет")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
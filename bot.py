@@ -1,32 +1,105 @@
 import asyncio
 import logging
+import os
+import socket
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from aiogram import Bot, Dispatcher, types, F
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, Message
 from aiogram.filters import Command
+from aiogram.filters.callback_data import CallbackData
+from typing import List, Optional, Tuple
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 import config
+from callback_answers import SingleAnswer
+from chat_scheduler import ChatScheduler
 from database import DatabaseManager
+from edit_coalescer import EditCoalescer
+from event_log import EventLogManager
+from leader import LeaderLease
+from metrics import HealthMonitor, JobTracker, MetricsCollector, add_routes, run_metrics_server
+from perf import ApiTimingMiddleware, PerfRecorder, UpdateTimingMiddleware, format_summary
+from promotion_notifier import PromotionNotifier
+from rate_limiter import OutboundScheduler
+from storage import ChatSettings, Participant, create_storage
+from routing import worker_for
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
+# Обработчики логов настраивает точка входа (run.py, logging_setup.py)
 logger = logging.getLogger(__name__)
 
+# Замеры стадий обработки нажатий (см. /perf)
+perf_recorder = PerfRecorder(config.PERF_WINDOW_MINUTES, config.PERF_SLOW_UPDATE_MS / 1000)
+api_timing = ApiTimingMiddleware(perf_recorder)
+# Живость по успешным getUpdates (/healthz, /readyz)
+health = HealthMonitor(config.HEALTH_STALE_AFTER)
+
 # Инициализация бота и диспетчера
-bot = Bot(token=config.BOT_TOKEN)
+# Все исходящие запросы проходят через общую очередь с лимитами Telegram
+outbound = OutboundScheduler(
+    global_rate=config.TELEGRAM_GLOBAL_RATE,
+    chat_rate=config.TELEGRAM_CHAT_RATE,
+    chat_burst=config.TELEGRAM_CHAT_BURST,
+    max_retries=config.TELEGRAM_MAX_RETRIES
+)
+
+def create_session(api_url: Optional[str] = None) -> AiohttpSession:
+    """HTTP-сессия Bot API; api_url позволяет направить бота на локальный сервер"""
+    if api_url:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(api_url))
+    else:
+        session = AiohttpSession()
+    session.middleware(health)
+    # Замер снаружи очереди: в стадии ответа и правки входит ожидание лимитов
+    session.middleware(api_timing)
+    session.middleware(outbound)
+    return session
+
+bot = Bot(token=config.BOT_TOKEN, session=create_session(config.TELEGRAM_API_URL))
 dp = Dispatcher()
-db_manager = DatabaseManager()
+dp.update.outer_middleware(UpdateTimingMiddleware(perf_recorder))
+db_manager = create_storage(recorder=perf_recorder)
 scheduler = AsyncIOScheduler()
+job_tracker = JobTracker(scheduler)
+edit_coalescer = EditCoalescer(bot, config.EDIT_COALESCE_WINDOW)
+single_answer = SingleAnswer(config.CALLBACK_ANSWER_DEADLINE)
+# Переведённые из листа ожидания объявляются одним сообщением за окно
+promotion_notifier = PromotionNotifier(bot, config.WAITLIST_NOTIFY_WINDOW)
+db_manager.on_promoted = promotion_notifier.add
+# Еженедельные списки всех чатов: одна куча моментов запуска вместо задания на чат
+chat_scheduler = ChatScheduler(lambda chat_id: send_weekly_list(chat_id))
+metrics_collector = MetricsCollector(perf_recorder, edit_coalescer, outbound, job_tracker, health,
+                                     chat_scheduler)
 
-def get_next_sunday_date() -> str:
-    """Получение даты ближайшего воскресенья"""
+# События по старым кнопкам "join:<дата>": (chat_id, дата, message_id) -> event_id
+legacy_events: "OrderedDict[tuple, int]" = OrderedDict()
+
+# Номер обработчика в режиме workers (None — единственный процесс) и аренда лидера
+worker_index: Optional[int] = None
+leader: Optional[LeaderLease] = None
+
+# Готовый текст списка по событию: event_id -> (версия состава, дата, текст)
+rendered_lists: "OrderedDict[int, tuple]" = OrderedDict()
+
+WEEKDAYS = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
+
+def owns_chat(chat_id: int) -> bool:
+    """Рассылку чата ведёт один обработчик — тот, кому маршрутизатор отдаёт его сообщения"""
+    return worker_index is None or worker_for(chat_id, config.WORKERS) == worker_index
+
+def get_next_event_date(day: int) -> str:
+    """Дата ближайшего дня недели day (0=понедельник), не считая сегодняшнего"""
     today = datetime.now()
-    days_ahead = config.SCHEDULE_DAY - today.weekday()
-    if days_ahead <= 0:  # Если сегодня воскресенье или прошло
+    days_ahead = day - today.weekday()
+    if days_ahead <= 0:  # Если сегодня этот день или он прошёл
         days_ahead += 7
-    next_sunday = today + timedelta(days=days_ahead)
-    return next_sunday.strftime('%Y-%m-%d')
+    return (today + timedelta(days=days_ahead)).strftime('%Y-%m-%d')
+
+def get_next_sunday_date() -> str:
+    """Получение даты ближайшего воскресенья"""
+    return get_next_event_date(config.SCHEDULE_DAY)
 
 def get_next_monday_date() -> str:
     """Получение даты ближайшего понедельника"""
@@ -37,68 +110,146 @@ def get_next_monday_date() -> str:
     next_monday = today + timedelta(days=days_ahead)
     return next_monday.strftime('%Y-%m-%d')
 
-def format_participants_list(participants: list, event_date: str) -> str:
-    """Форматирование списка участников"""
+def format_name(user_id: int, username: str, first_name: str, last_name: str) -> str:
+    """Имя участника в списке"""
+    name = f"{first_name or ''} {last_name or ''}".strip()
+    if username:
+        return f"@{username}" if not name else f"{name} (@{username})"
+    return name or f"User {user_id}"
+
+def format_participants_list(participants: List[Participant], event_date: str,
+                             capacity: int = config.MAX_PARTICIPANTS,
+                             waiting: List[Participant] = ()) -> str:
+    """Форматирование списка участников и листа ожидания"""
     header = f"📅 Список участников на {event_date}\n"
-    header += f"👥 Мест: {len(participants)}/{config.MAX_PARTICIPANTS}\n\n"
+    header += f"👥 Мест: {len(participants)}/{capacity}\n\n"
     
     if not participants:
         return header + "Список пуст. Нажмите 'Участвовать' чтобы записаться!"
     
     participants_text = ""
-    for i, (user_id, username, first_name, last_name, position) in enumerate(participants, 1):
-        name = f"{first_name or ''} {last_name or ''}".strip()
-        if username:
-            name = f"@{username}" if not name else f"{name} (@{username})"
-        elif not name:
-            name = f"User {user_id}"
-        
-        participants_text += f"{position}. {name}\n"
+    # Номер в списке — порядковый, хранимая последовательность записи может иметь пропуски
+    for position, p in enumerate(participants, 1):
+        participants_text += f"{position}. {format_name(p.user_id, p.username, p.first_name, p.last_name)}\n"
+    
+    if waiting:
+        participants_text += f"\n⏳ Лист ожидания ({len(waiting)}):\n"
+        for p in waiting:
+            participants_text += f"{p.position}. {format_name(p.user_id, p.username, p.first_name, p.last_name)}\n"
     
     return header + participants_text
 
-def get_participation_keyboard(event_date: str) -> InlineKeyboardMarkup:
+class EventCallback(CallbackData, prefix="e1"):
+    """
+    Данные кнопок списка, версия 1: e1:<действие>:<event_id>:<дата>.
+    Идентификатор события избавляет от поиска события по дате при каждом нажатии
+    """
+    action: str
+    event_id: int
+    date: str
+
+def get_participation_keyboard(event_id: int, event_date: str) -> InlineKeyboardMarkup:
     """Создание клавиатуры для участия"""
     return InlineKeyboardMarkup(inline_keyboard=[
         [
             InlineKeyboardButton(
                 text="✅ Участвовать", 
-                callback_data=f"join:{event_date}"
+                callback_data=EventCallback(action="join", event_id=event_id, date=event_date).pack()
             ),
             InlineKeyboardButton(
                 text="❌ Отказаться", 
-                callback_data=f"leave:{event_date}"
+                callback_data=EventCallback(action="leave", event_id=event_id, date=event_date).pack()
             )
         ],
         [
             InlineKeyboardButton(
                 text="🔄 Обновить список", 
-                callback_data=f"refresh:{event_date}"
+                callback_data=EventCallback(action="refresh", event_id=event_id, date=event_date).pack()
             )
         ]
     ])
 
-async def send_weekly_list():
-    """Отправка еженедельного списка"""
+async def resolve_event(callback: CallbackQuery,
+                        callback_data: Optional[EventCallback]) -> Optional[Tuple[int, str]]:
+    """
+    Определение события по нажатой кнопке: (event_id, дата).
+    Старые кнопки "join:<дата>" разрешаются через кэш, база читается только при промахе
+    """
+    if callback_data is not None:
+        return callback_data.event_id, callback_data.date
+    
+    event_date = callback.data.split(":")[1]
+    chat_id = callback.message.chat.id
+    key = (chat_id, event_date, callback.message.message_id)
+    event_id = legacy_events.get(key)
+    if event_id is None:
+        event = await db_manager.get_event_by_date(event_date, chat_id)
+        if event is None:
+            return None
+        event_id = event.id
+        legacy_events[key] = event_id
+        while len(legacy_events) > config.LEGACY_EVENT_CACHE_SIZE:
+            legacy_events.popitem(last=False)
+    else:
+        legacy_events.move_to_end(key)
+    return event_id, event_date
+
+async def render_participants_list(event_id: int, event_date: str) -> str:
+    """Текст списка события; повторно форматируется только после изменения состава"""
+    roster = await db_manager.get_roster(event_id)
+    cached = rendered_lists.get(event_id)
+    if cached and cached[0] == roster.version and cached[1] == event_date:
+        rendered_lists.move_to_end(event_id)
+        return cached[2]
+    
+    with perf_recorder.stage("render"):
+        text = format_participants_list(roster.rows(), event_date, roster.capacity, roster.waiting_rows())
+    rendered_lists[event_id] = (roster.version, event_date, text)
+    rendered_lists.move_to_end(event_id)
+    while len(rendered_lists) > config.ROSTER_CACHE_SIZE:
+        rendered_lists.popitem(last=False)
+    return text
+
+def request_list_update(message: Message, event_id: int, event_date: str):
+    """Запросить обновление сообщения со списком (правки схлопываются)"""
+    async def render():
+        text = await render_participants_list(event_id, event_date)
+        return text, get_participation_keyboard(event_id, event_date)
+    
+    # Текущее содержимое сообщения позволяет пропустить правку без изменений
+    edit_coalescer.seed(message.chat.id, message.message_id, message.text, message.reply_markup)
+    edit_coalescer.request(message.chat.id, message.message_id, render)
+
+async def send_weekly_list(chat_id: int = config.CHAT_ID):
+    """Отправка еженедельного списка в чат по его настройкам"""
     try:
-        event_date = get_next_sunday_date()
+        settings = await db_manager.get_chat(chat_id)
+        if settings is None or not settings.enabled:
+            logger.warning(f"Weekly list skipped: chat {chat_id} is not enabled")
+            return
+        event_date = get_next_event_date(settings.schedule_day)
+        
+        # Создаём событие заранее: его id нужен в кнопках
+        event_id = await db_manager.create_event(
+            event_date, None, chat_id=chat_id, capacity=settings.max_participants
+        )
         
         # Форматируем текст сообщения
-        text = format_participants_list([], event_date)
-        keyboard = get_participation_keyboard(event_date)
+        text = format_participants_list([], event_date, settings.max_participants)
+        keyboard = get_participation_keyboard(event_id, event_date)
         
         # Отправляем сообщение
         message = await bot.send_message(
-            chat_id=config.CHAT_ID,
+            chat_id=chat_id,
             text=text,
             reply_markup=keyboard
         )
         
         # Закрепляем сообщение, если включена эта опция
-        if config.PIN_MESSAGE:
+        if settings.pin_message:
             try:
                 await bot.pin_chat_message(
-                    chat_id=config.CHAT_ID,
+                    chat_id=chat_id,
                     message_id=message.message_id,
                     disable_notification=not config.PIN_NOTIFICATION
                 )
@@ -107,13 +258,48 @@ async def send_weekly_list():
                 logger.warning(f"Failed to pin message: {pin_error}")
                 logger.warning("Bot might not have admin rights to pin messages")
         
-        # Сохраняем событие в базе данных
-        await db_manager.create_event(event_date, message.message_id)
+        # Сохраняем сообщение события в базе данных
+        await db_manager.set_event_message(event_id, message.message_id)
         
-        logger.info(f"Weekly list sent for {event_date}")
+        logger.info(f"Weekly list sent to {chat_id} for {event_date}")
         
     except Exception as e:
-        logger.error(f"Error sending weekly list: {e}")
+        logger.error(f"Error sending weekly list to {chat_id}: {e}")
+
+async def warm_up():
+    """
+    Прогрев после запуска: составы и тексты ещё не прошедших событий готовы
+    до первого нажатия, старые кнопки этих событий разрешаются без чтения базы
+    """
+    # Обработчик прогревает только свои события: чужие нажатия к нему не придут
+    events = [event for event in await db_manager.warm_up(datetime.now().strftime('%Y-%m-%d'))
+              if owns_chat(event.chat_id)]
+    for event in events:
+        if event.message_id is not None:
+            legacy_events[(event.chat_id, event.date, event.message_id)] = event.id
+        await render_participants_list(event.id, event.date)
+    # Отказы "список полон" и "уже записан" выдаются по кэшу составов: сверяем его с базой
+    await reconcile_admission()
+    return len(events)
+
+async def reconcile_admission():
+    """Сверка кэша составов (счётчиков мест и записавшихся) с базой"""
+    try:
+        fixed = await db_manager.reconcile_rosters()
+        if fixed:
+            logger.warning(f"Admission counters reconciled: {fixed} rosters reloaded")
+    except Exception as e:
+        logger.error(f"Error reconciling admission counters: {e}")
+
+async def archive_old_events():
+    """Перенос прошедших событий в архив и сжатие базы"""
+    try:
+        cutoff = (datetime.now() - timedelta(weeks=config.ARCHIVE_AFTER_WEEKS)).strftime('%Y-%m-%d')
+        archived = await db_manager.archive_events(cutoff, config.ARCHIVE_BATCH_SIZE)
+        await db_manager.compact()
+        logger.info(f"Archived {archived} events older than {cutoff}")
+    except Exception as e:
+        logger.error(f"Error archiving events: {e}")
 
 async def keep_alive_ping():
     """Пинг для поддержания соединения с Telegram API"""
@@ -125,141 +311,137 @@ async def keep_alive_ping():
         logger.warning(f"Keep-alive ping failed: {e}")
         # Не критично, продолжаем работу
 
+def add_leader_jobs():
+    """Общие задания: в режиме workers их выполняет только держатель аренды лидера"""
+    # Перенос прошедших событий в архив, пока нажатий нет
+    if config.ARCHIVE_ENABLED:
+        scheduler.add_job(
+            archive_old_events,
+            trigger=CronTrigger(day_of_week=config.ARCHIVE_DAY, hour=config.ARCHIVE_HOUR),
+            id="archive",
+            replace_existing=True
+        )
+    
+    # Пинг getMe необязателен: живость видна по /healthz
+    if config.KEEP_ALIVE:
+        scheduler.add_job(
+            keep_alive_ping,
+            "interval",
+            seconds=config.PING_INTERVAL,
+            id="keep_alive",
+            replace_existing=True
+        )
+        logger.info(f"Keep-alive ping enabled (every {config.PING_INTERVAL}s)")
+
+def remove_leader_jobs():
+    for job_id in ("archive", "keep_alive"):
+        if scheduler.get_job(job_id) is not None:
+            scheduler.remove_job(job_id)
+
+# Кнопки списка в /status: обработчик -> подпись
+BUTTON_LABELS = {
+    "handle_join": "Участвовать",
+    "handle_leave": "Отказаться",
+    "handle_refresh": "Обновить список",
+}
+
+@dp.callback_query(EventCallback.filter(F.action == "join"))
 @dp.callback_query(F.data.startswith("join:"))
-async def handle_join(callback: CallbackQuery):
+@single_answer
+async def handle_join(callback: CallbackQuery, callback_data: Optional[EventCallback] = None):
     """Обработка записи на участие"""
-    try:
-        # Отвечаем на callback быстро для предотвращения таймаута
-        await callback.answer("Обрабатываем запрос...")
+    if not callback.data or not callback.message:
+        return "Ошибка данных", True
         
-        if not callback.data or not callback.message:
-            await callback.answer("Ошибка данных", show_alert=True)
-            return
-            
-        event_date = callback.data.split(":")[1]
-        user = callback.from_user
-        
-        # Получаем событие из базы данных
-        event = await db_manager.get_event_by_date(event_date)
-        if not event:
-            await callback.answer("Событие не найдено", show_alert=True)
-            return
-        
-        event_id = event[0]
-        
-        # Добавляем участника
-        success, position = await db_manager.add_participant(
+    user = callback.from_user
+    
+    # Определяем событие по кнопке
+    event = await resolve_event(callback, callback_data)
+    if not event:
+        return "Событие не найдено", True
+    
+    event_id, event_date = event
+    
+    # Добавляем участника
+    success, position = await db_manager.add_participant(
+        event_id=event_id,
+        user_id=user.id,
+        username=user.username or "",
+        first_name=user.first_name or "",
+        last_name=user.last_name or ""
+    )
+    
+    if success:
+        # Обновляем сообщение
+        request_list_update(callback.message, event_id, event_date)
+        return f"Вы записаны под номером {position}!", False
+    elif position == -1:
+        if not config.WAITLIST_ENABLED:
+            return "Список полон!", True
+        # Вместо повторных нажатий в надежде на место — очередь с автоматическим переводом
+        joined, place = await db_manager.wait_for_seat(
             event_id=event_id,
             user_id=user.id,
             username=user.username or "",
             first_name=user.first_name or "",
             last_name=user.last_name or ""
         )
-        
-        if success:
-            # Получаем обновленный список участников
-            participants = await db_manager.get_participants(event_id)
-            
-            # Обновляем сообщение
-            text = format_participants_list(participants, event_date)
-            keyboard = get_participation_keyboard(event_date)
-            
-            await callback.message.edit_text(
-                text=text,
-                reply_markup=keyboard
-            )
-            
-            await callback.answer(f"Вы записаны под номером {position}!")
-            
-        elif position == -1:
-            await callback.answer("Список полон!", show_alert=True)
-        else:
-            await callback.answer(f"Вы уже записаны под номером {position}")
-            
-    except Exception as e:
-        logger.error(f"Error in handle_join: {e}")
-        await callback.answer("Произошла ошибка", show_alert=True)
+        if joined:
+            request_list_update(callback.message, event_id, event_date)
+            return f"Вы записаны под номером {place}!", False
+        if not place:
+            return "Список полон!", True
+        request_list_update(callback.message, event_id, event_date)
+        return (f"Список полон. Вы в листе ожидания под номером {place} — "
+                f"при освобождении места вы будете записаны автоматически"), True
+    else:
+        return f"Вы уже записаны под номером {position}", False
 
+@dp.callback_query(EventCallback.filter(F.action == "leave"))
 @dp.callback_query(F.data.startswith("leave:"))
-async def handle_leave(callback: CallbackQuery):
+@single_answer
+async def handle_leave(callback: CallbackQuery, callback_data: Optional[EventCallback] = None):
     """Обработка отказа от участия"""
-    try:
-        await callback.answer("Обрабатываем запрос...")
-        
-        if not callback.data or not callback.message:
-            await callback.answer("Ошибка данных", show_alert=True)
-            return
-            
-        event_date = callback.data.split(":")[1]
-        user = callback.from_user
-        
-        # Получаем событие из базы данных
-        event = await db_manager.get_event_by_date(event_date)
-        if not event:
-            await callback.answer("Событие не найдено", show_alert=True)
-            return
-        
-        event_id = event[0]
-        
-        # Удаляем участника
-        success = await db_manager.remove_participant(event_id, user.id)
+    if not callback.data or not callback.message:
+        return "Ошибка данных", True
         
-        if success:
-            # Получаем обновленный список участников
-            participants = await db_manager.get_participants(event_id)
-            
-            # Обновляем сообщение
-            text = format_participants_list(participants, event_date)
-            keyboard = get_participation_keyboard(event_date)
-            
-            await callback.message.edit_text(
-                text=text,
-                reply_markup=keyboard
-            )
-            
-            await callback.answer("Вы удалены из списка!")
-        else:
-            await callback.answer("Вас нет в списке")
-            
-    except Exception as e:
-        logger.error(f"Error in handle_leave: {e}")
-        await callback.answer("Произошла ошибка", show_alert=True)
+    user = callback.from_user
+    
+    # Определяем событие по кнопке
+    event = await resolve_event(callback, callback_data)
+    if not event:
+        return "Событие не найдено", True
+    
+    event_id, event_date = event
+    
+    # Удаляем участника
+    success = await db_manager.remove_participant(event_id, user.id)
+    
+    if success:
+        # Обновляем сообщение
+        request_list_update(callback.message, event_id, event_date)
+        return "Вы удалены из списка!", False
+    else:
+        return "Вас нет в списке", False
 
+@dp.callback_query(EventCallback.filter(F.action == "refresh"))
 @dp.callback_query(F.data.startswith("refresh:"))
-async def handle_refresh(callback: CallbackQuery):
+@single_answer
+async def handle_refresh(callback: CallbackQuery, callback_data: Optional[EventCallback] = None):
     """Обработка обновления списка"""
-    try:
-        await callback.answer("Обновляем список...")
-        
-        if not callback.data or not callback.message:
-            await callback.answer("Ошибка данных", show_alert=True)
-            return
-            
-        event_date = callback.data.split(":")[1]
-        
-        # Получаем событие из базы данных
-        event = await db_manager.get_event_by_date(event_date)
-        if not event:
-            await callback.answer("Событие не найдено", show_alert=True)
-            return
+    if not callback.data or not callback.message:
+        return "Ошибка данных", True
         
-        event_id = event[0]
-        
-        # Получаем список участников
-        participants = await db_manager.get_participants(event_id)
-        
-        # Обновляем сообщение
-        text = format_participants_list(participants, event_date)
-        keyboard = get_participation_keyboard(event_date)
-        
-        await callback.message.edit_text(
-            text=text,
-            reply_markup=keyboard
-        )
-        
-    except Exception as e:
-        logger.error(f"Error in handle_refresh: {e}")
-        await callback.answer("Произошла ошибка", show_alert=True)
+    # Определяем событие по кнопке
+    event = await resolve_event(callback, callback_data)
+    if not event:
+        return "Событие не найдено", True
+    
+    event_id, event_date = event
+    
+    # Обновляем сообщение
+    request_list_update(callback.message, event_id, event_date)
+    return "Список обновлён", False
 
 @dp.message(Command("start"))
 async def cmd_start(message: types.Message):
@@ -269,14 +451,20 @@ async def cmd_start(message: types.Message):
 @dp.message(Command("test"))
 async def cmd_test(message: types.Message):
     """Тестовая команда для отправки списка на понедельник"""
-    if message.chat.id == config.CHAT_ID:
+    settings = await db_manager.get_chat(message.chat.id)
+    if settings is not None:
         try:
             # Используем дату понедельника для тестового списка
             event_date = get_next_monday_date()
             
+            # Создаём событие заранее: его id нужен в кнопках
+            event_id = await db_manager.create_event(
+                event_date, None, chat_id=message.chat.id, capacity=settings.max_participants
+            )
+            
             # Форматируем текст сообщения
-            text = format_participants_list([], event_date)
-            keyboard = get_participation_keyboard(event_date)
+            text = format_participants_list([], event_date, settings.max_participants)
+            keyboard = get_participation_keyboard(event_id, event_date)
             
             # Отправляем сообщение
             test_message = await message.answer(
@@ -285,10 +473,10 @@ async def cmd_test(message: types.Message):
             )
             
             # Закрепляем сообщение, если включена эта опция
-            if config.PIN_MESSAGE:
+            if settings.pin_message:
                 try:
                     await bot.pin_chat_message(
-                        chat_id=config.CHAT_ID,
+                        chat_id=message.chat.id,
                         message_id=test_message.message_id,
                         disable_notification=not config.PIN_NOTIFICATION
                     )
@@ -296,8 +484,8 @@ async def cmd_test(message: types.Message):
                 except Exception as pin_error:
                     logger.warning(f"Failed to pin test message: {pin_error}")
             
-            # Сохраняем событие в базе данных
-            await db_manager.create_event(event_date, test_message.message_id)
+            # Сохраняем сообщение события в базе данных
+            await db_manager.set_event_message(event_id, test_message.message_id)
             
             await message.answer("✅ Тестовый список на понедельник отправлен!")
             
@@ -306,10 +494,9 @@ async def cmd_test(message: types.Message):
             await message.answer("❌ Ошибка при отправке тестового списка")
     else:
         await message.answer(
-            f"❌ Команда работает только в настроенном чате!\n"
-            f"Текущий чат: {message.chat.id}\n"
-            f"Настроенный чат: {config.CHAT_ID}\n\n"
-            f"Для тестирования используйте бота в чате {config.CHAT_ID}"
+            f"❌ Команда работает только в подключённом чате!\n"
+            f"Текущий чат: {message.chat.id}\n\n"
+            f"Администратор чата подключает его командой /schedule"
         )
 
 @dp.message(Command("status"))
@@ -328,13 +515,190 @@ async def cmd_status(message: types.Message):
         if config.KEEP_ALIVE:
             status_text += f"⚡ Пинг каждые: {config.PING_INTERVAL} сек\n"
         
-        status_text += f"\n📅 Следующая отправка: Воскресенье, {config.SCHEDULE_HOUR}:00"
+        edits = edit_coalescer.stats()
+        status_text += (
+            f"✏️ Правки списка: отправлено {edits['sent']}, "
+            f"схлопнуто {edits['saved']}, без изменений {edits['unchanged']}\n"
+        )
+        queue = outbound.stats()
+        status_text += (
+            f"📤 Очередь API: {queue['queue_depth']}, "
+            f"ожидание правок до {queue['wait_max']['edit']:.1f} сек, RetryAfter: {queue['retry_after']}\n"
+        )
+        rejects = db_manager.fast_rejects
+        status_text += f"🚪 Отказы без базы: полон {rejects['full']}, уже записан {rejects['joined']}\n"
+        if isinstance(db_manager, EventLogManager):
+            status_text += (
+                f"📜 Журнал операций: вставок {db_manager.log_writes}, снимков {db_manager.snapshots}\n"
+            )
+        promotions = promotion_notifier.stats()
+        status_text += (
+            f"⏳ Из листа ожидания в список: {promotions['promoted']}, "
+            f"уведомлений {promotions['sent']}\n"
+        )
+        for handler, answers in single_answer.stats.items():
+            # Имена функций (handle_join) ломают разметку Markdown символом "_"
+            label = BUTTON_LABELS.get(handler, handler.replace("_", " "))
+            status_text += (
+                f"💬 {label}: сразу {answers['final']}, "
+                f"с подтверждением {answers['early']}, ошибок {answers['error']}\n"
+            )
+        
+        next_run = chat_scheduler.next_run(message.chat.id)
+        if next_run is not None:
+            status_text += f"\n📅 Следующая отправка: {WEEKDAYS[next_run.weekday()]}, {next_run:%d.%m %H:%M}"
+        else:
+            status_text += "\n📅 Рассылка в этот чат не настроена"
+        status_text += f"\n💬 Чатов с рассылкой: {chat_scheduler.stats()['chats']}"
+        if worker_index is not None:
+            status_text += (
+                f"\n🧩 Обработчик {worker_index + 1} из {config.WORKERS}, "
+                f"лидер: {'да' if leader is not None and leader.held else 'нет'}"
+            )
+        if isinstance(db_manager, DatabaseManager):
+            status_text += f"\n🔒 Повторов при занятой базе: {db_manager.busy_retries}"
         
         await message.answer(status_text, parse_mode="Markdown")
         
     except Exception as e:
         await message.answer(f"❌ Ошибка получения статуса: {e}")
 
+async def is_admin(message: types.Message) -> bool:
+    """
+    Служебные команды: администраторы из ADMIN_IDS, а без них — администраторы
+    настроенного чата (не все его участники)
+    """
+    if config.ADMIN_IDS:
+        return message.from_user is not None and message.from_user.id in config.ADMIN_IDS
+    return message.chat.id == config.CHAT_ID and await is_chat_admin(message)
+
+@dp.message(Command("perf"))
+async def cmd_perf(message: types.Message):
+    """Сводка по стадиям обработки за последние N минут: /perf [минуты]"""
+    if not await is_admin(message):
+        await message.answer("❌ Команда доступна только администраторам")
+        return
+    
+    minutes = config.PERF_SUMMARY_MINUTES
+    parts = (message.text or "").split()
+    if len(parts) > 1 and parts[1].isdigit():
+        minutes = max(1, min(int(parts[1]), config.PERF_WINDOW_MINUTES))
+    
+    await message.answer("\n".join(format_summary(perf_recorder, minutes)))
+
+@dp.message(Command("history"))
+async def cmd_history(message: types.Message):
+    """Последние события вместе с архивными: /history [количество]"""
+    if not await is_admin(message):
+        await message.answer("❌ Команда доступна только администраторам")
+        return
+    
+    limit = 10
+    parts = (message.text or "").split()
+    if len(parts) > 1 and parts[1].isdigit():
+        limit = max(1, min(int(parts[1]), 50))
+    
+    # В подключённом чате — его события, в остальных (личка администратора) — все
+    chat_id = message.chat.id if await db_manager.get_chat(message.chat.id) else None
+    events = await db_manager.get_event_history(limit, chat_id)
+    if not events:
+        await message.answer("📜 Событий пока нет")
+        return
+    lines = [f"📜 Последние события ({len(events)}):"]
+    for _, event_date, count, capacity, archived in events:
+        lines.append(f"{event_date}: {count}/{capacity}{' 🗄' if archived else ''}")
+    await message.answer("\n".join(lines))
+
+async def is_chat_admin(message: types.Message) -> bool:
+    """Настройки чата меняют администраторы из ADMIN_IDS и администраторы самого чата"""
+    if message.from_user is None:
+        return False
+    if message.from_user.id in config.ADMIN_IDS:
+        return True
+    try:
+        member = await bot.get_chat_member(message.chat.id, message.from_user.id)
+    except Exception as e:
+        logger.warning(f"Failed to check admin rights in {message.chat.id}: {e}")
+        return False
+    return member.status in ("creator", "administrator")
+
+def format_chat_settings(settings: ChatSettings) -> str:
+    schedule = (f"{WEEKDAYS[settings.schedule_day]}, "
+                f"{settings.schedule_hour:02d}:{settings.schedule_minute:02d}")
+    return (
+        f"⚙️ Настройки чата\n"
+        f"📅 Рассылка: {schedule if settings.enabled else 'выключена'}\n"
+        f"👥 Мест: {settings.max_participants}\n"
+        f"📌 Закрепление: {'да' if settings.pin_message else 'нет'}"
+    )
+
+async def default_chat_settings(chat_id: int) -> ChatSettings:
+    """Текущие настройки чата или значения из config для нового"""
+    settings = await db_manager.get_chat(chat_id)
+    if settings is None:
+        settings = ChatSettings(chat_id, config.SCHEDULE_DAY, config.SCHEDULE_HOUR,
+                                config.SCHEDULE_MINUTE, config.MAX_PARTICIPANTS,
+                                config.PIN_MESSAGE, True)
+    return settings
+
+async def apply_chat_settings(message: types.Message, settings: ChatSettings):
+    """Сохранение настроек; новое расписание действует сразу, без перезапуска"""
+    await db_manager.save_chat(settings)
+    chat_scheduler.schedule(settings)
+    logger.info(f"Chat {settings.chat_id} settings updated: {settings}")
+    await message.answer(format_chat_settings(settings))
+
+@dp.message(Command("chat"))
+async def cmd_chat(message: types.Message):
+    """Настройки текущего чата"""
+    settings = await db_manager.get_chat(message.chat.id)
+    if settings is None:
+        await message.answer("Чат не подключён. Администратор подключает его командой /schedule")
+        return
+    await message.answer(format_chat_settings(settings))
+
+@dp.message(Command("schedule"))
+async def cmd_schedule(message: types.Message):
+    """Расписание рассылки: /schedule <день 0-6> <ЧЧ:ММ> или /schedule off"""
+    if not await is_chat_admin(message):
+        await message.answer("❌ Команда доступна только администраторам чата")
+        return
+    
+    parts = (message.text or "").split()
+    settings = await default_chat_settings(message.chat.id)
+    if len(parts) == 2 and parts[1] == "off":
+        await apply_chat_settings(message, settings._replace(enabled=False))
+        return
+    
+    try:
+        day = int(parts[1])
+        hour, minute = (int(value) for value in parts[2].split(":"))
+        if not (0 <= day <= 6 and 0 <= hour <= 23 and 0 <= minute <= 59):
+            raise ValueError
+    except (IndexError, ValueError):
+        await message.answer(
+            "Использование: /schedule <день 0-6> <ЧЧ:ММ>, где 0 — понедельник, 6 — воскресенье\n"
+            "Выключить рассылку: /schedule off"
+        )
+        return
+    await apply_chat_settings(message, settings._replace(
+        schedule_day=day, schedule_hour=hour, schedule_minute=minute, enabled=True
+    ))
+
+@dp.message(Command("capacity"))
+async def cmd_capacity(message: types.Message):
+    """Лимит участников: /capacity <N>; действует и для ещё не прошедших событий"""
+    if not await is_chat_admin(message):
+        await message.answer("❌ Команда доступна только администраторам чата")
+        return
+    
+    parts = (message.text or "").split()
+    if len(parts) != 2 or not parts[1].isdigit() or not 1 <= int(parts[1]) <= 200:
+        await message.answer("Использование: /capacity <число мест от 1 до 200>")
+        return
+    settings = await default_chat_settings(message.chat.id)
+    await apply_chat_settings(message, settings._replace(max_participants=int(parts[1])))
+
 @dp.message(Command("ping"))  
 async def cmd_ping(message: types.Message):
     """Ручной пинг для проверки связи"""
@@ -344,40 +708,112 @@ async def cmd_ping(message: types.Message):
     except Exception as e:
         await message.answer(f"❌ Ошибка пинга: {e}")
 
-async def main():
-    """Главная функция"""
+async def main(mode: Optional[str] = None):
+    """
+    Главная функция; mode — "polling" или "webhook" (по умолчанию из config),
+    "worker" — обработчик WORKER_INDEX за маршрутизатором (см. workers.py)
+    """
+    global worker_index, leader
+    mode = mode or config.RUN_MODE
+    if mode == "worker":
+        worker_index = config.WORKER_INDEX
+    startup = perf_recorder.startup
+    # Всё до входа в main: запуск интерпретатора и импорты
+    startup.mark("imports")
+    
     # Инициализация базы данных
     await db_manager.init_database()
+    startup.mark("database")
     
-    # Настройка планировщика
-    scheduler.add_job(
-        send_weekly_list,
-        trigger=CronTrigger(
-            day_of_week=config.SCHEDULE_DAY,
-            hour=config.SCHEDULE_HOUR,
-            minute=config.SCHEDULE_MINUTE
-        ),
-        id="weekly_list",
-        replace_existing=True
-    )
-    
-    # Добавляем пинг для поддержания соединения
-    if config.KEEP_ALIVE:
+    try:
+        # Первые нажатия после перезапуска не ждут холодных чтений и форматирования
+        warmed = await warm_up()
+        startup.mark("warm_up")
+        logger.info(f"Warmed up {warmed} upcoming events")
+        
+        # Еженедельные списки по расписаниям чатов из базы
+        chats = await db_manager.get_chats()
+        for settings in chats:
+            if owns_chat(settings.chat_id):
+                chat_scheduler.schedule(settings)
+        chat_scheduler.start()
+        logger.info(f"Chat scheduler started for {chat_scheduler.stats()['chats']} of {len(chats)} chats")
+        
+        # Кэш составов сверяется с базой и в работе: её мог изменить другой процесс
         scheduler.add_job(
-            keep_alive_ping,
+            reconcile_admission,
             "interval",
-            seconds=config.PING_INTERVAL,
-            id="keep_alive",
+            minutes=config.ADMISSION_RECONCILE_MINUTES,
+            id="reconcile_admission",
             replace_existing=True
         )
-        logger.info(f"Keep-alive ping enabled (every {config.PING_INTERVAL}s)")
+        
+        if mode == "worker":
+            # Аренда в общей базе: задания добавляются при захвате и снимаются при потере
+            leader = LeaderLease(db_manager, "scheduler", f"{socket.gethostname()}:{os.getpid()}",
+                                 config.LEADER_LEASE_SECONDS, add_leader_jobs, remove_leader_jobs)
+            await leader.start()
+        else:
+            add_leader_jobs()
+        
+        scheduler.start()
+        logger.info("Scheduler started")
+        startup.mark("scheduler")
+    except BaseException:
+        # Потоки соединений базы не дали бы процессу завершиться после ошибки запуска
+        await db_manager.close()
+        raise
     
-    scheduler.start()
-    logger.info("Scheduler started")
+    # Готовность: база открыта; в режиме polling нужен ещё первый успешный getUpdates
+    health.polling = mode == "polling"
+    health.ready = True
     
     # Запуск бота
-    logger.info("Bot starting...")
-    await dp.start_polling(bot)
+    logger.info(f"Bot starting in {mode} mode...")
+    metrics_runner = None
+    try:
+        if mode in ("webhook", "worker"):
+            from webhook import run_webhook
+            # Обработчик принимает обновления от маршрутизатора на локальном порту;
+            # webhook на адрес маршрутизатора регистрирует обработчик 0
+            await run_webhook(
+                dp, bot,
+                base_url=config.WEBHOOK_BASE_URL,
+                path=config.WEBHOOK_PATH,
+                secret=config.WEBHOOK_SECRET,
+                host="127.0.0.1" if mode == "worker" else config.WEBHOOK_HOST,
+                port=config.WORKER_BASE_PORT + worker_index if mode == "worker" else config.WEBHOOK_PORT,
+                max_concurrency=config.WEBHOOK_MAX_CONCURRENCY,
+                setup=(lambda app: add_routes(app, metrics_collector)) if config.METRICS_ENABLED else None,
+                on_started=startup.finish,
+                register=worker_index in (None, 0)
+            )
+        else:
+            if config.METRICS_ENABLED:
+                metrics_runner = await run_metrics_server(
+                    metrics_collector, config.METRICS_HOST, config.METRICS_PORT
+                )
+                logger.info(f"Metrics server listening on {config.METRICS_HOST}:{config.METRICS_PORT}")
+            # Если раньше работал webhook, getUpdates без его снятия не отвечает
+            await bot.delete_webhook(drop_pending_updates=False)
+            startup.mark("telegram")
+            startup.finish()
+            await dp.start_polling(bot)
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        if leader is not None:
+            await leader.stop()
+        scheduler.shutdown(wait=False)
+        await chat_scheduler.stop()
+        await edit_coalescer.close()
+        await promotion_notifier.close()
+        await db_manager.close()
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    from logging_setup import setup_logging, stop_logging
+    listener = setup_logging()
+    try:
+        asyncio.run(main())
+    finally:
+        stop_logging(listener) 
\ No newline at end of file
@@ -0,0 +1,61 @@
+import asyncio
+import functools
+import logging
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Tuple
+from aiogram.types import CallbackQuery
+
+logger = logging.getLogger(__name__)
+
+# Обработчик нажатия возвращает текст ответа и признак всплывающего окна
+AnswerHandler = Callable[..., Awaitable[Tuple[str, bool]]]
+
+
+class SingleAnswer:
+    """
+    Ровно один answerCallbackQuery на нажатие.
+    Если обработка укладывается в срок, пользователь сразу получает итоговый ответ;
+    иначе отправляется раннее подтверждение, а обработка продолжается в фоне
+    """
+
+    def __init__(self, deadline: float, ack_text: str = "Обрабатываем запрос..."):
+        self.deadline = deadline
+        self.ack_text = ack_text
+        # handler -> {"final": .., "early": .., "error": ..}
+        self.stats: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"final": 0, "early": 0, "error": 0}
+        )
+
+    def __call__(self, handler: AnswerHandler):
+        name = handler.__name__
+
+        @functools.wraps(handler)
+        async def wrapper(callback: CallbackQuery, *args, **kwargs):
+            task = asyncio.create_task(handler(callback, *args, **kwargs))
+            try:
+                text, show_alert = await asyncio.wait_for(asyncio.shield(task), self.deadline)
+            except asyncio.TimeoutError:
+                # Долгая обработка: подтверждаем нажатие и дожидаемся результата
+                self.stats[name]["early"] += 1
+                await self._answer(callback, self.ack_text)
+                try:
+                    await task
+                except Exception as e:
+                    logger.error(f"Error in {name}: {e}")
+                return
+            except Exception as e:
+                self.stats[name]["error"] += 1
+                logger.error(f"Error in {name}: {e}")
+                await self._answer(callback, "Произошла ошибка", show_alert=True)
+                return
+
+            self.stats[name]["final"] += 1
+            await self._answer(callback, text, show_alert=show_alert)
+
+        return wrapper
+
+    async def _answer(self, callback: CallbackQuery, text: str, show_alert: bool = False):
+        try:
+            await callback.answer(text, show_alert=show_alert)
+        except Exception as e:
+            logger.warning(f"Failed to answer callback {callback.id}: {e}")
@@ -0,0 +1,141 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from storage import ChatSettings
+
+logger = logging.getLogger(__name__)
+
+
+def next_fire_time(day: int, hour: int, minute: int, after: datetime) -> datetime:
+    """Ближайший момент строго позже after с днём недели day (0=понедельник) и временем hour:minute"""
+    candidate = after.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    candidate += timedelta(days=(day - after.weekday()) % 7)
+    if candidate <= after:
+        candidate += timedelta(days=7)
+    return candidate
+
+
+class ChatScheduler:
+    """
+    Еженедельная рассылка списков во все подключённые чаты.
+    Вместо задания планировщика на каждый чат — одна min-куча моментов запуска
+    и одна задача, которая спит до ближайшего из них. Изменённое расписание
+    кладётся в кучу заново, старая запись пропускается при извлечении
+    """
+
+    def __init__(self, callback: Callable[[int], Awaitable], max_sleep: float = 60.0):
+        self.callback = callback
+        # Сон ограничен: перевод системных часов учитывается не позже чем через max_sleep
+        self.max_sleep = max_sleep
+        # (время запуска, порядковый номер, chat_id); номер разрешает равенство времени
+        self._heap: List[Tuple[float, int, int]] = []
+        self._counter = itertools.count()
+        # Действующие время запуска и настройки по чатам; записи кучи с другим временем устарели
+        self._due: Dict[int, float] = {}
+        self._settings: Dict[int, ChatSettings] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+        # Метрики
+        self.fired = 0
+        self.errors = 0
+
+    def schedule(self, settings: ChatSettings):
+        """Запланировать рассылку по настройкам чата (или снять, если чат отключён)"""
+        if not settings.enabled:
+            self.unschedule(settings.chat_id)
+            return
+        due = next_fire_time(settings.schedule_day, settings.schedule_hour,
+                             settings.schedule_minute, datetime.now()).timestamp()
+        self._settings[settings.chat_id] = settings
+        self._push(settings.chat_id, due)
+
+    def unschedule(self, chat_id: int):
+        self._settings.pop(chat_id, None)
+        if self._due.pop(chat_id, None) is not None:
+            self._wakeup.set()
+
+    def next_run(self, chat_id: int) -> Optional[datetime]:
+        due = self._due.get(chat_id)
+        return datetime.fromtimestamp(due) if due is not None else None
+
+    def _push(self, chat_id: int, due: float):
+        self._due[chat_id] = due
+        heapq.heappush(self._heap, (due, next(self._counter), chat_id))
+        # Частые правки расписания не дают куче разрастись устаревшими записями
+        if len(self._heap) > 2 * len(self._due) + 64:
+            self._heap = [(ts, seq, chat) for ts, seq, chat in self._heap if self._due.get(chat) == ts]
+            heapq.heapify(self._heap)
+        # Новый запуск может оказаться раньше того, до которого спит цикл
+        self._wakeup.set()
+
+    def _peek(self) -> Optional[Tuple[float, int]]:
+        """Ближайший действующий запуск: (время, chat_id)"""
+        while self._heap:
+            due, _, chat_id = self._heap[0]
+            if self._due.get(chat_id) == due:
+                return due, chat_id
+            heapq.heappop(self._heap)
+        return None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        tasks = list(self._running)
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            head = self._peek()
+            if head is None:
+                await self._wakeup.wait()
+                continue
+
+            due, chat_id = head
+            delay = due - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), min(delay, self.max_sleep))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._heap)
+            settings = self._settings[chat_id]
+            # Следующий запуск считается от текущего: пропущенные недели не догоняются
+            self._push(chat_id, next_fire_time(
+                settings.schedule_day, settings.schedule_hour, settings.schedule_minute,
+                max(datetime.now(), datetime.fromtimestamp(due))
+            ).timestamp())
+            self.fired += 1
+            task = asyncio.create_task(self.callback(chat_id))
+            self._running.add(task)
+            task.add_done_callback(self._finished)
+
+    def _finished(self, task: asyncio.Task):
+        self._running.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+            logger.error(f"Scheduled list failed: {task.exception()}")
+
+    def stats(self) -> Dict[str, float]:
+        head = self._peek()
+        return {
+            "chats": len(self._due),
+            "fired": self.fired,
+            "errors": self.errors,
+            "running": len(self._running),
+            "next_due": head[0] if head else 0.0,
+        }
@@ -6,6 +6,23 @@ load_dotenv()
 # Telegram Bot Configuration
 BOT_TOKEN = os.getenv("BOT_TOKEN", "7728088084:AAHHm-uhMuSg1IWc4eiS8OAhZiF3eUEDA4E")
 CHAT_ID = int(os.getenv("CHAT_ID", "-1001755175377"))
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")  # Свой адрес Bot API, например локальный fake_telegram.py
+
+# Run Mode Configuration
+RUN_MODE = os.getenv("RUN_MODE", "polling")  # "polling", "webhook" или "workers"
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")  # Публичный адрес, например https://bot.onrender.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # Секрет из заголовка X-Telegram-Bot-Api-Secret-Token; обязателен для webhook и workers
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("PORT", "8080"))
+WEBHOOK_MAX_CONCURRENCY = 64  # Сколько обновлений обрабатывать одновременно
+
+# Workers Configuration (RUN_MODE=workers: webhook принимает маршрутизатор, обработка — в процессах-обработчиках)
+WORKERS = int(os.getenv("WORKERS", str(os.cpu_count() or 1)))  # Число процессов-обработчиков
+WORKER_BASE_PORT = int(os.getenv("WORKER_BASE_PORT", "8100"))  # Обработчик i слушает 127.0.0.1:WORKER_BASE_PORT+i
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", "0"))  # Номер обработчика; задаёт маршрутизатор при запуске
+WORKER_START_TIMEOUT = 60  # Сколько ждать, пока обработчик начнёт принимать обновления
+LEADER_LEASE_SECONDS = 30  # Срок аренды лидерства: задания APScheduler выполняет только её держатель
 
 # Event Configuration
 MAX_PARTICIPANTS = 18
@@ -17,9 +34,70 @@ SCHEDULE_DAY = 6  # Sunday (0=Monday, 6=Sunday)
 PIN_MESSAGE = True  # Закреплять ли сообщение со списком
 PIN_NOTIFICATION = False  # Показывать ли уведомление о закреплении
 
+# Telegram API Limits
+TELEGRAM_GLOBAL_RATE = 30  # Запросов в секунду на весь бот
+TELEGRAM_CHAT_RATE = 20 / 60  # Сообщений и правок в секунду на один групповой чат
+TELEGRAM_CHAT_BURST = 5  # Сколько запросов в чат можно отправить подряд без ожидания
+TELEGRAM_MAX_RETRIES = 3  # Повторов после RetryAfter
+
 # Keep Alive Configuration
-KEEP_ALIVE = True  # Включить пинг каждую минуту для поддержания соединения
+# Живость теперь видна по /healthz; пинг getMe нужен только хостингам, которые его требуют
+KEEP_ALIVE = os.getenv("KEEP_ALIVE", "false").lower() == "true"  # Пинг getMe каждые PING_INTERVAL секунд
 PING_INTERVAL = 60  # Интервал пинга в секундах (60 = 1 минута)
 
+# Metrics & Health Configuration
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"  # /metrics, /healthz, /readyz
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.getenv("METRICS_PORT", os.getenv("PORT", "8080")))  # В режиме webhook — порт webhook-сервера
+HEALTH_STALE_AFTER = 90  # Секунд без успешного getUpdates, после которых бот считается неживым
+
 # Database Configuration
-DATABASE_PATH = "participants.db"  
\ No newline at end of file
+DATABASE_PATH = os.getenv("DATABASE_PATH", "participants.db")  # На Render — путь на постоянном диске
+DB_READ_POOL_SIZE = 4  # Количество соединений для чтения
+DB_BUSY_TIMEOUT_MS = 5000  # Ожидание блокировки базы в миллисекундах
+DB_BUSY_RETRIES = 3  # Повторов захвата блокировки записи после истечения busy_timeout
+DB_BUSY_RETRY_DELAY = 0.1  # Пауза перед первым повтором (сек), дальше удваивается
+DB_SYNCHRONOUS = "NORMAL"  # В режиме WAL NORMAL безопасен и не делает fsync на каждый коммит
+DB_CACHE_SIZE_KB = 16384  # Размер кэша страниц на соединение (16 МБ)
+DB_MMAP_SIZE = 64 * 1024 * 1024  # Размер memory-mapped области (64 МБ)
+ROSTER_CACHE_SIZE = 32  # Сколько составов событий держать в памяти
+ADMISSION_RECONCILE_MINUTES = 10  # Как часто сверять кэш составов (отказы без базы) с базой
+DB_BATCH_WRITES = os.getenv("DB_BATCH_WRITES", "false").lower() == "true"  # Групповая фиксация записей
+DB_BATCH_WINDOW_MS = 2  # Сколько ждать попутных операций перед фиксацией пачки
+DB_BATCH_MAX_SIZE = 100  # Максимальный размер пачки
+DB_STORAGE = os.getenv("DB_STORAGE", "table")  # "table" — составы в таблицах, "log" — журнал операций со снимками, "memory" — в памяти
+EVENT_LOG_SNAPSHOT_EVERY = 200  # Операций события в журнале между снимками его состава
+MEMORY_SNAPSHOT_PATH = os.getenv("MEMORY_SNAPSHOT_PATH", "")  # Снимок хранилища в памяти; пусто — <база>.json рядом с DATABASE_PATH
+MEMORY_SNAPSHOT_SECONDS = 30  # Как часто сохранять снимок хранилища в памяти
+
+# Archive Configuration
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "true").lower() == "true"  # Еженедельный перенос старых событий
+ARCHIVE_DATABASE_PATH = os.getenv("ARCHIVE_DATABASE_PATH", "")  # Пусто — <база>_archive.db рядом с основной
+ARCHIVE_AFTER_WEEKS = 8  # События старше стольких недель переносятся в архив
+ARCHIVE_BATCH_SIZE = 50  # Событий в одной транзакции переноса
+ARCHIVE_DAY = 0  # День запуска архивации (0=Monday)
+ARCHIVE_HOUR = 4  # Час запуска архивации, когда нажатий нет
+
+# Waitlist Configuration
+WAITLIST_ENABLED = os.getenv("WAITLIST_ENABLED", "true").lower() == "true"  # Очередь вместо отказа "Список полон!"
+WAITLIST_MAX = 20  # Сколько человек может стоять в очереди на событие
+WAITLIST_NOTIFY_WINDOW = 2.0  # Переводы в список за это окно (сек) объявляются одним сообщением
+
+# Message Edit Configuration
+EDIT_COALESCE_WINDOW = 1.0  # Окно схлопывания правок одного сообщения в секундах
+CALLBACK_ANSWER_DEADLINE = 2.0  # Сколько ждать итогового ответа на нажатие, прежде чем подтвердить его заранее
+LEGACY_EVENT_CACHE_SIZE = 256  # Сколько сообщений со старыми кнопками помнить
+
+# Logging Configuration
+LOG_FILE = os.getenv("LOG_FILE", "bot.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_JSON = os.getenv("LOG_JSON", "false").lower() == "true"  # Структурированные записи JSON вместо текста
+LOG_MAX_BYTES = 10 * 1024 * 1024  # Ротация по размеру файла (10 МБ)
+LOG_BACKUP_COUNT = 5  # Сколько старых файлов хранить
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "")  # Ротация по времени, например "midnight"; пусто — по размеру
+
+# Performance Monitoring
+ADMIN_IDS = {int(i) for i in os.getenv("ADMIN_IDS", "").split(",") if i.strip()}  # Кому доступны /perf и /history; пусто — администраторам CHAT_ID
+PERF_WINDOW_MINUTES = 60  # Сколько минут хранить гистограммы стадий
+PERF_SUMMARY_MINUTES = 15  # Период /perf по умолчанию
+PERF_SLOW_UPDATE_MS = 1000  # Обновления дольше этого пишутся в лог с разбивкой по стадиям
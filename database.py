@@ -1,62 +1,745 @@
 import aiosqlite
 import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from typing import List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 import config
+from perf import PerfRecorder, TimedLock
+from storage import ChatSettings, Event, Participant, Roster
+
+logger = logging.getLogger(__name__)
+
+# Запись с проверкой лимита и дубликата одним оператором. Лимит хранится в событии
+# (у архивного события его нет, и запись не проходит). join_seq только растёт,
+# отображаемая позиция — число записавшихся раньше + 1
+JOIN_SQL = """INSERT INTO participants 
+   (event_id, user_id, username, first_name, last_name, join_seq) 
+   SELECT ?, ?, ?, ?, ?, COALESCE(MAX(join_seq), 0) + 1 
+   FROM participants WHERE event_id = ? 
+   HAVING COUNT(*) < (SELECT capacity FROM events WHERE id = ?) 
+   ON CONFLICT(event_id, user_id) DO NOTHING 
+   RETURNING (
+       SELECT COUNT(*) FROM participants AS earlier 
+       WHERE earlier.event_id = participants.event_id 
+         AND earlier.join_seq < participants.join_seq
+   ) + 1"""
+
+# Захват или продление аренды: строка возвращается, только если аренда
+# свободна, истекла или уже принадлежит этому владельцу
+LEASE_SQL = """INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) 
+   ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at 
+   WHERE leases.owner = excluded.owner OR leases.expires_at < ? 
+   RETURNING owner"""
+
+# Текущая позиция участника (0, если его нет)
+POSITION_SQL = """SELECT COUNT(*) FROM participants AS me 
+   JOIN participants AS earlier 
+     ON earlier.event_id = me.event_id AND earlier.join_seq <= me.join_seq 
+   WHERE me.event_id = ? AND me.user_id = ?"""
+
+# Позиции вычисляются при чтении, поэтому отказ — это один DELETE
+LEAVE_SQL = "DELETE FROM participants WHERE event_id = ? AND user_id = ?"
+
+# Состав события в порядке записи; читается целиком из индекса idx_participants_roster
+ROSTER_SQL = """SELECT user_id, username, first_name, last_name 
+   FROM participants WHERE event_id = ? ORDER BY join_seq"""
+
+# Лист ожидания события в порядке очереди (индекс idx_waitlist_queue)
+WAITLIST_SQL = """SELECT user_id, username, first_name, last_name 
+   FROM waitlist WHERE event_id = ? ORDER BY id"""
+
+# Постановка в лист ожидания с ограничением его длины
+WAIT_SQL = """INSERT INTO waitlist (event_id, user_id, username, first_name, last_name) 
+   SELECT ?, ?, ?, ?, ? WHERE (SELECT COUNT(*) FROM waitlist WHERE event_id = ?) < ? 
+   ON CONFLICT(event_id, user_id) DO NOTHING"""
+
+# Место в листе ожидания (0, если пользователя в нём нет)
+WAIT_POSITION_SQL = """SELECT COUNT(*) FROM waitlist AS me 
+   JOIN waitlist AS earlier ON earlier.event_id = me.event_id AND earlier.id <= me.id 
+   WHERE me.event_id = ? AND me.user_id = ?"""
+
+# Первый в очереди вместе с чатом и датой события (для уведомления о переводе в список)
+WAITLIST_HEAD_SQL = """SELECT w.id, w.user_id, w.username, w.first_name, w.last_name, e.chat_id, e.date 
+   FROM waitlist AS w JOIN events AS e ON e.id = w.event_id 
+   WHERE w.event_id = ? ORDER BY w.id LIMIT 1"""
+
+UNWAIT_SQL = "DELETE FROM waitlist WHERE event_id = ? AND user_id = ?"
+
+# Событие чата по дате (уникальный индекс chat_id, date)
+EVENT_BY_DATE_SQL = "SELECT id, chat_id, date, message_id, capacity FROM events WHERE chat_id = ? AND date = ?"
+
+CHAT_COLUMNS = ", ".join(ChatSettings._fields)
+
+class RosterCache:
+    """LRU-кэш составов событий: прошедшие события вытесняются первыми"""
+    
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._rosters: "OrderedDict[int, Roster]" = OrderedDict()
+    
+    def get(self, event_id: int) -> Optional[Roster]:
+        roster = self._rosters.get(event_id)
+        if roster is not None:
+            self._rosters.move_to_end(event_id)
+        return roster
+    
+    def put(self, event_id: int, roster: Roster):
+        self._rosters[event_id] = roster
+        self._rosters.move_to_end(event_id)
+        while len(self._rosters) > self.capacity:
+            self._rosters.popitem(last=False)
+    
+    def discard(self, event_id: int):
+        self._rosters.pop(event_id, None)
+    
+    def event_ids(self) -> List[int]:
+        return list(self._rosters)
+
+
+class WriteBatcher:
+    """
+    Групповая фиксация записей и отказов: операции, пришедшие за короткое окно
+    (или до заполнения пачки), применяются одной транзакцией
+    """
+    
+    def __init__(self, manager: "DatabaseManager", window: float, max_size: int):
+        self.manager = manager
+        self.window = window
+        self.max_size = max_size
+        self._queue: List[Tuple[str, tuple, asyncio.Future]] = []
+        self._full = asyncio.Event()
+        self._flush_task: Optional[asyncio.Task] = None
+        # Метрики
+        self.batches = 0
+        self.operations = 0
+    
+    def submit(self, op: str, args: tuple) -> asyncio.Future:
+        """Поставить операцию в очередь; future получит результат после фиксации"""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((op, args, future))
+        if len(self._queue) >= self.max_size:
+            self._full.set()
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._run())
+        return future
+    
+    async def _run(self):
+        try:
+            while self._queue:
+                if len(self._queue) < self.max_size:
+                    try:
+                        await asyncio.wait_for(self._full.wait(), self.window)
+                    except asyncio.TimeoutError:
+                        pass
+                self._full.clear()
+                
+                batch = self._queue[:self.max_size]
+                del self._queue[:self.max_size]
+                self.batches += 1
+                self.operations += len(batch)
+                await self.manager._apply_batch(batch)
+        finally:
+            self._flush_task = None
+    
+    async def close(self):
+        """Дождаться фиксации всех поставленных операций"""
+        while self._flush_task is not None:
+            await self._flush_task
+
 
 class DatabaseManager:
-    def __init__(self):
-        self.db_path = config.DATABASE_PATH
-        self._lock = asyncio.Lock()
+    def __init__(self, db_path: Optional[str] = None, batch_writes: Optional[bool] = None,
+                 recorder: Optional[PerfRecorder] = None, archive_path: Optional[str] = None):
+        self.db_path = db_path or config.DATABASE_PATH
+        # Архив прошедших событий лежит рядом с основной базой
+        self.archive_path = (archive_path or config.ARCHIVE_DATABASE_PATH
+                             or os.path.splitext(self.db_path)[0] + "_archive.db")
+        # Замеры ожидания блокировок и запросов
+        self.perf = recorder or PerfRecorder(
+            config.PERF_WINDOW_MINUTES, config.PERF_SLOW_UPDATE_MS / 1000
+        )
+        # Короткая блокировка соединения записи: удерживается на время одного
+        # оператора или транзакции, чтобы транзакции не смешивались
+        self._lock = TimedLock(self.perf)
+        # Блокировки по событиям: записи в разные события не ждут друг друга
+        self._event_locks: Dict[int, asyncio.Lock] = {}
+        # Кэш составов, обновляется сразу после успешной записи
+        self._rosters = RosterCache(config.ROSTER_CACHE_SIZE)
+        # Отказы в записи, выданные по кэшу без блокировок и базы
+        self.fast_rejects = {"full": 0, "joined": 0}
+        # Вызывается после фиксации перевода из листа ожидания в список:
+        # on_promoted(chat_id, дата события, [(user_id, username, first_name, last_name), ...])
+        self.on_promoted: Optional[Callable[[int, str, List[Tuple]], None]] = None
+        self.promoted_total = 0
+        # Повторы захвата блокировки записи, которую дольше busy_timeout держал другой процесс
+        self.busy_retries = 0
+        # Долгоживущие соединения: одно на запись и пул на чтение
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._readers: Optional[asyncio.Queue] = None
+        self._reader_connections: List[aiosqlite.Connection] = []
+        # Необязательная групповая фиксация записей
+        if batch_writes is None:
+            batch_writes = config.DB_BATCH_WRITES
+        self._batcher: Optional[WriteBatcher] = None
+        if batch_writes:
+            self._batcher = WriteBatcher(
+                self, config.DB_BATCH_WINDOW_MS / 1000, config.DB_BATCH_MAX_SIZE
+            )
+    
+    def _event_lock(self, event_id: int) -> asyncio.Lock:
+        """Блокировка записи для конкретного события"""
+        lock = self._event_locks.get(event_id)
+        if lock is None:
+            lock = self._event_locks[event_id] = TimedLock(self.perf)
+        return lock
+    
+    async def _connect(self, **kwargs) -> aiosqlite.Connection:
+        """Открытие соединения с настроенными pragma"""
+        db = await aiosqlite.connect(self.db_path, **kwargs)
+        await db.execute(f"PRAGMA busy_timeout = {config.DB_BUSY_TIMEOUT_MS}")
+        await db.execute(f"PRAGMA synchronous = {config.DB_SYNCHRONOUS}")
+        await db.execute(f"PRAGMA cache_size = -{config.DB_CACHE_SIZE_KB}")
+        await db.execute(f"PRAGMA mmap_size = {config.DB_MMAP_SIZE}")
+        await db.execute("PRAGMA temp_store = MEMORY")
+        # Архив доступен в каждом соединении как схема archive
+        await db.execute("ATTACH DATABASE ? AS archive", (self.archive_path,))
+        return db
+    
+    async def _execute_busy(self, db: aiosqlite.Connection, sql: str, params=()) -> aiosqlite.Cursor:
+        """
+        Оператор, захватывающий блокировку записи (BEGIN IMMEDIATE или запись вне
+        транзакции). Если другой процесс держал блокировку дольше busy_timeout,
+        оператор повторяется с растущей паузой: такая ошибка возникает до
+        каких-либо изменений, поэтому повтор безопасен
+        """
+        delay = config.DB_BUSY_RETRY_DELAY
+        for attempt in range(config.DB_BUSY_RETRIES + 1):
+            try:
+                return await db.execute(sql, params)
+            except aiosqlite.OperationalError as e:
+                if "locked" not in str(e) or attempt == config.DB_BUSY_RETRIES:
+                    raise
+                self.busy_retries += 1
+                logger.warning(f"Database busy, retry {attempt + 1} in {delay:.2f}s: {e}")
+                await asyncio.sleep(delay)
+                delay *= 2
+    
+    @asynccontextmanager
+    async def _reader(self):
+        """Соединение из пула чтения"""
+        if self._readers.empty():
+            # Все соединения заняты: ожидание учитывается как ожидание блокировки
+            with self.perf.stage("lock_wait"):
+                db = await self._readers.get()
+        else:
+            db = self._readers.get_nowait()
+        try:
+            yield db
+        finally:
+            self._readers.put_nowait(db)
     
     async def init_database(self):
-        """Инициализация базы данных"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS events (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    date TEXT UNIQUE NOT NULL,
-                    message_id INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS participants (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    event_id INTEGER,
-                    user_id INTEGER NOT NULL,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    position INTEGER NOT NULL,
-                    joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (event_id) REFERENCES events (id),
-                    UNIQUE(event_id, user_id)
-                )
-            """)
-            
-            await db.commit()
+        """Инициализация базы данных и открытие соединений"""
+        if self._writer is not None:
+            return
+        
+        # Соединение записи работает в autocommit: каждый оператор — своя транзакция,
+        # многошаговые изменения явно оборачиваются в BEGIN IMMEDIATE/COMMIT
+        self._writer = await self._connect(isolation_level=None)
+        db = self._writer
+        # Освобождённые страницы возвращаются файлу по частям (incremental_vacuum).
+        # На новой базе действует сразу, существующую переводит первая архивация
+        await db.execute("PRAGMA main.auto_vacuum = INCREMENTAL")
+        await db.execute("PRAGMA archive.auto_vacuum = INCREMENTAL")
+        # WAL позволяет читать параллельно с записью
+        # PRAGMA journal_mode возвращает строку; незавершённый оператор держал бы транзакцию
+        await db.execute_fetchall("PRAGMA main.journal_mode = WAL")
+        await db.execute_fetchall("PRAGMA archive.journal_mode = WAL")
+        
+        await self._migrate(db)
+        await self._create_archive_schema(db)
+        
+        self._readers = asyncio.Queue()
+        for _ in range(config.DB_READ_POOL_SIZE):
+            reader = await self._connect()
+            self._reader_connections.append(reader)
+            self._readers.put_nowait(reader)
     
-    async def create_event(self, date: str, message_id: int) -> int:
-        """Создание нового события"""
-        async with self._lock:
-            async with aiosqlite.connect(self.db_path) as db:
+    async def _migrate(self, db: aiosqlite.Connection):
+        """
+        Применение недостающих миграций по порядку.
+        Номер последней применённой хранится в PRAGMA user_version; каждая миграция
+        вместе с новым номером фиксируется одной транзакцией
+        """
+        migrations = [self._migration_base_schema, self._migration_roster_index,
+                      self._migration_chats, self._migration_waitlist, self._migration_event_log,
+                      self._migration_leases]
+        applied = 0
+        for version, migration in enumerate(migrations, 1):
+            await self._execute_busy(db, "BEGIN IMMEDIATE")
+            try:
+                # Версию читаем под блокировкой записи: другой процесс мог успеть раньше
+                cursor = await db.execute("PRAGMA user_version")
+                if (await cursor.fetchone())[0] >= version:
+                    await db.execute("ROLLBACK")
+                    continue
+                await migration(db)
+                await db.execute(f"PRAGMA user_version = {version}")
+                await db.execute("COMMIT")
+            except Exception:
+                if db.in_transaction:
+                    await db.execute("ROLLBACK")
+                raise
+            applied += 1
+            logger.info(f"Database migrated to version {version} ({migration.__name__})")
+        
+        if applied:
+            # Статистика для планировщика запросов по новым индексам
+            await db.execute("ANALYZE")
+        else:
+            # Схему мог создать другой процесс, пока соединение помнило пустую базу:
+            # чтение main.sqlite_master перечитывает её, иначе имена без схемы
+            # разрешались бы в одноимённые таблицы archive
+            await db.execute_fetchall("SELECT COUNT(*) FROM main.sqlite_master")
+    
+    async def _migration_base_schema(self, db: aiosqlite.Connection):
+        """Базовая схема: события и участники"""
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT UNIQUE NOT NULL,
+                message_id INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS participants (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_id INTEGER,
+                user_id INTEGER NOT NULL,
+                username TEXT,
+                first_name TEXT,
+                last_name TEXT,
+                join_seq INTEGER NOT NULL,
+                joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (event_id) REFERENCES events (id),
+                UNIQUE(event_id, user_id)
+            )
+        """)
+        
+        # Базы до появления версий хранили позицию в столбце position; старые позиции
+        # уже упорядочены, поэтому служат начальной последовательностью записи
+        cursor = await db.execute("PRAGMA table_info(participants)")
+        columns = {row[1] for row in await cursor.fetchall()}
+        if "position" in columns and "join_seq" not in columns:
+            await db.execute("ALTER TABLE participants RENAME COLUMN position TO join_seq")
+    
+    async def _migration_roster_index(self, db: aiosqlite.Connection):
+        """Покрывающий индекс состава события"""
+        # Упорядоченное чтение состава, подсчёт, MAX(join_seq) и позиции
+        # обслуживаются одним индексом без обращения к таблице
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_participants_roster 
+            ON participants (event_id, join_seq, user_id, username, first_name, last_name)
+        """)
+    
+    async def _migration_chats(self, db: aiosqlite.Connection):
+        """Настройки чатов; события принадлежат чату и хранят свой лимит"""
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS chats (
+                chat_id INTEGER PRIMARY KEY,
+                schedule_day INTEGER NOT NULL,
+                schedule_hour INTEGER NOT NULL,
+                schedule_minute INTEGER NOT NULL,
+                max_participants INTEGER NOT NULL,
+                pin_message INTEGER NOT NULL,
+                enabled INTEGER NOT NULL DEFAULT 1,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        # Чат из config продолжает работать с прежним расписанием
+        await db.execute(
+            f"INSERT OR IGNORE INTO chats ({CHAT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, 1)",
+            (config.CHAT_ID, config.SCHEDULE_DAY, config.SCHEDULE_HOUR, config.SCHEDULE_MINUTE,
+             config.MAX_PARTICIPANTS, int(config.PIN_MESSAGE))
+        )
+        
+        # Уникальность даты теперь в пределах чата: таблица пересоздаётся
+        await db.execute("""
+            CREATE TABLE events_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                date TEXT NOT NULL,
+                message_id INTEGER,
+                capacity INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(chat_id, date)
+            )
+        """)
+        await db.execute(
+            """INSERT INTO events_new (id, chat_id, date, message_id, capacity, created_at) 
+               SELECT id, ?, date, message_id, ?, created_at FROM events""",
+            (config.CHAT_ID, config.MAX_PARTICIPANTS)
+        )
+        # Счётчик AUTOINCREMENT сохраняется: id архивных событий не выдаются повторно
+        cursor = await db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'events'")
+        row = await cursor.fetchone()
+        await db.execute("DROP TABLE events")
+        await db.execute("ALTER TABLE events_new RENAME TO events")
+        if row is not None:
+            await db.execute("DELETE FROM sqlite_sequence WHERE name = 'events'")
+            await db.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('events', ?)", (row[0],))
+    
+    async def _migration_waitlist(self, db: aiosqlite.Connection):
+        """Лист ожидания: очередь по возрастанию id"""
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS waitlist (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                username TEXT,
+                first_name TEXT,
+                last_name TEXT,
+                queued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (event_id) REFERENCES events (id),
+                UNIQUE(event_id, user_id)
+            )
+        """)
+        # Чтение очереди, её голова и места в ней — из одного индекса
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_waitlist_queue 
+            ON waitlist (event_id, id, user_id, username, first_name, last_name)
+        """)
+    
+    async def _migration_event_log(self, db: aiosqlite.Connection):
+        """Журнал записей и отказов со снимками составов (режим DB_STORAGE=log)"""
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS participant_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_id INTEGER NOT NULL,
+                op TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                username TEXT,
+                first_name TEXT,
+                last_name TEXT,
+                at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_participant_log_event ON participant_log (event_id, id)"
+        )
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS roster_snapshots (
+                event_id INTEGER PRIMARY KEY,
+                last_log_id INTEGER NOT NULL,
+                members TEXT NOT NULL,
+                waiting TEXT NOT NULL,
+                taken_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    
+    async def _migration_leases(self, db: aiosqlite.Connection):
+        """Аренды между процессами: кто из обработчиков выполняет общие задания"""
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+    
+    async def _create_archive_schema(self, db: aiosqlite.Connection):
+        """Таблицы архива: те же столбцы и время переноса"""
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS archive.events (
+                id INTEGER PRIMARY KEY,
+                date TEXT NOT NULL,
+                message_id INTEGER,
+                created_at TIMESTAMP,
+                archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                chat_id INTEGER,
+                capacity INTEGER
+            )
+        """)
+        # Архив, созданный до настроек чатов: его события относятся к чату из config
+        cursor = await db.execute("PRAGMA archive.table_info(events)")
+        if "chat_id" not in {row[1] for row in await cursor.fetchall()}:
+            await db.execute("ALTER TABLE archive.events ADD COLUMN chat_id INTEGER")
+            await db.execute("ALTER TABLE archive.events ADD COLUMN capacity INTEGER")
+            await db.execute("UPDATE archive.events SET chat_id = ?, capacity = ?",
+                             (config.CHAT_ID, config.MAX_PARTICIPANTS))
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS archive.participants (
+                id INTEGER PRIMARY KEY,
+                event_id INTEGER,
+                user_id INTEGER NOT NULL,
+                username TEXT,
+                first_name TEXT,
+                last_name TEXT,
+                join_seq INTEGER NOT NULL,
+                joined_at TIMESTAMP
+            )
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS archive.participant_log (
+                id INTEGER PRIMARY KEY,
+                event_id INTEGER NOT NULL,
+                op TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                username TEXT,
+                first_name TEXT,
+                last_name TEXT,
+                at TIMESTAMP
+            )
+        """)
+        await db.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_events_date ON events (date)")
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS archive.idx_archive_participants_event "
+            "ON participants (event_id, join_seq)"
+        )
+    
+    async def close(self):
+        """Закрытие всех соединений с базой данных"""
+        if self._batcher is not None:
+            await self._batcher.close()
+        
+        for reader in self._reader_connections:
+            await reader.close()
+        self._reader_connections = []
+        self._readers = None
+        
+        if self._writer is not None:
+            await self._writer.close()
+            self._writer = None
+    
+    async def create_event(self, date: str, message_id: Optional[int],
+                           chat_id: Optional[int] = None, capacity: Optional[int] = None) -> int:
+        """
+        Создание события; лимит по умолчанию берётся из настроек чата.
+        Событие чата на ту же дату сохраняет id и состав: кнопки уже отправленных
+        сообщений продолжают работать, меняются только сообщение и лимит
+        """
+        if chat_id is None:
+            chat_id = config.CHAT_ID
+        async with self._lock, self.perf.stage("query"):
+            db = self._writer
+            try:
+                await self._execute_busy(db, "BEGIN IMMEDIATE")
                 cursor = await db.execute(
-                    "INSERT OR REPLACE INTO events (date, message_id) VALUES (?, ?)",
-                    (date, message_id)
+                    """INSERT INTO events (chat_id, date, message_id, capacity) 
+                       VALUES (?, ?, ?, COALESCE(?, 
+                           (SELECT max_participants FROM chats WHERE chat_id = ?), ?)) 
+                       ON CONFLICT(chat_id, date) DO UPDATE SET 
+                           message_id = excluded.message_id, 
+                           capacity = excluded.capacity 
+                       RETURNING id, capacity""",
+                    (chat_id, date, message_id, capacity, chat_id, config.MAX_PARTICIPANTS)
                 )
-                await db.commit()
-                return cursor.lastrowid
+                event_id, capacity = await cursor.fetchone()
+                # Лимит существующего события мог вырасти
+                promoted = await self._promote(db, event_id)
+                await db.execute("COMMIT")
+            except Exception:
+                if db.in_transaction:
+                    await db.execute("ROLLBACK")
+                raise
+            self._apply_capacity(event_id, capacity, promoted)
+        return event_id
     
-    async def get_event_by_date(self, date: str) -> Optional[Tuple]:
-        """Получение события по дате"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
-                "SELECT id, date, message_id FROM events WHERE date = ?",
-                (date,)
+    async def set_event_message(self, event_id: int, message_id: int):
+        """Привязка отправленного сообщения к событию"""
+        async with self._lock, self.perf.stage("query"):
+            await self._execute_busy(
+                self._writer,
+                "UPDATE events SET message_id = ? WHERE id = ?",
+                (message_id, event_id)
             )
-            return await cursor.fetchone()
+    
+    async def get_event_by_date(self, date: str, chat_id: Optional[int] = None) -> Optional[Event]:
+        """Получение события чата по дате"""
+        if chat_id is None:
+            chat_id = config.CHAT_ID
+        async with self._reader() as db, self.perf.stage("query"):
+            cursor = await db.execute(EVENT_BY_DATE_SQL, (chat_id, date))
+            row = await cursor.fetchone()
+            return Event(*row) if row else None
+    
+    async def get_chats(self) -> List[ChatSettings]:
+        """Настройки всех чатов"""
+        async with self._reader() as db:
+            cursor = await db.execute(f"SELECT {CHAT_COLUMNS} FROM chats")
+            return [self._chat_settings(row) for row in await cursor.fetchall()]
+    
+    async def get_chat(self, chat_id: int) -> Optional[ChatSettings]:
+        """Настройки чата или None, если чат не подключён"""
+        async with self._reader() as db:
+            cursor = await db.execute(f"SELECT {CHAT_COLUMNS} FROM chats WHERE chat_id = ?", (chat_id,))
+            row = await cursor.fetchone()
+            return self._chat_settings(row) if row else None
+    
+    @staticmethod
+    def _chat_settings(row: Tuple) -> ChatSettings:
+        settings = ChatSettings(*row)
+        return settings._replace(pin_message=bool(settings.pin_message), enabled=bool(settings.enabled))
+    
+    async def save_chat(self, settings: ChatSettings):
+        """
+        Сохранение настроек чата. Новый лимит действует и для ещё не прошедших
+        событий чата: запись сверяется с лимитом события
+        """
+        today = datetime.now().strftime('%Y-%m-%d')
+        async with self._lock, self.perf.stage("query"):
+            db = self._writer
+            try:
+                await self._execute_busy(db, "BEGIN IMMEDIATE")
+                await db.execute(
+                    f"""INSERT INTO chats ({CHAT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?) 
+                        ON CONFLICT(chat_id) DO UPDATE SET 
+                            schedule_day = excluded.schedule_day, 
+                            schedule_hour = excluded.schedule_hour, 
+                            schedule_minute = excluded.schedule_minute, 
+                            max_participants = excluded.max_participants, 
+                            pin_message = excluded.pin_message, 
+                            enabled = excluded.enabled, 
+                            updated_at = CURRENT_TIMESTAMP""",
+                    (settings.chat_id, settings.schedule_day, settings.schedule_hour,
+                     settings.schedule_minute, settings.max_participants,
+                     int(settings.pin_message), int(settings.enabled))
+                )
+                cursor = await db.execute(
+                    """UPDATE events SET capacity = ? 
+                       WHERE chat_id = ? AND date >= ? AND capacity != ? RETURNING id""",
+                    (settings.max_participants, settings.chat_id, today, settings.max_participants)
+                )
+                changed = [row[0] for row in await cursor.fetchall()]
+                # Добавленные места сразу занимают стоящие в очереди
+                promoted = {event_id: await self._promote(db, event_id) for event_id in changed}
+                await db.execute("COMMIT")
+            except Exception:
+                if db.in_transaction:
+                    await db.execute("ROLLBACK")
+                raise
+            
+            # Кэш меняется под той же блокировкой, что и загрузка состава
+            for event_id in changed:
+                self._apply_capacity(event_id, settings.max_participants, promoted[event_id])
+    
+    def _apply_capacity(self, event_id: int, capacity: int, promoted: List[Tuple]):
+        """Новый лимит и переведённые из очереди — в кэш состава; вызывающий держит блокировку записи"""
+        roster = self._rosters.get(event_id)
+        if roster is not None:
+            if roster.capacity != capacity:
+                roster.set_capacity(capacity)
+            for user_id, username, first_name, last_name, *_ in promoted:
+                roster.add(user_id, username, first_name, last_name)
+        self._notify_promoted(promoted)
+    
+    async def _join_statement(self, db: aiosqlite.Connection, event_id: int, user_id: int,
+                              username: str, first_name: str, last_name: str) -> Optional[int]:
+        """Попытка записи; возвращает позицию или None, если запись не прошла"""
+        cursor = await self._execute_busy(
+            db, JOIN_SQL,
+            (event_id, user_id, username, first_name, last_name, event_id, event_id)
+        )
+        inserted = await cursor.fetchone()
+        await cursor.close()
+        return inserted[0] if inserted else None
+    
+    async def _position_statement(self, db: aiosqlite.Connection, event_id: int, user_id: int) -> int:
+        """Позиция участника в списке (0, если его нет)"""
+        cursor = await db.execute(POSITION_SQL, (event_id, user_id))
+        return (await cursor.fetchone())[0]
+    
+    def _cache_join(self, event_id: int, user_id: int, username: str,
+                    first_name: str, last_name: str):
+        roster = self._rosters.get(event_id)
+        if roster is not None:
+            roster.add(user_id, username, first_name, last_name)
+    
+    def _cache_leave(self, event_id: int, user_id: int, promoted: List[Tuple] = ()):
+        roster = self._rosters.get(event_id)
+        if roster is not None:
+            roster.remove(user_id)
+            for promoted_id, username, first_name, last_name, *_ in promoted:
+                roster.add(promoted_id, username, first_name, last_name)
+        self._notify_promoted(promoted)
+    
+    def _notify_promoted(self, promoted: List[Tuple]):
+        """Передать зафиксированные переводы в список; одно событие — одна пачка"""
+        if not promoted:
+            return
+        self.promoted_total += len(promoted)
+        if self.on_promoted is not None:
+            chat_id, event_date = promoted[0][4], promoted[0][5]
+            self.on_promoted(chat_id, event_date, [row[:4] for row in promoted])
+    
+    async def _leave_statement(self, db: aiosqlite.Connection, event_id: int,
+                               user_id: int) -> Tuple[bool, List[Tuple]]:
+        """
+        Отказ внутри транзакции: из списка (с переводом первых из очереди
+        на освободившиеся места) или из листа ожидания.
+        Возвращает (удалён ли, переведённые в список)
+        """
+        cursor = await db.execute(LEAVE_SQL, (event_id, user_id))
+        if cursor.rowcount == 0:
+            cursor = await db.execute(UNWAIT_SQL, (event_id, user_id))
+            return cursor.rowcount > 0, []
+        return True, await self._promote(db, event_id)
+    
+    async def _promote(self, db: aiosqlite.Connection, event_id: int) -> List[Tuple]:
+        """
+        Перевод из листа ожидания, пока в списке есть места:
+        [(user_id, username, first_name, last_name, chat_id, дата), ...]
+        """
+        promoted = []
+        while True:
+            cursor = await db.execute(WAITLIST_HEAD_SQL, (event_id,))
+            head = await cursor.fetchone()
+            if head is None:
+                break
+            wait_id, user_id, username, first_name, last_name, chat_id, event_date = head
+            position = await self._join_statement(db, event_id, user_id, username, first_name, last_name)
+            if position is None and not await self._position_statement(db, event_id, user_id):
+                # Мест нет
+                break
+            await db.execute("DELETE FROM waitlist WHERE id = ?", (wait_id,))
+            if position is not None:
+                promoted.append((user_id, username, first_name, last_name, chat_id, event_date))
+        return promoted
+    
+    def _fast_admission(self, event_id: int, user_id: int) -> Optional[Tuple[bool, int]]:
+        """
+        Кэшированный состав меняется сразу после фиксации записи или отказа,
+        поэтому "уже записан" и "список полон" по нему не требуют ни блокировки, ни запроса
+        """
+        roster = self._rosters.get(event_id)
+        if roster is None:
+            return None
+        rejected = roster.admission(user_id)
+        if rejected is not None:
+            self.fast_rejects["joined" if rejected[1] > 0 else "full"] += 1
+        return rejected
+    
+    def _fast_wait(self, event_id: int, user_id: int) -> Optional[Tuple[bool, int]]:
+        """
+        Ответ на постановку в очередь по кэшированному составу: место стоящего
+        в очереди или (False, 0), когда заполнены и список, и лист ожидания
+        """
+        roster = self._rosters.get(event_id)
+        if roster is None:
+            return None
+        if user_id in roster.waiting:
+            return False, roster.waiting_position(user_id)
+        if (user_id not in roster.members and len(roster.members) >= roster.capacity
+                and len(roster.waiting) >= config.WAITLIST_MAX):
+            self.fast_rejects["full"] += 1
+            return False, 0
+        return None
     
     async def add_participant(self, event_id: int, user_id: int, username: str, 
                             first_name: str, last_name: str) -> Tuple[bool, int]:
@@ -64,84 +747,377 @@ class DatabaseManager:
         Добавление участника к событию
         Возвращает (успех, позиция)
         """
-        async with self._lock:
-            async with aiosqlite.connect(self.db_path) as db:
-                # Проверяем, не записан ли уже пользователь
-                cursor = await db.execute(
-                    "SELECT position FROM participants WHERE event_id = ? AND user_id = ?",
-                    (event_id, user_id)
-                )
-                existing = await cursor.fetchone()
-                
-                if existing:
-                    return False, existing[0]
-                
-                # Проверяем количество участников
-                cursor = await db.execute(
-                    "SELECT COUNT(*) FROM participants WHERE event_id = ?",
-                    (event_id,)
-                )
-                count = (await cursor.fetchone())[0]
-                
-                if count >= config.MAX_PARTICIPANTS:
-                    return False, -1
-                
-                # Добавляем участника
-                position = count + 1
-                await db.execute(
-                    """INSERT INTO participants 
-                       (event_id, user_id, username, first_name, last_name, position) 
-                       VALUES (?, ?, ?, ?, ?, ?)""",
-                    (event_id, user_id, username, first_name, last_name, position)
+        rejected = self._fast_admission(event_id, user_id)
+        if rejected is not None:
+            return rejected
+        
+        if self._batcher is not None:
+            return await self._batcher.submit(
+                "join", (event_id, user_id, username, first_name, last_name)
+            )
+        
+        async with self._event_lock(event_id):
+            async with self._lock, self.perf.stage("query"):
+                position = await self._join_statement(
+                    self._writer, event_id, user_id, username, first_name, last_name
                 )
-                await db.commit()
+                # Кэш меняется под блокировкой записи, как в _apply_batch: иначе перевод
+                # из очереди в save_chat/create_event мог бы попасть в кэш раньше этой записи
+                if position is not None:
+                    self._cache_join(event_id, user_id, username, first_name, last_name)
+            
+            if position is not None:
                 return True, position
+            
+            # Вставка не прошла: пользователь уже записан или список полон
+            async with self._reader() as db, self.perf.stage("query"):
+                position = await self._position_statement(db, event_id, user_id)
+            if position:
+                return False, position
+            return False, -1
     
     async def remove_participant(self, event_id: int, user_id: int) -> bool:
         """Удаление участника из события"""
+        if self._batcher is not None:
+            return await self._batcher.submit("leave", (event_id, user_id))
+        
+        async with self._event_lock(event_id):
+            async with self._lock, self.perf.stage("query"):
+                db = self._writer
+                try:
+                    # Освободившееся место занимает первый из очереди в той же транзакции
+                    await self._execute_busy(db, "BEGIN IMMEDIATE")
+                    removed, promoted = await self._leave_statement(db, event_id, user_id)
+                    await db.execute("COMMIT")
+                except Exception:
+                    if db.in_transaction:
+                        await db.execute("ROLLBACK")
+                    raise
+                if removed:
+                    self._cache_leave(event_id, user_id, promoted)
+            return removed
+    
+    async def wait_for_seat(self, event_id: int, user_id: int, username: str,
+                            first_name: str, last_name: str) -> Tuple[bool, int]:
+        """
+        Запись, а если мест нет — постановка в лист ожидания.
+        Возвращает (True, позиция в списке) или (False, место в очереди);
+        (False, 0) — лист ожидания тоже заполнен
+        """
+        # Повторные нажатия стоящих в очереди и нажатия при заполненной очереди
+        # отвечаются по кэшу, без блокировок и транзакции
+        rejected = self._fast_wait(event_id, user_id)
+        if rejected is not None:
+            return rejected
+        
+        async with self._event_lock(event_id):
+            async with self._lock, self.perf.stage("query"):
+                db = self._writer
+                try:
+                    await self._execute_busy(db, "BEGIN IMMEDIATE")
+                    # Событие заменено или перенесено в архив: ставить в очередь некуда
+                    cursor = await db.execute("SELECT 1 FROM events WHERE id = ?", (event_id,))
+                    if await cursor.fetchone() is None:
+                        await db.execute("ROLLBACK")
+                        return False, 0
+                    # Место могло освободиться после отказа "список полон"
+                    position = await self._join_statement(
+                        db, event_id, user_id, username, first_name, last_name
+                    )
+                    joined = position is not None
+                    if not joined:
+                        position = await self._position_statement(db, event_id, user_id)
+                    place = 0
+                    if not position:
+                        await db.execute(WAIT_SQL, (event_id, user_id, username, first_name,
+                                                    last_name, event_id, config.WAITLIST_MAX))
+                        cursor = await db.execute(WAIT_POSITION_SQL, (event_id, user_id))
+                        place = (await cursor.fetchone())[0]
+                    await db.execute("COMMIT")
+                except Exception:
+                    if db.in_transaction:
+                        await db.execute("ROLLBACK")
+                    raise
+                
+                if joined:
+                    self._cache_join(event_id, user_id, username, first_name, last_name)
+                roster = self._rosters.get(event_id)
+                if not position and place and roster is not None and user_id not in roster.waiting:
+                    roster.wait(user_id, username, first_name, last_name)
+            if position:
+                return True, position
+            return False, place
+    
+    async def _apply_batch(self, batch: list):
+        """
+        Применение пачки записей/отказов одной транзакцией.
+        Операции выполняются в порядке поступления, поэтому лимит и позиции
+        считаются так же, как при поштучной записи
+        """
+        results = []
         async with self._lock:
-            async with aiosqlite.connect(self.db_path) as db:
-                cursor = await db.execute(
-                    "SELECT position FROM participants WHERE event_id = ? AND user_id = ?",
-                    (event_id, user_id)
+            db = self._writer
+            try:
+                with self.perf.stage("query"):
+                    await self._execute_busy(db, "BEGIN IMMEDIATE")
+                    for op, args, _ in batch:
+                        if op == "join":
+                            position = await self._join_statement(db, *args)
+                            if position is not None:
+                                results.append((True, position))
+                            else:
+                                position = await self._position_statement(db, args[0], args[1])
+                                results.append((False, position) if position else (False, -1))
+                        else:
+                            results.append(await self._leave_statement(db, *args))
+                    await db.execute("COMMIT")
+            except Exception as e:
+                if db.in_transaction:
+                    await db.execute("ROLLBACK")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            
+            # Кэш обновляется под той же блокировкой, что и загрузка состава
+            for (op, args, future), result in zip(batch, results):
+                if op == "join" and result[0]:
+                    self._cache_join(*args)
+                elif op == "leave":
+                    removed, promoted = result
+                    if removed:
+                        self._cache_leave(*args, promoted)
+                    result = removed
+                if not future.done():
+                    future.set_result(result)
+    
+    async def archive_events(self, before_date: str, batch_size: int) -> int:
+        """
+        Перенос событий с датой раньше before_date и их участников в архив.
+        Работает пачками по batch_size событий; каждая пачка — короткая транзакция,
+        между пачками горячий путь получает соединение записи.
+        В режиме WAL транзакция над двумя файлами атомарна для каждого по отдельности,
+        поэтому сначала выполняется идемпотентное копирование, затем удаление:
+        прерванную пачку безопасно повторить. Возвращает число перенесённых событий
+        """
+        archived = 0
+        while True:
+            async with self._lock:
+                cursor = await self._writer.execute(
+                    "SELECT id FROM events WHERE date < ? ORDER BY date LIMIT ?",
+                    (before_date, batch_size)
                 )
-                participant = await cursor.fetchone()
-                
-                if not participant:
-                    return False
-                
-                removed_position = participant[0]
-                
-                # Удаляем участника
+                event_ids = [row[0] for row in await cursor.fetchall()]
+                if not event_ids:
+                    break
+                await self._archive_batch(self._writer, event_ids)
+            
+            for event_id in event_ids:
+                self._rosters.discard(event_id)
+                self._event_locks.pop(event_id, None)
+            archived += len(event_ids)
+            await asyncio.sleep(0)
+        
+        # Участники событий, перезаписанных прежним create_event (INSERT OR REPLACE), остались без события
+        async with self._lock:
+            await self._archive_batch(self._writer, [], orphans=True)
+        return archived
+    
+    async def _archive_batch(self, db: aiosqlite.Connection, event_ids: List[int],
+                             orphans: bool = False):
+        """Копирование пачки в архив и удаление из основной базы"""
+        where, params = self._batch_filter(event_ids, orphans)
+        try:
+            await self._execute_busy(db, "BEGIN IMMEDIATE")
+            if event_ids:
                 await db.execute(
-                    "DELETE FROM participants WHERE event_id = ? AND user_id = ?",
-                    (event_id, user_id)
+                    f"""INSERT OR IGNORE INTO archive.events 
+                        (id, date, message_id, created_at, chat_id, capacity) 
+                        SELECT id, date, message_id, created_at, chat_id, capacity FROM main.events 
+                        WHERE id IN ({','.join('?' * len(event_ids))})""",
+                    params
                 )
-                
-                # Обновляем позиции остальных участников
+            await db.execute(
+                f"""INSERT OR IGNORE INTO archive.participants 
+                    (id, event_id, user_id, username, first_name, last_name, join_seq, joined_at) 
+                    SELECT id, event_id, user_id, username, first_name, last_name, join_seq, joined_at 
+                    FROM main.participants WHERE {where}""",
+                params
+            )
+            await db.execute(f"DELETE FROM main.participants WHERE {where}", params)
+            # Очередь прошедшего события не нужна и в архив не переносится
+            await db.execute(f"DELETE FROM main.waitlist WHERE {where}", params)
+            if event_ids:
                 await db.execute(
-                    "UPDATE participants SET position = position - 1 WHERE event_id = ? AND position > ?",
-                    (event_id, removed_position)
+                    f"DELETE FROM main.events WHERE id IN ({','.join('?' * len(event_ids))})",
+                    params
                 )
-                
-                await db.commit()
-                return True
+            await db.execute("COMMIT")
+        except Exception:
+            if db.in_transaction:
+                await db.execute("ROLLBACK")
+            raise
     
-    async def get_participants(self, event_id: int) -> List[Tuple]:
-        """Получение списка участников события"""
-        async with aiosqlite.connect(self.db_path) as db:
+    @staticmethod
+    def _batch_filter(event_ids: List[int], orphans: bool) -> Tuple[str, tuple]:
+        """Условие на event_id для пачки архивации: её события или записи без события"""
+        if orphans:
+            return "event_id NOT IN (SELECT id FROM main.events)", ()
+        return f"event_id IN ({','.join('?' * len(event_ids))})", tuple(event_ids)
+    
+    async def compact(self):
+        """
+        Возврат освободившихся страниц файловой системе.
+        База, созданная до включения auto_vacuum, один раз пересобирается VACUUM
+        """
+        async with self._lock:
+            for schema in ("main", "archive"):
+                cursor = await self._writer.execute(f"PRAGMA {schema}.auto_vacuum")
+                if (await cursor.fetchone())[0] == 2:
+                    # execute делает один шаг оператора и освобождает одну страницу;
+                    # executescript выполняет прагму до конца
+                    await self._writer.executescript(f"PRAGMA {schema}.incremental_vacuum;")
+                else:
+                    await self._writer.execute(f"PRAGMA {schema}.auto_vacuum = INCREMENTAL")
+                    await self._writer.execute(f"VACUUM {schema}")
+                    logger.info(f"Database {schema} rebuilt with incremental auto_vacuum")
+    
+    async def get_event_history(self, limit: int, chat_id: Optional[int] = None) -> List[Tuple]:
+        """
+        Последние события из основной базы и архива, для всех чатов или одного:
+        (id, дата, число участников, лимит, в архиве ли)
+        """
+        # Без chat_id условие "? IS NULL" пропускает события всех чатов
+        async with self._reader() as db:
             cursor = await db.execute(
-                """SELECT user_id, username, first_name, last_name, position 
-                   FROM participants WHERE event_id = ? ORDER BY position""",
-                (event_id,)
+                """SELECT id, date, 
+                          (SELECT COUNT(*) FROM main.participants p WHERE p.event_id = e.id), 
+                          capacity, 0 
+                   FROM main.events e WHERE ? IS NULL OR chat_id = ? 
+                   UNION ALL 
+                   SELECT id, date, 
+                          (SELECT COUNT(*) FROM archive.participants p WHERE p.event_id = e.id), 
+                          capacity, 1 
+                   FROM archive.events e WHERE ? IS NULL OR chat_id = ? 
+                   ORDER BY date DESC LIMIT ?""",
+                (chat_id, chat_id, chat_id, chat_id, limit)
             )
             return await cursor.fetchall()
     
-    async def get_participant_count(self, event_id: int) -> int:
-        """Получение количества участников"""
-        async with aiosqlite.connect(self.db_path) as db:
+    async def get_archived_participants(self, event_id: int) -> List[Participant]:
+        """Участники архивного события в порядке записи"""
+        async with self._reader() as db:
             cursor = await db.execute(
-                "SELECT COUNT(*) FROM participants WHERE event_id = ?",
+                """SELECT user_id, username, first_name, last_name 
+                   FROM archive.participants WHERE event_id = ? ORDER BY join_seq""",
                 (event_id,)
             )
-            return (await cursor.fetchone())[0] 
\ No newline at end of file
+            return [Participant(*row, position) for position, row in enumerate(await cursor.fetchall(), 1)]
+    
+    async def warm_up(self, today: str) -> List[Event]:
+        """
+        Подготовка к первым нажатиям после запуска: операторы горячего пути
+        компилируются в каждом соединении, составы ещё не прошедших событий
+        загружаются в кэш. Возвращает эти события
+        """
+        # Операторы с несуществующим событием ничего не меняют, но попадают
+        # в кэш подготовленных операторов соединения и читают схему
+        async with self._lock:
+            await self._join_statement(self._writer, -1, -1, "", "", "")
+            await self._writer.execute(LEAVE_SQL, (-1, -1))
+            await self._load_roster(self._writer, -1)
+        for _ in self._reader_connections:
+            async with self._reader() as db:
+                await self._position_statement(db, -1, -1)
+                await db.execute_fetchall(EVENT_BY_DATE_SQL, (0, today))
+        
+        async with self._reader() as db:
+            cursor = await db.execute(
+                """SELECT id, chat_id, date, message_id, capacity FROM events 
+                   WHERE date >= ? ORDER BY date LIMIT ?""",
+                (today, config.ROSTER_CACHE_SIZE)
+            )
+            events = [Event(*row) for row in await cursor.fetchall()]
+        for event in events:
+            await self.get_roster(event.id)
+        return events
+    
+    async def reconcile_rosters(self) -> int:
+        """
+        Сверка кэшированных составов и лимитов с базой; расходящиеся заменяются
+        прочитанными. Возвращает число исправленных составов
+        """
+        fixed = 0
+        for event_id in self._rosters.event_ids():
+            async with self._event_lock(event_id):
+                cached = self._rosters.get(event_id)
+                if cached is None:
+                    continue
+                async with self._lock, self.perf.stage("query"):
+                    actual = await self._load_roster(self._writer, event_id)
+                if (list(actual.members.items()) != list(cached.members.items())
+                        or list(actual.waiting.items()) != list(cached.waiting.items())
+                        or actual.capacity != cached.capacity):
+                    logger.warning(
+                        f"Roster cache of event {event_id} diverged from database: "
+                        f"{len(cached.members)}/{cached.capacity} cached, "
+                        f"{len(actual.members)}/{actual.capacity} stored"
+                    )
+                    self._rosters.put(event_id, actual)
+                    fixed += 1
+        return fixed
+    
+    async def get_roster(self, event_id: int) -> Roster:
+        """Состав события из кэша, при промахе — загрузка из базы"""
+        roster = self._rosters.get(event_id)
+        if roster is not None:
+            return roster
+        
+        # Загружаем под блокировками события и записи, чтобы не потерять
+        # параллельную запись ни поштучную, ни пакетную
+        async with self._event_lock(event_id):
+            roster = self._rosters.get(event_id)
+            if roster is None:
+                async with self._lock, self.perf.stage("query"):
+                    roster = await self._load_roster(self._writer, event_id)
+                self._rosters.put(event_id, roster)
+            return roster
+    
+    async def _load_roster(self, db: aiosqlite.Connection, event_id: int) -> Roster:
+        """Чтение состава события, его лимита и листа ожидания из базы"""
+        cursor = await db.execute("SELECT capacity FROM events WHERE id = ?", (event_id,))
+        row = await cursor.fetchone()
+        cursor = await db.execute(ROSTER_SQL, (event_id,))
+        members = await cursor.fetchall()
+        cursor = await db.execute(WAITLIST_SQL, (event_id,))
+        # У события в архиве лимита нет: состав показывается с лимитом по умолчанию
+        return Roster(members, row[0] if row else config.MAX_PARTICIPANTS, await cursor.fetchall())
+    
+    async def get_participants(self, event_id: int) -> List[Participant]:
+        """Получение списка участников события"""
+        roster = await self.get_roster(event_id)
+        return roster.rows()
+    
+    async def get_participant_count(self, event_id: int) -> int:
+        """Получение количества участников"""
+        roster = await self.get_roster(event_id)
+        return len(roster.members)
+    
+    async def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """
+        Захват или продление аренды name на ttl секунд. Аренда общая для всех
+        процессов с этой базой; True — аренда у owner до истечения срока
+        """
+        now = time.time()
+        async with self._lock, self.perf.stage("query"):
+            cursor = await self._execute_busy(self._writer, LEASE_SQL, (name, owner, now + ttl, now))
+            acquired = await cursor.fetchone()
+            await cursor.close()
+        return acquired is not None
+    
+    async def release_lease(self, name: str, owner: str):
+        """Освобождение аренды, чтобы другой процесс не ждал истечения срока"""
+        async with self._lock, self.perf.stage("query"):
+            await self._execute_busy(
+                self._writer, "DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner)
+            )
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup
+
+logger = logging.getLogger(__name__)
+
+# Функция, которая в момент отправки строит актуальный текст и клавиатуру
+RenderFunc = Callable[[], Awaitable[Tuple[str, InlineKeyboardMarkup]]]
+
+
+def message_fingerprint(text: str, keyboard: Optional[InlineKeyboardMarkup]) -> int:
+    """Отпечаток содержимого сообщения (Telegram обрезает пробелы по краям текста)"""
+    markup = keyboard.model_dump_json(exclude_none=True) if keyboard else ""
+    return hash((text.strip(), markup))
+
+
+class EditCoalescer:
+    """
+    Объединение правок одного сообщения во время всплеска нажатий.
+    Первая правка уходит сразу, все последующие в пределах окна
+    схлопываются в одну завершающую правку с последним состоянием.
+    Правка, не меняющая содержимое сообщения, не отправляется вовсе.
+    """
+
+    def __init__(self, bot: Bot, window: float, fingerprint_cache_size: int = 1024):
+        self.bot = bot
+        self.window = window
+        self._pending: Dict[Tuple[int, int], RenderFunc] = {}
+        self._tasks: Dict[Tuple[int, int], asyncio.Task] = {}
+        # Отпечаток последнего отправленного содержимого каждого сообщения
+        self._last_sent: "OrderedDict[Tuple[int, int], int]" = OrderedDict()
+        self._fingerprint_cache_size = fingerprint_cache_size
+        # Метрики
+        self.requested = 0
+        self.sent = 0
+        self.failed = 0
+        self.unchanged = 0
+
+    @property
+    def saved(self) -> int:
+        """Сколько правок схлопнуто с более поздними"""
+        return self.requested - self.sent - self.failed - self.unchanged - len(self._pending)
+
+    def _remember(self, key: Tuple[int, int], fingerprint: int):
+        self._last_sent[key] = fingerprint
+        self._last_sent.move_to_end(key)
+        while len(self._last_sent) > self._fingerprint_cache_size:
+            self._last_sent.popitem(last=False)
+
+    def seed(self, chat_id: int, message_id: int, text: Optional[str],
+             keyboard: Optional[InlineKeyboardMarkup]):
+        """Запомнить текущее содержимое сообщения, если оно ещё неизвестно"""
+        key = (chat_id, message_id)
+        if text is not None and key not in self._last_sent:
+            self._remember(key, message_fingerprint(text, keyboard))
+
+    def request(self, chat_id: int, message_id: int, render: RenderFunc):
+        """Запросить обновление сообщения; отправка произойдёт в фоне"""
+        key = (chat_id, message_id)
+        self.requested += 1
+        # Более новый запрос заменяет ещё не отправленный
+        self._pending[key] = render
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._flush_loop(key))
+
+    async def _flush_loop(self, key: Tuple[int, int]):
+        """Отправка правок сообщения не чаще одной за окно"""
+        try:
+            while key in self._pending:
+                render = self._pending.pop(key)
+                await self._send(key, render)
+                # Запросы, пришедшие за время окна, уйдут одной правкой
+                await asyncio.sleep(self.window)
+        finally:
+            self._tasks.pop(key, None)
+
+    async def _send(self, key: Tuple[int, int], render: RenderFunc):
+        chat_id, message_id = key
+        try:
+            text, keyboard = await render()
+            fingerprint = message_fingerprint(text, keyboard)
+            if self._last_sent.get(key) == fingerprint:
+                # Содержимое не изменилось, Telegram всё равно отклонит правку
+                self.unchanged += 1
+                return
+            
+            await self.bot.edit_message_text(
+                text=text,
+                chat_id=chat_id,
+                message_id=message_id,
+                reply_markup=keyboard
+            )
+            self.sent += 1
+            self._remember(key, fingerprint)
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                self.unchanged += 1
+                self._remember(key, fingerprint)
+            else:
+                self.failed += 1
+                logger.error(f"Failed to edit message {message_id} in {chat_id}: {e}")
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Failed to edit message {message_id} in {chat_id}: {e}")
+
+    async def close(self):
+        """Дождаться отправки всех отложенных правок"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "requested": self.requested,
+            "sent": self.sent,
+            "failed": self.failed,
+            "unchanged": self.unchanged,
+            "saved": self.saved,
+        }
@@ -0,0 +1,261 @@
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+import aiosqlite
+import config
+from database import ROSTER_SQL, WAITLIST_SQL, DatabaseManager
+from storage import Roster
+
+logger = logging.getLogger(__name__)
+
+# Операции журнала: запись в список (в том числе перевод из очереди),
+# постановка в лист ожидания и отказ из списка или очереди
+OP_JOIN = "join"
+OP_WAIT = "wait"
+OP_LEAVE = "leave"
+
+SNAPSHOT_SQL = "SELECT last_log_id, members, waiting FROM roster_snapshots WHERE event_id = ?"
+LOG_TAIL_SQL = """SELECT op, user_id, username, first_name, last_name
+    FROM participant_log WHERE event_id = ? AND id > ? ORDER BY id"""
+
+
+def replay(roster: Roster, ops) -> Roster:
+    """Применение операций журнала к составу по порядку"""
+    for op, user_id, username, first_name, last_name in ops:
+        if op == OP_JOIN:
+            roster.add(user_id, username, first_name, last_name)
+        elif op == OP_WAIT:
+            roster.wait(user_id, username, first_name, last_name)
+        else:
+            roster.remove(user_id)
+    return roster
+
+
+class EventLogManager(DatabaseManager):
+    """
+    Хранение составов журналом операций (DB_STORAGE=log).
+    Запись, очередь и отказ — одна дописываемая строка participant_log вместо
+    вставки, удаления и пересчёта в таблицах участников; решение о допуске
+    принимается по составу в памяти под блокировкой события. Каждые
+    EVENT_LOG_SNAPSHOT_EVERY операций события состав сохраняется снимком,
+    и при загрузке состав собирается из последнего снимка и хвоста журнала.
+    Журнал не сокращается: в нём остаётся, кто и когда записался и отказался
+    """
+
+    def __init__(self, db_path: Optional[str] = None, recorder=None,
+                 archive_path: Optional[str] = None, snapshot_every: Optional[int] = None):
+        # Дописывание строки уже дешевле пачки вставок, группировка не нужна
+        super().__init__(db_path, batch_writes=False, recorder=recorder, archive_path=archive_path)
+        self.snapshot_every = snapshot_every or config.EVENT_LOG_SNAPSHOT_EVERY
+        # Операций события после его последнего снимка
+        self._tail: Dict[int, int] = {}
+        # event_id -> (chat_id, дата) для уведомлений о переводе из очереди
+        self._event_meta: Dict[int, Tuple[int, str]] = {}
+        # Метрики
+        self.log_writes = 0
+        self.snapshots = 0
+
+    async def _load_roster(self, db: aiosqlite.Connection, event_id: int) -> Roster:
+        """Состав из последнего снимка и операций журнала после него"""
+        cursor = await db.execute("SELECT chat_id, date, capacity FROM events WHERE id = ?", (event_id,))
+        event = await cursor.fetchone()
+        cursor = await db.execute(SNAPSHOT_SQL, (event_id,))
+        snapshot = await cursor.fetchone()
+        # Событие в архиве или не существует: лимит 0 не пропускает записи
+        capacity = event[2] if event else 0
+        if snapshot is not None:
+            last_log_id, members, waiting = snapshot
+            roster = Roster(json.loads(members), capacity, json.loads(waiting))
+        else:
+            # Без снимка начинаем с таблиц: там составы, записанные до перехода на журнал
+            last_log_id = 0
+            cursor = await db.execute(ROSTER_SQL, (event_id,))
+            members = await cursor.fetchall()
+            cursor = await db.execute(WAITLIST_SQL, (event_id,))
+            roster = Roster(members, capacity, await cursor.fetchall())
+        cursor = await db.execute(LOG_TAIL_SQL, (event_id, last_log_id))
+        tail = await cursor.fetchall()
+        replay(roster, tail)
+        if event is not None:
+            self._tail[event_id] = len(tail)
+            self._event_meta[event_id] = (event[0], event[1])
+        return roster
+
+    async def _locked_roster(self, event_id: int) -> Roster:
+        """Состав для изменения; вызывающий держит блокировку события"""
+        roster = self._rosters.get(event_id)
+        if roster is None:
+            async with self._lock, self.perf.stage("query"):
+                roster = await self._load_roster(self._writer, event_id)
+            self._rosters.put(event_id, roster)
+        return roster
+
+    async def _insert_ops(self, db: aiosqlite.Connection, event_id: int, ops: List[Tuple]) -> int:
+        """Дописать операции одним оператором; возвращает id последней"""
+        cursor = await self._execute_busy(
+            db,
+            f"""INSERT INTO participant_log (event_id, op, user_id, username, first_name, last_name)
+                VALUES {','.join(['(?, ?, ?, ?, ?, ?)'] * len(ops))}""",
+            [value for op in ops for value in (event_id, *op)]
+        )
+        self.log_writes += 1
+        self._tail[event_id] = self._tail.get(event_id, 0) + len(ops)
+        return cursor.lastrowid
+
+    async def _commit(self, event_id: int, roster: Roster, ops: List[Tuple]):
+        """
+        Дописать операции и применить их к составу; вызывающий держит блокировку
+        записи, под которой save_chat меняет лимит и переводит из очереди.
+        Снимок пишется под той же блокировкой, поэтому совпадает с журналом до last_log_id
+        """
+        last_log_id = await self._insert_ops(self._writer, event_id, ops)
+        replay(roster, ops)
+        if self._tail[event_id] >= self.snapshot_every:
+            await self._execute_busy(
+                self._writer,
+                """INSERT OR REPLACE INTO roster_snapshots (event_id, last_log_id, members, waiting)
+                   VALUES (?, ?, ?, ?)""",
+                (event_id, last_log_id,
+                 json.dumps([(user_id, *names) for user_id, names in roster.members.items()],
+                            ensure_ascii=False),
+                 json.dumps([(user_id, *names) for user_id, names in roster.waiting.items()],
+                            ensure_ascii=False))
+            )
+            self._tail[event_id] = 0
+            self.snapshots += 1
+
+    async def add_participant(self, event_id: int, user_id: int, username: str,
+                              first_name: str, last_name: str) -> Tuple[bool, int]:
+        rejected = self._fast_admission(event_id, user_id)
+        if rejected is not None:
+            return rejected
+
+        async with self._event_lock(event_id):
+            roster = await self._locked_roster(event_id)
+            async with self._lock, self.perf.stage("query"):
+                rejected = roster.admission(user_id)
+                if rejected is not None:
+                    return rejected
+                await self._commit(event_id, roster, [(OP_JOIN, user_id, username, first_name, last_name)])
+                return True, len(roster.members)
+
+    async def remove_participant(self, event_id: int, user_id: int) -> bool:
+        async with self._event_lock(event_id):
+            roster = await self._locked_roster(event_id)
+            async with self._lock, self.perf.stage("query"):
+                if user_id not in roster.members and user_id not in roster.waiting:
+                    return False
+                ops = [(OP_LEAVE, user_id, None, None, None)]
+                heads = []
+                if user_id in roster.members:
+                    # Освободившееся место занимает первый из очереди той же вставкой
+                    free = roster.capacity - len(roster.members) + 1
+                    heads = list(roster.waiting.items())[:max(free, 0)]
+                    ops += [(OP_JOIN, waiting_id, *names) for waiting_id, names in heads]
+                await self._commit(event_id, roster, ops)
+        if heads:
+            chat_id, event_date = self._event_meta[event_id]
+            self._notify_promoted([(waiting_id, *names, chat_id, event_date) for waiting_id, names in heads])
+        return True
+
+    async def wait_for_seat(self, event_id: int, user_id: int, username: str,
+                            first_name: str, last_name: str) -> Tuple[bool, int]:
+        rejected = self._fast_wait(event_id, user_id)
+        if rejected is not None:
+            return rejected
+
+        async with self._event_lock(event_id):
+            roster = await self._locked_roster(event_id)
+            async with self._lock, self.perf.stage("query"):
+                if not roster.capacity:
+                    return False, 0
+                if user_id in roster.members:
+                    return True, list(roster.members).index(user_id) + 1
+                if user_id in roster.waiting:
+                    return False, roster.waiting_position(user_id)
+                if len(roster.members) < roster.capacity:
+                    await self._commit(event_id, roster, [(OP_JOIN, user_id, username, first_name, last_name)])
+                    return True, len(roster.members)
+                if len(roster.waiting) >= config.WAITLIST_MAX:
+                    return False, 0
+                await self._commit(event_id, roster, [(OP_WAIT, user_id, username, first_name, last_name)])
+                return False, len(roster.waiting)
+
+    async def _promote(self, db: aiosqlite.Connection, event_id: int) -> List[Tuple]:
+        """
+        Перевод из очереди после увеличения лимита (save_chat): операции дописываются
+        в журнал внутри транзакции save_chat, состав в кэше обновляет она же
+        """
+        cursor = await db.execute("SELECT capacity FROM events WHERE id = ?", (event_id,))
+        capacity = (await cursor.fetchone())[0]
+        roster = self._rosters.get(event_id)
+        if roster is None:
+            # Загруженный до дописывания состав save_chat дополнит переведёнными
+            roster = await self._load_roster(db, event_id)
+            self._rosters.put(event_id, roster)
+        heads = list(roster.waiting.items())[:max(capacity - len(roster.members), 0)]
+        if not heads:
+            return []
+        chat_id, event_date = self._event_meta[event_id]
+        await self._insert_ops(db, event_id, [(OP_JOIN, user_id, *names) for user_id, names in heads])
+        return [(user_id, *names, chat_id, event_date) for user_id, names in heads]
+
+    async def _archive_batch(self, db: aiosqlite.Connection, event_ids: List[int],
+                             orphans: bool = False):
+        """
+        Перед переносом составы из журнала записываются в таблицы участников,
+        откуда их копирует общий перенос; журнал событий пачки уходит в архив целиком.
+        Составы читаются из журнала, а не из кэша: событие мог вести другой обработчик
+        """
+        if event_ids:
+            rosters = {}
+            for event_id in event_ids:
+                rosters[event_id] = await self._load_roster(db, event_id)
+            try:
+                await self._execute_busy(db, "BEGIN IMMEDIATE")
+                for event_id, roster in rosters.items():
+                    await db.execute("DELETE FROM participants WHERE event_id = ?", (event_id,))
+                    await db.executemany(
+                        """INSERT INTO participants
+                           (event_id, user_id, username, first_name, last_name, join_seq)
+                           VALUES (?, ?, ?, ?, ?, ?)""",
+                        [(event_id, p.user_id, p.username, p.first_name, p.last_name, p.position)
+                         for p in roster.rows()]
+                    )
+                await db.execute("COMMIT")
+            except Exception:
+                if db.in_transaction:
+                    await db.execute("ROLLBACK")
+                raise
+
+        await super()._archive_batch(db, event_ids, orphans)
+
+        where, params = self._batch_filter(event_ids, orphans)
+        try:
+            await self._execute_busy(db, "BEGIN IMMEDIATE")
+            await db.execute(
+                f"""INSERT OR IGNORE INTO archive.participant_log
+                    (id, event_id, op, user_id, username, first_name, last_name, at)
+                    SELECT id, event_id, op, user_id, username, first_name, last_name, at
+                    FROM main.participant_log WHERE {where}""",
+                params
+            )
+            await db.execute(f"DELETE FROM main.participant_log WHERE {where}", params)
+            await db.execute(f"DELETE FROM main.roster_snapshots WHERE {where}", params)
+            await db.execute("COMMIT")
+        except Exception:
+            if db.in_transaction:
+                await db.execute("ROLLBACK")
+            raise
+        for event_id in event_ids:
+            self._tail.pop(event_id, None)
+            self._event_meta.pop(event_id, None)
+
+    async def get_event_history(self, limit: int, chat_id: Optional[int] = None) -> List[Tuple]:
+        """Число участников неархивных событий берётся из составов, а не из таблиц"""
+        history = []
+        for event_id, date, count, capacity, archived in await super().get_event_history(limit, chat_id):
+            if not archived:
+                count = len((await self.get_roster(event_id)).members)
+            history.append((event_id, date, count, capacity, archived))
+        return history
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Локальная замена Bot API для нагрузочных тестов без сети.
+Поддерживает getUpdates, answerCallbackQuery, editMessageText, sendMessage,
+pinChatMessage и getMe, настраиваемую задержку, ответы 429 и журнал запросов.
+
+Запуск нагрузки на бота в этом же процессе:
+    python fake_telegram.py --updates 5000 --rate 2000 --latency-ms 20 --error-rate 0.01
+Отдельный сервер (бот запускается с TELEGRAM_API_URL=http://127.0.0.1:8081):
+    python fake_telegram.py --serve --port 8081
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Dict, List, Optional
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+def callback_update(update_id: int, user_id: int, data: str, chat_id: int, message_id: int,
+                    text: str = "") -> dict:
+    """Обновление с нажатием кнопки; id callback-запроса равен str(update_id)"""
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+            "chat_instance": "fake",
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "supergroup"},
+                "text": text
+            }
+        }
+    }
+
+
+class FakeTelegramServer:
+    """Минимальный Bot API: обновления в очереди, ответы из памяти"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 retry_after: int = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        # Журнал запросов: (время, метод, параметры)
+        self.log: List[tuple] = []
+        self.errors_injected = 0
+        self._updates: List[dict] = []
+        self._next_update_id = 1
+        self._new_updates = asyncio.Event()
+        self._next_message_id = 1000
+        self._answered: Dict[str, float] = {}
+        self._answer_waiters: Dict[str, asyncio.Future] = {}
+
+    # --- управление из теста ---
+
+    def push_update(self, update: dict) -> int:
+        """Поставить обновление в очередь getUpdates; возвращает update_id"""
+        update = dict(update)
+        update_id = update.setdefault("update_id", self._next_update_id)
+        self._next_update_id = max(self._next_update_id, update_id + 1)
+        self._updates.append(update)
+        self._new_updates.set()
+        return update_id
+
+    def push_callback(self, user_id: int, data: str, chat_id: int, message_id: int,
+                      text: str = "") -> str:
+        """Синтетическое нажатие кнопки; возвращает id callback-запроса"""
+        update_id = self._next_update_id
+        self.push_update(callback_update(update_id, user_id, data, chat_id, message_id, text))
+        return str(update_id)
+
+    def answered_at(self, query_id: str) -> Optional[float]:
+        return self._answered.get(query_id)
+
+    async def wait_answered(self, query_id: str):
+        if query_id in self._answered:
+            return
+        future = self._answer_waiters.setdefault(
+            query_id, asyncio.get_running_loop().create_future()
+        )
+        await future
+
+    def method_counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for _, method, _ in self.log:
+            counts[method] = counts.get(method, 0) + 1
+        return counts
+
+    # --- HTTP ---
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        app.router.add_post("/__control/updates", self._control_updates)
+        app.router.add_get("/__control/log", self._control_log)
+        return app
+
+    async def _params(self, request: web.Request) -> dict:
+        if request.content_type == "application/json":
+            return await request.json()
+        params = {}
+        for key, value in (await request.post()).items():
+            try:
+                params[key] = json.loads(value)
+            except (TypeError, ValueError):
+                params[key] = value
+        return params
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await self._params(request)
+        self.log.append((time.perf_counter(), method, params))
+
+        if method == "getUpdates":
+            return self._ok(await self._get_updates(params))
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + random.random() * self.jitter)
+
+        if self.error_rate and method != "getMe" and random.random() < self.error_rate:
+            self.errors_injected += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after}
+            }, status=429)
+
+        handler = getattr(self, f"_method_{method}", None)
+        if handler is None:
+            return web.json_response(
+                {"ok": False, "error_code": 404, "description": "Not Found"}, status=404
+            )
+        return self._ok(handler(params))
+
+    def _ok(self, result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, params: dict) -> List[dict]:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        # Подтверждённые обновления удаляются, как в настоящем API
+        self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+
+    def _message(self, chat_id, message_id: int, text: str) -> dict:
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "supergroup"},
+            "text": text
+        }
+
+    def _method_getMe(self, params: dict) -> dict:
+        return {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+
+    def _method_sendMessage(self, params: dict) -> dict:
+        self._next_message_id += 1
+        return self._message(params["chat_id"], self._next_message_id, params.get("text", ""))
+
+    def _method_editMessageText(self, params: dict) -> dict:
+        return self._message(params["chat_id"], int(params["message_id"]), params.get("text", ""))
+
+    def _method_answerCallbackQuery(self, params: dict) -> bool:
+        query_id = str(params["callback_query_id"])
+        self._answered[query_id] = time.perf_counter()
+        future = self._answer_waiters.pop(query_id, None)
+        if future is not None and not future.done():
+            future.set_result(None)
+        return True
+
+    def _method_pinChatMessage(self, params: dict) -> bool:
+        return True
+
+    def _method_deleteWebhook(self, params: dict) -> bool:
+        return True
+
+    def _method_setWebhook(self, params: dict) -> bool:
+        return True
+
+    async def _control_updates(self, request: web.Request) -> web.Response:
+        """Постановка обновлений в очередь из другого процесса"""
+        payload = await request.json()
+        ids = [self.push_update(update) for update in payload.get("updates", [])]
+        return web.json_response({"update_ids": ids})
+
+    async def _control_log(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "log": [[t, method, params] for t, method, params in self.log],
+            "answered": self._answered,
+            "errors_injected": self.errors_injected
+        })
+
+
+async def start_server(server: FakeTelegramServer, host: str = "127.0.0.1",
+                       port: int = 0) -> tuple:
+    """Запуск сервера; возвращает (runner, базовый URL)"""
+    runner = web.AppRunner(server.app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{port}"
+
+
+async def drive_load(args):
+    """Бот в этом же процессе, направленный на локальный сервер, и поток нажатий"""
+    import config
+    config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), "fake_telegram.db")
+    import bot as bot_module
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    server = FakeTelegramServer(args.latency_ms / 1000, args.jitter_ms / 1000,
+                                args.error_rate, args.retry_after)
+    runner, base_url = await start_server(server)
+    bot_module.bot.session = bot_module.create_session(base_url)
+    await bot_module.db_manager.init_database()
+
+    # Событие с сообщением, как после еженедельной рассылки
+    await bot_module.send_weekly_list()
+    event_date = bot_module.get_next_sunday_date()
+    event = await bot_module.db_manager.get_event_by_date(event_date)
+    event_id, message_id = event.id, event.message_id
+    actions = ["join", "join", "leave", "refresh"]
+
+    polling = asyncio.create_task(
+        bot_module.dp.start_polling(bot_module.bot, handle_signals=False, polling_timeout=1)
+    )
+
+    sent_at: Dict[str, float] = {}
+    start = time.perf_counter()
+    batch = max(1, args.rate // 100)
+    for i in range(args.updates):
+        action = actions[i % len(actions)] if args.mixed else "join"
+        data = bot_module.EventCallback(action=action, event_id=event_id, date=event_date).pack()
+        query_id = server.push_callback(100 + i % args.users, data, config.CHAT_ID, message_id)
+        sent_at[query_id] = time.perf_counter()
+        if (i + 1) % batch == 0:
+            # Темп подачи: batch нажатий каждые 10 мс
+            await asyncio.sleep(max(0.0, start + (i + 1) / args.rate - time.perf_counter()))
+    fed = time.perf_counter() - start
+
+    await asyncio.wait_for(
+        asyncio.gather(*(server.wait_answered(q) for q in sent_at)), args.timeout
+    )
+    total = time.perf_counter() - start
+
+    await bot_module.dp.stop_polling()
+    await polling
+    await bot_module.edit_coalescer.close()
+
+    latencies = sorted(server.answered_at(q) - t for q, t in sent_at.items())
+    percentiles = statistics.quantiles(latencies, n=100)
+    print("🚀 НАГРУЗКА ЧЕРЕЗ ЛОКАЛЬНЫЙ BOT API")
+    print("=" * 60)
+    print(f"Нажатий: {args.updates}, подано за {fed:.2f} сек ({args.updates / fed:.0f}/сек)")
+    print(f"Обработано за {total:.2f} сек: {args.updates / total:.0f} нажатий/сек")
+    print(f"Задержка до ответа: p50 {percentiles[49] * 1000:.1f} мс, "
+          f"p95 {percentiles[94] * 1000:.1f} мс, p99 {percentiles[98] * 1000:.1f} мс, "
+          f"max {latencies[-1] * 1000:.1f} мс")
+    print(f"Ответов 429 выдано: {server.errors_injected}")
+    print(f"Запросы к API: {server.method_counts()}")
+    print(f"Правки: {bot_module.edit_coalescer.stats()}")
+
+    await bot_module.db_manager.close()
+    await bot_module.bot.session.close()
+    await runner.cleanup()
+
+
+async def serve(args):
+    server = FakeTelegramServer(args.latency_ms / 1000, args.jitter_ms / 1000,
+                                args.error_rate, args.retry_after)
+    runner, base_url = await start_server(server, args.host, args.port)
+    print(f"Fake Bot API listening on {base_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--serve", action="store_true", help="только запустить сервер")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--updates", type=int, default=5000, help="сколько нажатий подать")
+    parser.add_argument("--rate", type=int, default=2000, help="нажатий в секунду")
+    parser.add_argument("--users", type=int, default=1000, help="число разных пользователей")
+    parser.add_argument("--mixed", action="store_true", help="смесь записи, отказа и обновления")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="задержка ответа API")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="случайная добавка к задержке")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after в ответах 429")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    asyncio.run(serve(arguments) if arguments.serve else drive_load(arguments))
@@ -0,0 +1,76 @@
+import asyncio
+import logging
+from typing import Callable, Optional
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLease:
+    """
+    Лидерство среди обработчиков (RUN_MODE=workers) по аренде в общей базе.
+    Держатель продлевает аренду каждые ttl/3 секунд; если продлить не удалось,
+    лидерство сразу считается потерянным, чтобы два процесса не выполняли
+    задания одновременно. Остальные пытаются захватить аренду с тем же шагом
+    и получают её не позже чем через ttl после падения лидера
+    """
+
+    def __init__(self, storage: Storage, name: str, owner: str, ttl: float,
+                 on_acquired: Callable[[], None], on_lost: Callable[[], None]):
+        self.storage = storage
+        self.name = name
+        self.owner = owner
+        self.ttl = ttl
+        self.on_acquired = on_acquired
+        self.on_lost = on_lost
+        self.held = False
+        self._task: Optional[asyncio.Task] = None
+        # Метрики
+        self.acquired = 0
+        self.lost = 0
+
+    async def start(self):
+        """Первая попытка сразу, чтобы лидер начал работу вместе с процессом"""
+        await self._attempt()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Остановка и освобождение аренды: следующий лидер не ждёт её истечения"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.held:
+            self.held = False
+            self.on_lost()
+            try:
+                await self.storage.release_lease(self.name, self.owner)
+                logger.info(f"Lease {self.name} released by {self.owner}")
+            except Exception as e:
+                logger.warning(f"Failed to release lease {self.name}: {e}")
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            await self._attempt()
+
+    async def _attempt(self):
+        try:
+            held = await self.storage.acquire_lease(self.name, self.owner, self.ttl)
+        except Exception as e:
+            logger.error(f"Lease {self.name} renewal failed: {e}")
+            held = False
+        self._set_held(held)
+
+    def _set_held(self, held: bool):
+        if held == self.held:
+            return
+        self.held = held
+        if held:
+            self.acquired += 1
+            logger.info(f"Lease {self.name} acquired by {self.owner}")
+            self.on_acquired()
+        else:
+            self.lost += 1
+            logger.warning(f"Lease {self.name} lost by {self.owner}")
+            self.on_lost()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Задержка event loop и стоимость вызова logger.info в потоке loop во время всплеска нажатий:
+синхронные FileHandler + StreamHandler против QueueHandler/QueueListener
+"""
+
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import logging_setup
+
+UPDATES = 6000
+RATE = 3000  # Нажатий в секунду
+LINES_PER_UPDATE = 3  # Примерно столько пишут aiogram и обработчик на одно нажатие
+
+
+async def measure_lag(stop: asyncio.Event, lags: list, interval: float = 0.001):
+    """Насколько позже запланированного просыпается event loop"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+async def burst(logger: logging.Logger, call_times: list) -> float:
+    """Нажатия с постоянным темпом, каждый обработчик пишет несколько строк в лог"""
+
+    async def handle(update_id: int):
+        for line in range(LINES_PER_UPDATE):
+            start = time.perf_counter()
+            logger.info(f"Update id={update_id} step {line}: user {update_id % 97} joined")
+            call_times.append(time.perf_counter() - start)
+            await asyncio.sleep(0)
+
+    tasks = []
+    start = time.perf_counter()
+    for i in range(UPDATES):
+        tasks.append(asyncio.create_task(handle(i)))
+        if i % 30 == 29:
+            await asyncio.sleep(max(0.0, start + (i + 1) / RATE - time.perf_counter()))
+    await asyncio.gather(*tasks)
+    return time.perf_counter() - start
+
+
+async def run_case() -> tuple:
+    logger = logging.getLogger("burst")
+    lags: list = []
+    call_times: list = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(measure_lag(stop, lags))
+    await asyncio.sleep(0.05)
+    await burst(logger, call_times)
+    stop.set()
+    await monitor
+    return call_times, lags
+
+
+def report(name: str, call_times: list, lags: list):
+    lags = sorted(lags)
+    cuts = statistics.quantiles(lags, n=100, method="inclusive")
+    print(f"{name:<11} {statistics.fmean(call_times) * 1e6:<12.1f} {cuts[49] * 1000:<10.2f} "
+          f"{cuts[98] * 1000:<10.2f} {lags[-1] * 1000:<10.2f}")
+
+
+def reset_root():
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix="organizbot-logbench-")
+    # stdout процесса бота обычно уходит в pipe/файл хостинга; здесь — в файл
+    stdout_path = os.path.join(workdir, "stdout.log")
+
+    print("🚀 ЛОГИРОВАНИЕ И ЗАДЕРЖКА EVENT LOOP")
+    print("=" * 60)
+    print(f"{UPDATES} нажатий по {RATE}/сек, {LINES_PER_UPDATE} строки лога на нажатие")
+    print("мкс/вызов — время logger.info в потоке loop; p50/p99/max — задержка пробуждения loop")
+    print(f"{'Режим':<11} {'мкс/вызов':<12} {'p50, мс':<10} {'p99, мс':<10} {'max, мс':<10}")
+    print("-" * 60)
+
+    # Прежняя настройка run.py: запись в файл и поток прямо в event loop
+    stdout = open(stdout_path, "a", encoding="utf-8")
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[logging.FileHandler(os.path.join(workdir, "sync.log")),
+                  logging.StreamHandler(stdout)]
+    )
+    report("sync", *asyncio.run(run_case()))
+    reset_root()
+
+    for name, json_output in (("queue", False), ("queue+json", True)):
+        listener = logging_setup.setup_logging(
+            json_output=json_output,
+            handlers=[logging_setup.create_file_handler(os.path.join(workdir, f"{name}.log")),
+                      logging.StreamHandler(stdout)]
+        )
+        report(name, *asyncio.run(run_case()))
+        logging_setup.stop_logging(listener)
+        reset_root()
+
+    stdout.close()
+    print(f"\nЛоги: {workdir}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
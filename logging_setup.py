@@ -0,0 +1,89 @@
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from datetime import datetime, timezone
+from typing import List, Optional
+import config
+from perf import current_trace
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(update_id)s] %(message)s"
+
+
+class CorrelationFilter(logging.Filter):
+    """
+    Добавляет к записи id обновления, которое сейчас обрабатывается.
+    Работает в потоке, где вызван logger: контекст задачи доступен только там
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        trace = current_trace.get()
+        record.update_id = trace.update_id if trace is not None else "-"
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "update_id": getattr(record, "update_id", None),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def create_file_handler(path: str) -> logging.Handler:
+    """Файл с ротацией по времени (LOG_ROTATE_WHEN) или по размеру"""
+    if config.LOG_ROTATE_WHEN:
+        return logging.handlers.TimedRotatingFileHandler(
+            path, when=config.LOG_ROTATE_WHEN, backupCount=config.LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+    return logging.handlers.RotatingFileHandler(
+        path, maxBytes=config.LOG_MAX_BYTES, backupCount=config.LOG_BACKUP_COUNT, encoding="utf-8"
+    )
+
+
+def setup_logging(log_file: Optional[str] = None, level: Optional[str] = None,
+                  json_output: Optional[bool] = None,
+                  handlers: Optional[List[logging.Handler]] = None) -> logging.handlers.QueueListener:
+    """
+    Неблокирующее логирование: в event loop запись только кладётся в очередь,
+    форматирование и запись в файл и stdout выполняет поток QueueListener.
+    Возвращает запущенный listener; его нужно остановить через stop_logging
+    """
+    if json_output is None:
+        json_output = config.LOG_JSON
+    if handlers is None:
+        handlers = [create_file_handler(log_file or config.LOG_FILE),
+                    logging.StreamHandler(sys.stdout)]
+    formatter = JsonFormatter() if json_output else logging.Formatter(TEXT_FORMAT)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(CorrelationFilter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level or config.LOG_LEVEL)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def stop_logging(listener: logging.handlers.QueueListener):
+    """Дописать оставшиеся в очереди записи и закрыть файлы"""
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
@@ -0,0 +1,318 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+import config
+from storage import ChatSettings, Event, Participant, Roster
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryStorage:
+    """
+    Хранилище в памяти процесса (DB_STORAGE=memory): для тестов и бенчмарков,
+    а со снимками на диск — и для работы бота. Операции не уступают управление
+    event loop между проверкой и изменением состава, поэтому атомарны без блокировок.
+    Снимок — JSON всего состояния, который раз в snapshot_interval секунд
+    (и при закрытии) пишется во временный файл и заменяет предыдущий;
+    после сбоя теряются изменения с последнего снимка
+    """
+
+    def __init__(self, snapshot_path: Optional[str] = None, snapshot_interval: Optional[float] = None):
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval or config.MEMORY_SNAPSHOT_SECONDS
+        self._events: Dict[int, Event] = {}
+        self._by_date: Dict[Tuple[int, str], int] = {}
+        self._rosters: Dict[int, Roster] = {}
+        # Чат из config подключён с его расписанием, как после миграции SQLite;
+        # загруженный снимок заменяет эти настройки
+        self._chats: Dict[int, ChatSettings] = {config.CHAT_ID: ChatSettings(
+            config.CHAT_ID, config.SCHEDULE_DAY, config.SCHEDULE_HOUR, config.SCHEDULE_MINUTE,
+            config.MAX_PARTICIPANTS, config.PIN_MESSAGE, True
+        )}
+        # Архив: события и их участники в порядке записи
+        self._archived: Dict[int, Event] = {}
+        self._archived_participants: Dict[int, List[Tuple]] = {}
+        self._next_event_id = 1
+        # Аренды: name -> (owner, истекает); хранилище одного процесса, в снимок не попадают
+        self._leases: Dict[str, Tuple[str, float]] = {}
+        # Меняется при каждом изменении; снимок пишется, только если он устарел
+        self._changes = 0
+        self._saved_changes = 0
+        self._snapshot_task: Optional[asyncio.Task] = None
+        # Интерфейс Storage
+        self.fast_rejects = {"full": 0, "joined": 0}
+        self.on_promoted: Optional[Callable[[int, str, List[Tuple]], None]] = None
+        self.promoted_total = 0
+        self.snapshots = 0
+
+    async def init_database(self):
+        """Загрузка последнего снимка и запуск периодического сохранения"""
+        if self.snapshot_path and os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                self._restore(json.load(f))
+            logger.info(f"Memory storage restored from {self.snapshot_path}: {len(self._events)} events")
+        if self.snapshot_path and self._snapshot_task is None:
+            self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+
+    async def close(self):
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+            await asyncio.gather(self._snapshot_task, return_exceptions=True)
+            self._snapshot_task = None
+        if self.snapshot_path:
+            await self.save_snapshot()
+
+    def _changed(self):
+        self._changes += 1
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                await self.save_snapshot()
+            except Exception as e:
+                logger.error(f"Memory storage snapshot failed: {e}")
+
+    async def save_snapshot(self):
+        """Запись снимка: состояние копируется сразу, файл пишется в отдельном потоке"""
+        if self._changes == self._saved_changes and os.path.exists(self.snapshot_path):
+            return
+        changes = self._changes
+        state = self._dump()
+        await asyncio.get_running_loop().run_in_executor(None, self._write_snapshot, state)
+        self._saved_changes = changes
+        self.snapshots += 1
+
+    def _write_snapshot(self, state: dict):
+        temp_path = f"{self.snapshot_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        # Замена атомарна: после сбоя на диске старый или новый снимок целиком
+        os.replace(temp_path, self.snapshot_path)
+
+    def _dump(self) -> dict:
+        def event_row(event: Event) -> list:
+            return [event.id, event.chat_id, event.date, event.message_id, event.capacity]
+
+        return {
+            "next_event_id": self._next_event_id,
+            "chats": [list(settings) for settings in self._chats.values()],
+            "events": [event_row(event) for event in self._events.values()],
+            "rosters": {
+                event_id: {
+                    "members": [[user_id, *names] for user_id, names in roster.members.items()],
+                    "waiting": [[user_id, *names] for user_id, names in roster.waiting.items()],
+                }
+                for event_id, roster in self._rosters.items()
+            },
+            "archived": [event_row(event) for event in self._archived.values()],
+            "archived_participants": {
+                event_id: [list(row) for row in rows]
+                for event_id, rows in self._archived_participants.items()
+            },
+        }
+
+    def _restore(self, state: dict):
+        self._next_event_id = state["next_event_id"]
+        self._chats = {row[0]: ChatSettings(*row) for row in state["chats"]}
+        self._events = {row[0]: Event(*row) for row in state["events"]}
+        self._by_date = {(event.chat_id, event.date): event.id for event in self._events.values()}
+        self._rosters = {}
+        for event_id, event in self._events.items():
+            saved = state["rosters"].get(str(event_id), {"members": [], "waiting": []})
+            self._rosters[event_id] = Roster(saved["members"], event.capacity, saved["waiting"])
+        self._archived = {row[0]: Event(*row) for row in state["archived"]}
+        self._archived_participants = {
+            int(event_id): [tuple(row) for row in rows]
+            for event_id, rows in state["archived_participants"].items()
+        }
+        self._changes = self._saved_changes = 0
+
+    async def create_event(self, date: str, message_id: Optional[int],
+                           chat_id: Optional[int] = None, capacity: Optional[int] = None) -> int:
+        """Создание события; событие чата на ту же дату сохраняет id и состав, как в SQLite"""
+        if chat_id is None:
+            chat_id = config.CHAT_ID
+        if capacity is None:
+            settings = self._chats.get(chat_id)
+            capacity = settings.max_participants if settings else config.MAX_PARTICIPANTS
+        existing = self._by_date.get((chat_id, date))
+        if existing is not None:
+            event = self._events[existing]
+            event.message_id = message_id
+            if event.capacity != capacity:
+                event.capacity = capacity
+                roster = self._rosters[existing]
+                roster.set_capacity(capacity)
+                self._promote(event, roster)
+            self._changed()
+            return existing
+        event_id = self._next_event_id
+        self._next_event_id += 1
+        self._events[event_id] = Event(event_id, chat_id, date, message_id, capacity)
+        self._by_date[(chat_id, date)] = event_id
+        self._rosters[event_id] = Roster((), capacity)
+        self._changed()
+        return event_id
+
+    async def set_event_message(self, event_id: int, message_id: int):
+        event = self._events.get(event_id)
+        if event is not None:
+            event.message_id = message_id
+            self._changed()
+
+    async def get_event_by_date(self, date: str, chat_id: Optional[int] = None) -> Optional[Event]:
+        if chat_id is None:
+            chat_id = config.CHAT_ID
+        event_id = self._by_date.get((chat_id, date))
+        return self._events[event_id] if event_id is not None else None
+
+    async def get_chats(self) -> List[ChatSettings]:
+        return list(self._chats.values())
+
+    async def get_chat(self, chat_id: int) -> Optional[ChatSettings]:
+        return self._chats.get(chat_id)
+
+    async def save_chat(self, settings: ChatSettings):
+        """Новый лимит действует и для ещё не прошедших событий чата"""
+        self._chats[settings.chat_id] = settings
+        today = datetime.now().strftime('%Y-%m-%d')
+        for event in self._events.values():
+            if (event.chat_id == settings.chat_id and event.date >= today
+                    and event.capacity != settings.max_participants):
+                event.capacity = settings.max_participants
+                roster = self._rosters[event.id]
+                roster.set_capacity(settings.max_participants)
+                self._promote(event, roster)
+        self._changed()
+
+    def _promote(self, event: Event, roster: Roster):
+        """Перевод первых из листа ожидания на свободные места"""
+        free = roster.capacity - len(roster.members)
+        promoted = []
+        for user_id, names in list(roster.waiting.items())[:max(free, 0)]:
+            roster.add(user_id, *names)
+            promoted.append((user_id, *names))
+        if promoted:
+            self.promoted_total += len(promoted)
+            if self.on_promoted is not None:
+                self.on_promoted(event.chat_id, event.date, promoted)
+
+    async def add_participant(self, event_id: int, user_id: int, username: str,
+                              first_name: str, last_name: str) -> Tuple[bool, int]:
+        roster = self._rosters.get(event_id)
+        if roster is None:
+            # Событие в архиве или не существует
+            return False, -1
+        rejected = roster.admission(user_id)
+        if rejected is not None:
+            self.fast_rejects["joined" if rejected[1] > 0 else "full"] += 1
+            return rejected
+        roster.add(user_id, username, first_name, last_name)
+        self._changed()
+        return True, len(roster.members)
+
+    async def remove_participant(self, event_id: int, user_id: int) -> bool:
+        roster = self._rosters.get(event_id)
+        if roster is None or (user_id not in roster.members and user_id not in roster.waiting):
+            return False
+        was_member = user_id in roster.members
+        roster.remove(user_id)
+        if was_member:
+            self._promote(self._events[event_id], roster)
+        self._changed()
+        return True
+
+    async def wait_for_seat(self, event_id: int, user_id: int, username: str,
+                            first_name: str, last_name: str) -> Tuple[bool, int]:
+        roster = self._rosters.get(event_id)
+        if roster is None:
+            return False, 0
+        if user_id in roster.members:
+            return True, list(roster.members).index(user_id) + 1
+        if user_id in roster.waiting:
+            return False, roster.waiting_position(user_id)
+        if len(roster.members) < roster.capacity:
+            roster.add(user_id, username, first_name, last_name)
+            self._changed()
+            return True, len(roster.members)
+        if len(roster.waiting) >= config.WAITLIST_MAX:
+            return False, 0
+        roster.wait(user_id, username, first_name, last_name)
+        self._changed()
+        return False, len(roster.waiting)
+
+    async def get_roster(self, event_id: int) -> Roster:
+        roster = self._rosters.get(event_id)
+        # У события в архиве лимита нет: состав показывается пустым с лимитом по умолчанию
+        return roster if roster is not None else Roster()
+
+    async def get_participants(self, event_id: int) -> List[Participant]:
+        return (await self.get_roster(event_id)).rows()
+
+    async def get_participant_count(self, event_id: int) -> int:
+        return len((await self.get_roster(event_id)).members)
+
+    async def archive_events(self, before_date: str, batch_size: int) -> int:
+        """Перенос событий с датой раньше before_date в архив; очередь не сохраняется"""
+        past = [event for event in self._events.values() if event.date < before_date]
+        for event in past:
+            roster = self._rosters.pop(event.id)
+            del self._events[event.id]
+            del self._by_date[(event.chat_id, event.date)]
+            self._archived[event.id] = event
+            self._archived_participants[event.id] = [
+                (user_id, *names) for user_id, names in roster.members.items()
+            ]
+        if past:
+            self._changed()
+        return len(past)
+
+    async def compact(self):
+        """Места на диске хранилище не занимает; снимок переписывается целиком"""
+
+    async def get_event_history(self, limit: int, chat_id: Optional[int] = None) -> List[Tuple]:
+        """Последние события, включая архивные: (id, дата, число участников, лимит, в архиве ли)"""
+        history = [
+            (event.id, event.date, len(self._rosters[event.id].members), event.capacity, 0)
+            for event in self._events.values() if chat_id is None or event.chat_id == chat_id
+        ] + [
+            (event.id, event.date, len(self._archived_participants[event.id]), event.capacity, 1)
+            for event in self._archived.values() if chat_id is None or event.chat_id == chat_id
+        ]
+        history.sort(key=lambda entry: entry[1], reverse=True)
+        return history[:limit]
+
+    async def get_archived_participants(self, event_id: int) -> List[Participant]:
+        return [
+            Participant(*row, position)
+            for position, row in enumerate(self._archived_participants.get(event_id, ()), 1)
+        ]
+
+    async def warm_up(self, today: str) -> List[Event]:
+        """Составы и так в памяти; возвращает ещё не прошедшие события"""
+        events = sorted((event for event in self._events.values() if event.date >= today),
+                        key=lambda event: event.date)
+        return events[:config.ROSTER_CACHE_SIZE]
+
+    async def reconcile_rosters(self) -> int:
+        """Составы в памяти и есть хранилище: расходиться не с чем"""
+        return 0
+
+    async def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        holder = self._leases.get(name)
+        if holder is not None and holder[0] != owner and holder[1] >= now:
+            return False
+        self._leases[name] = (owner, now + ttl)
+        return True
+
+    async def release_lease(self, name: str, owner: str):
+        if self._leases.get(name, ("",))[0] == owner:
+            del self._leases[name]
@@ -0,0 +1,216 @@
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import GetUpdates, TelegramMethod
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MISSED, JobEvent
+from apscheduler.schedulers.base import BaseScheduler
+from chat_scheduler import ChatScheduler
+from edit_coalescer import EditCoalescer
+from perf import HISTOGRAM_BASE, HISTOGRAM_BINS, HISTOGRAM_GROWTH, PerfRecorder
+from rate_limiter import OutboundScheduler
+
+if TYPE_CHECKING:
+    # aiohttp.web загружается только при запуске HTTP-сервера метрик
+    from aiohttp import web
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PREFIX = "organizbot"
+
+# Границы корзин в экспорте: каждая четвёртая корзина гистограммы (рост в 2.44 раза)
+EXPORT_BUCKET_STEP = 4
+
+
+class HealthMonitor(BaseRequestMiddleware):
+    """
+    Состояние для проверок живости и готовности.
+    В режиме polling бот жив, пока getUpdates успешно возвращается не реже
+    stale_after секунд; в режиме webhook обновления приходят сами, и живость
+    означает лишь, что процесс отвечает
+    """
+
+    def __init__(self, stale_after: float):
+        self.stale_after = stale_after
+        self.started = time.time()
+        self.polling = True
+        self.ready = False
+        self.last_fetch: Optional[float] = None
+        self.fetch_errors = 0
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot,
+                       method: TelegramMethod):
+        if not isinstance(method, GetUpdates):
+            return await make_request(bot, method)
+        try:
+            result = await make_request(bot, method)
+        except Exception:
+            self.fetch_errors += 1
+            raise
+        self.last_fetch = time.time()
+        return result
+
+    def live(self) -> bool:
+        if not self.polling:
+            return True
+        # До первого ответа getUpdates отсчёт идёт от запуска
+        return time.time() - (self.last_fetch or self.started) <= self.stale_after
+
+    def is_ready(self) -> bool:
+        if not self.ready or not self.live():
+            return False
+        return not self.polling or self.last_fetch is not None
+
+
+class JobTracker:
+    """Итоги запусков заданий APScheduler"""
+
+    def __init__(self, scheduler: BaseScheduler):
+        self.scheduler = scheduler
+        # job_id -> {"success": .., "error": .., "missed": .., "last_success": ts}
+        self.jobs: Dict[str, Dict[str, float]] = {}
+        scheduler.add_listener(self._on_event, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
+
+    def _on_event(self, event: JobEvent):
+        job = self.jobs.setdefault(
+            event.job_id, {"success": 0, "error": 0, "missed": 0, "last_success": 0.0}
+        )
+        if event.code == EVENT_JOB_EXECUTED:
+            job["success"] += 1
+            job["last_success"] = time.time()
+        elif event.code == EVENT_JOB_ERROR:
+            job["error"] += 1
+        else:
+            job["missed"] += 1
+
+
+class MetricsCollector:
+    """Экспорт счётчиков и гистограмм бота в текстовом формате Prometheus"""
+
+    def __init__(self, recorder: PerfRecorder, edit_coalescer: EditCoalescer,
+                 outbound: OutboundScheduler, jobs: JobTracker, health: HealthMonitor,
+                 chat_scheduler: Optional[ChatScheduler] = None):
+        self.recorder = recorder
+        self.edit_coalescer = edit_coalescer
+        self.outbound = outbound
+        self.jobs = jobs
+        self.health = health
+        self.chat_scheduler = chat_scheduler
+
+    def render(self) -> str:
+        lines: List[str] = []
+
+        def metric(name: str, kind: str, help_text: str, samples: List[tuple]):
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+            for suffix, labels, value in samples:
+                label_text = ",".join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f"{PREFIX}_{name}{suffix}{{{label_text}}} {value}"
+                             if label_text else f"{PREFIX}_{name}{suffix} {value}")
+
+        totals = self.recorder.totals
+        metric("updates_handled_total", "counter", "Обработанные обновления",
+               [("", {}, totals["update"].count)])
+        metric("slow_updates_total", "counter", "Обновления дольше порога PERF_SLOW_UPDATE_MS",
+               [("", {}, self.recorder.slow_total)])
+
+        samples = []
+        for stage, histogram in totals.items():
+            cumulative = 0
+            for index, count in enumerate(histogram.counts):
+                cumulative += count
+                if index % EXPORT_BUCKET_STEP == 0 and index < HISTOGRAM_BINS - 1:
+                    bound = HISTOGRAM_BASE * HISTOGRAM_GROWTH ** index
+                    samples.append(("_bucket", {"stage": stage, "le": f"{bound:.6g}"}, cumulative))
+            samples.append(("_bucket", {"stage": stage, "le": "+Inf"}, histogram.count))
+            samples.append(("_sum", {"stage": stage}, f"{histogram.total:.6f}"))
+            samples.append(("_count", {"stage": stage}, histogram.count))
+        metric("stage_seconds", "histogram",
+               "Длительность стадий: update — обработка целиком, lock_wait — ожидание блокировок БД",
+               samples)
+
+        edits = self.edit_coalescer.stats()
+        metric("edits_total", "counter", "Правки сообщений со списком по исходу", [
+            ("", {"result": "sent"}, edits["sent"]),
+            ("", {"result": "unchanged"}, edits["unchanged"]),
+            ("", {"result": "coalesced"}, edits["saved"]),
+            ("", {"result": "failed"}, edits["failed"]),
+        ])
+
+        queue = self.outbound.stats()
+        metric("telegram_retry_after_total", "counter", "Ответы 429 от Bot API",
+               [("", {}, queue["retry_after"])])
+        metric("outbound_queue_depth", "gauge", "Запросы, ждущие лимита Bot API",
+               [("", {}, queue["queue_depth"])])
+
+        metric("scheduler_running", "gauge", "Работает ли планировщик",
+               [("", {}, int(self.jobs.scheduler.running))])
+        job_samples = []
+        for job in self.jobs.scheduler.get_jobs():
+            if job.next_run_time is not None:
+                job_samples.append(("", {"job": job.id}, f"{job.next_run_time.timestamp():.0f}"))
+        metric("scheduler_job_next_run_timestamp_seconds", "gauge",
+               "Время следующего запуска задания", job_samples)
+        run_samples, success_samples = [], []
+        for job_id, job in self.jobs.jobs.items():
+            for result in ("success", "error", "missed"):
+                run_samples.append(("", {"job": job_id, "result": result}, job[result]))
+            success_samples.append(("", {"job": job_id}, f"{job['last_success']:.0f}"))
+        metric("scheduler_job_runs_total", "counter", "Запуски заданий по исходу", run_samples)
+        metric("scheduler_job_last_success_timestamp_seconds", "gauge",
+               "Время последнего успешного запуска задания", success_samples)
+
+        if self.chat_scheduler is not None:
+            chats = self.chat_scheduler.stats()
+            metric("chat_schedules", "gauge", "Чаты с включённой еженедельной рассылкой",
+                   [("", {}, chats["chats"])])
+            metric("chat_lists_total", "counter", "Запуски еженедельной рассылки по исходу", [
+                ("", {"result": "fired"}, chats["fired"]),
+                ("", {"result": "error"}, chats["errors"]),
+            ])
+            metric("chat_next_due_timestamp_seconds", "gauge", "Ближайший запуск рассылки",
+                   [("", {}, f"{chats['next_due']:.0f}")])
+
+        startup = self.recorder.startup
+        metric("startup_phase_seconds", "gauge", "Длительность фаз запуска",
+               [("", {"phase": phase}, f"{seconds:.6f}") for phase, seconds in startup.phases.items()])
+        metric("first_update_seconds", "gauge", "От запуска процесса до первого обработанного обновления",
+               [("", {}, f"{startup.first_update:.6f}")] if startup.first_update is not None else [])
+
+        metric("polling_last_fetch_timestamp_seconds", "gauge", "Последний успешный getUpdates",
+               [("", {}, f"{self.health.last_fetch or 0:.0f}")])
+        metric("polling_fetch_errors_total", "counter", "Неудачные запросы getUpdates",
+               [("", {}, self.health.fetch_errors)])
+        metric("up", "gauge", "Проходит ли проверка живости", [("", {}, int(self.health.live()))])
+        return "\n".join(lines) + "\n"
+
+
+def add_routes(app: "web.Application", collector: MetricsCollector):
+    """/metrics, /healthz (живость) и /readyz (готовность) в aiohttp-приложении"""
+    from aiohttp import web
+    health = collector.health
+
+    async def metrics(request: "web.Request") -> "web.Response":
+        return web.Response(body=collector.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    async def healthz(request: "web.Request") -> "web.Response":
+        return web.Response(status=200 if health.live() else 503,
+                            text="ok" if health.live() else "stale")
+
+    async def readyz(request: "web.Request") -> "web.Response":
+        ready = health.is_ready()
+        return web.Response(status=200 if ready else 503, text="ready" if ready else "not ready")
+
+    app.router.add_get("/metrics", metrics)
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/readyz", readyz)
+
+
+async def run_metrics_server(collector: MetricsCollector, host: str, port: int) -> "web.AppRunner":
+    """Отдельный HTTP-сервер метрик (в режиме polling); возвращает runner для остановки"""
+    from aiohttp import web
+    app = web.Application()
+    add_routes(app, collector)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,326 @@
+import asyncio
+import contextvars
+import logging
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import AnswerCallbackQuery, EditMessageReplyMarkup, EditMessageText, TelegramMethod
+from aiogram.types import TelegramObject, Update
+
+logger = logging.getLogger(__name__)
+
+# Стадии обработки нажатия в порядке вывода; update — всё обновление целиком
+STAGES = ("update", "ack", "lock_wait", "query", "render", "edit", "answer")
+
+# Методы Bot API, время которых учитывается как отдельные стадии
+API_STAGES = {
+    AnswerCallbackQuery: "answer",
+    EditMessageText: "edit",
+    EditMessageReplyMarkup: "edit",
+}
+
+# Границы корзин гистограммы: от 50 мкс с шагом 25% (последняя — около 80 сек)
+HISTOGRAM_BASE = 50e-6
+HISTOGRAM_GROWTH = 1.25
+HISTOGRAM_BINS = 64
+_LOG_GROWTH = math.log(HISTOGRAM_GROWTH)
+
+
+class Histogram:
+    """Логарифмическая гистограмма длительностей: память не зависит от числа замеров"""
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * HISTOGRAM_BINS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        if seconds < HISTOGRAM_BASE:
+            index = 0
+        else:
+            index = min(HISTOGRAM_BINS - 1, int(math.log(seconds / HISTOGRAM_BASE) / _LOG_GROWTH) + 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other: "Histogram"):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q: float) -> float:
+        """Верхняя граница корзины, в которую попадает q-й перцентиль"""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.max, HISTOGRAM_BASE * HISTOGRAM_GROWTH ** index)
+        return self.max
+
+
+class UpdateTrace:
+    """Разбивка времени одного обновления по стадиям"""
+    __slots__ = ("update_id", "label", "start", "stages", "acked", "finished")
+
+    def __init__(self, update_id: int, label: str):
+        self.update_id = update_id
+        self.label = label
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.acked = False
+        self.finished = False
+
+    def breakdown(self) -> str:
+        return ", ".join(
+            f"{stage} {self.stages[stage] * 1000:.1f} ms"
+            for stage in STAGES if stage in self.stages and stage != "update"
+        )
+
+
+def process_started() -> float:
+    """
+    Момент запуска процесса по часам perf_counter: на Linux из /proc (точность 10 мс),
+    иначе момент импорта этого модуля
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            # Поля после имени процесса; starttime — 22-е поле, в тиках с загрузки системы
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        age = uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return _IMPORTED_AT
+    return time.perf_counter() - max(0.0, age)
+
+
+_IMPORTED_AT = time.perf_counter()
+
+
+class StartupTimer:
+    """Разбивка запуска по фазам и время от старта процесса до первого обработанного обновления"""
+
+    def __init__(self, started: Optional[float] = None):
+        self.started = started if started is not None else process_started()
+        self._last = self.started
+        self.phases: Dict[str, float] = {}
+        self.ready: Optional[float] = None
+        self.first_update: Optional[float] = None
+
+    def mark(self, phase: str):
+        """Фаза phase закончилась: время с конца предыдущей фазы"""
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    def finish(self):
+        """Бот готов принимать обновления"""
+        self.ready = time.perf_counter() - self.started
+        logger.info(f"Startup: {self.breakdown()}; ready after {self.ready * 1000:.0f} ms")
+
+    def update_handled(self):
+        if self.first_update is None:
+            self.first_update = time.perf_counter() - self.started
+            logger.info(f"First update handled {self.first_update * 1000:.0f} ms after process start")
+
+    def breakdown(self) -> str:
+        return ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in self.phases.items())
+
+
+# Обновление, обрабатываемое в текущей задаче (фоновые задачи наследуют его)
+current_trace: contextvars.ContextVar[Optional[UpdateTrace]] = contextvars.ContextVar(
+    "current_trace", default=None
+)
+
+
+class PerfRecorder:
+    """
+    Сбор длительностей стадий горячего пути.
+    Замеры складываются в поминутные гистограммы за последние window_minutes минут;
+    обновления дольше slow_threshold пишутся в лог с полной разбивкой
+    """
+
+    def __init__(self, window_minutes: int, slow_threshold: float, slow_log_size: int = 20):
+        self.window_minutes = window_minutes
+        self.slow_threshold = slow_threshold
+        # (номер минуты, гистограммы стадий)
+        self._minutes: Deque[Tuple[int, Dict[str, Histogram]]] = deque()
+        # Накопленные с запуска гистограммы (для экспорта метрик)
+        self.totals: Dict[str, Histogram] = {stage: Histogram() for stage in STAGES}
+        self.slow_total = 0
+        # Последние медленные обновления: (время, длительность, метка, разбивка)
+        self.slow_updates: Deque[Tuple[float, float, str, str]] = deque(maxlen=slow_log_size)
+        # Фазы запуска и время до первого обработанного обновления
+        self.startup = StartupTimer()
+
+    def _current(self) -> Dict[str, Histogram]:
+        minute = int(time.time() // 60)
+        if not self._minutes or self._minutes[-1][0] != minute:
+            self._minutes.append((minute, {stage: Histogram() for stage in STAGES}))
+            while self._minutes[0][0] <= minute - self.window_minutes:
+                self._minutes.popleft()
+        return self._minutes[-1][1]
+
+    def record(self, stage: str, seconds: float):
+        """Учесть замер стадии в гистограмме и в разбивке текущего обновления"""
+        self._current()[stage].add(seconds)
+        self.totals[stage].add(seconds)
+        trace = current_trace.get()
+        if trace is not None and not trace.finished:
+            trace.stages[stage] = trace.stages.get(stage, 0.0) + seconds
+
+    def stage(self, stage: str) -> "StageTimer":
+        """Замер блока кода: with recorder.stage("render"): ..."""
+        return StageTimer(self, stage)
+
+    def acked(self):
+        """Пользователь получил ответ на нажатие: время от начала обновления"""
+        trace = current_trace.get()
+        if trace is not None and not trace.acked:
+            trace.acked = True
+            self.record("ack", time.perf_counter() - trace.start)
+
+    def finish(self, trace: UpdateTrace):
+        total = time.perf_counter() - trace.start
+        self.record("update", total)
+        trace.finished = True
+        self.startup.update_handled()
+        if total >= self.slow_threshold:
+            self.slow_total += 1
+            breakdown = trace.breakdown()
+            self.slow_updates.append((time.time(), total, trace.label, breakdown))
+            logger.warning(
+                f"Slow update {trace.update_id} ({trace.label}): "
+                f"{total * 1000:.0f} ms — {breakdown or 'no stages recorded'}"
+            )
+
+    def summary(self, minutes: int) -> Dict[str, Histogram]:
+        """Гистограммы стадий за последние minutes минут"""
+        since = int(time.time() // 60) - minutes
+        merged = {stage: Histogram() for stage in STAGES}
+        for minute, histograms in self._minutes:
+            if minute > since:
+                for stage, histogram in histograms.items():
+                    merged[stage].merge(histogram)
+        return merged
+
+
+class StageTimer:
+    """Контекстный менеджер замера стадии; годится и для with, и для async with"""
+    __slots__ = ("recorder", "name", "start")
+
+    def __init__(self, recorder: PerfRecorder, name: str):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.record(self.name, time.perf_counter() - self.start)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc):
+        return self.__exit__(*exc)
+
+
+class TimedLock(asyncio.Lock):
+    """asyncio.Lock, учитывающий время ожидания захвата в стадии lock_wait"""
+
+    def __init__(self, recorder: PerfRecorder):
+        super().__init__()
+        self._recorder = recorder
+
+    async def acquire(self) -> bool:
+        if not self.locked():
+            await super().acquire()
+            self._recorder.record("lock_wait", 0.0)
+            return True
+        start = time.perf_counter()
+        await super().acquire()
+        self._recorder.record("lock_wait", time.perf_counter() - start)
+        return True
+
+
+class UpdateTimingMiddleware(BaseMiddleware):
+    """Внешний middleware диспетчера: открывает разбивку на время обработки обновления"""
+
+    def __init__(self, recorder: PerfRecorder):
+        self.recorder = recorder
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+        label = event.event_type
+        if event.callback_query is not None:
+            label = f"callback {event.callback_query.data}"
+        elif event.message is not None and event.message.text:
+            label = f"message {event.message.text.split()[0]}"
+        trace = UpdateTrace(event.update_id, label)
+        token = current_trace.set(trace)
+        try:
+            return await handler(event, data)
+        finally:
+            self.recorder.finish(trace)
+            current_trace.reset(token)
+
+
+class ApiTimingMiddleware(BaseRequestMiddleware):
+    """Middleware сессии: время ответов на нажатия и правок, включая ожидание в очереди"""
+
+    def __init__(self, recorder: PerfRecorder):
+        self.recorder = recorder
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot,
+                       method: TelegramMethod):
+        stage = API_STAGES.get(type(method))
+        if stage is None:
+            return await make_request(bot, method)
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            self.recorder.record(stage, time.perf_counter() - start)
+            if stage == "answer":
+                self.recorder.acked()
+
+
+def format_summary(recorder: PerfRecorder, minutes: int) -> List[str]:
+    """Строки отчёта /perf: перцентили стадий и последние медленные обновления"""
+    lines = [f"⏱ Стадии за {minutes} мин (мс): n / p50 / p95 / p99 / max"]
+    for stage, histogram in recorder.summary(minutes).items():
+        if not histogram.count:
+            continue
+        lines.append(
+            f"{stage}: {histogram.count} / {histogram.percentile(50) * 1000:.1f} / "
+            f"{histogram.percentile(95) * 1000:.1f} / {histogram.percentile(99) * 1000:.1f} / "
+            f"{histogram.max * 1000:.1f}"
+        )
+    if len(lines) == 1:
+        lines.append("Замеров нет")
+
+    since = time.time() - minutes * 60
+    slow = [entry for entry in recorder.slow_updates if entry[0] >= since]
+    if slow:
+        lines.append(f"\n🐢 Медленные обновления (порог {recorder.slow_threshold * 1000:.0f} мс): {len(slow)}")
+        for _, total, label, breakdown in slow[-5:]:
+            lines.append(f"{total * 1000:.0f} мс — {label}: {breakdown}")
+    return lines
@@ -0,0 +1,69 @@
+import asyncio
+import html
+import logging
+from typing import Dict, List, Tuple
+from aiogram import Bot
+
+logger = logging.getLogger(__name__)
+
+
+def mention(user_id: int, username: str, first_name: str, last_name: str) -> str:
+    """Упоминание пользователя в HTML-разметке: уведомляет его даже без username"""
+    if username:
+        return f"@{html.escape(username)}"
+    name = f"{first_name or ''} {last_name or ''}".strip() or f"User {user_id}"
+    return f'<a href="tg://user?id={user_id}">{html.escape(name)}</a>'
+
+
+class PromotionNotifier:
+    """
+    Уведомления о переводе из листа ожидания в список.
+    Переводы в одном чате на одно событие, случившиеся за окно,
+    объявляются одним сообщением с упоминаниями всех переведённых
+    """
+
+    def __init__(self, bot: Bot, window: float):
+        self.bot = bot
+        self.window = window
+        self._pending: Dict[Tuple[int, str], List[Tuple]] = {}
+        self._tasks: Dict[Tuple[int, str], asyncio.Task] = {}
+        # Метрики
+        self.promoted = 0
+        self.sent = 0
+        self.failed = 0
+
+    def add(self, chat_id: int, event_date: str, users: List[Tuple]):
+        """Запомнить переведённых (user_id, username, first_name, last_name); отправка в фоне"""
+        key = (chat_id, event_date)
+        self.promoted += len(users)
+        self._pending.setdefault(key, []).extend(users)
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._flush(key))
+
+    async def _flush(self, key: Tuple[int, str]):
+        chat_id, event_date = key
+        try:
+            while key in self._pending:
+                # Переводы, пришедшие за окно, попадут в это же сообщение
+                await asyncio.sleep(self.window)
+                users = self._pending.pop(key)
+                text = (
+                    f"🎉 Освободились места на {event_date}!\n"
+                    f"Из листа ожидания в список: {', '.join(mention(*user) for user in users)}"
+                )
+                try:
+                    await self.bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML")
+                    self.sent += 1
+                except Exception as e:
+                    self.failed += 1
+                    logger.error(f"Failed to announce promotions in {chat_id}: {e}")
+        finally:
+            self._tasks.pop(key, None)
+
+    async def close(self):
+        """Дождаться отправки всех уведомлений"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {"promoted": self.promoted, "sent": self.sent, "failed": self.failed}
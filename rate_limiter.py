@@ -0,0 +1,252 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from typing import Dict, List, Optional, Union
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    AnswerCallbackQuery,
+    EditMessageReplyMarkup,
+    EditMessageText,
+    GetMe,
+    PinChatMessage,
+    SendMessage,
+    TelegramMethod,
+)
+
+logger = logging.getLogger(__name__)
+
+# Классы приоритета: чем меньше число, тем раньше запрос получает токен
+PRIORITY_ANSWER = 0
+PRIORITY_EDIT = 1
+PRIORITY_SEND = 2
+PRIORITY_PIN = 3
+PRIORITY_PING = 4
+
+PRIORITY_NAMES = {
+    PRIORITY_ANSWER: "answer",
+    PRIORITY_EDIT: "edit",
+    PRIORITY_SEND: "send",
+    PRIORITY_PIN: "pin",
+    PRIORITY_PING: "ping",
+}
+
+# Методы, не перечисленные здесь (getUpdates, setWebhook...), идут в обход очереди
+METHOD_PRIORITIES = {
+    AnswerCallbackQuery: PRIORITY_ANSWER,
+    EditMessageText: PRIORITY_EDIT,
+    EditMessageReplyMarkup: PRIORITY_EDIT,
+    SendMessage: PRIORITY_SEND,
+    PinChatMessage: PRIORITY_PIN,
+    GetMe: PRIORITY_PING,
+}
+
+# Ответы на нажатия не считаются сообщениями: они не расходуют токены и ждут
+# только паузы своего класса после RetryAfter
+METERED_PRIORITIES = {PRIORITY_EDIT, PRIORITY_SEND, PRIORITY_PIN, PRIORITY_PING}
+CHAT_SCOPED_PRIORITIES = {PRIORITY_EDIT, PRIORITY_SEND, PRIORITY_PIN}
+
+
+class TokenBucket:
+    """Корзина токенов с возможностью паузы по RetryAfter"""
+    __slots__ = ("rate", "capacity", "tokens", "updated", "paused_until")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def ready_at(self, now: float) -> float:
+        """Момент, когда в корзине появится целый токен"""
+        self._refill(now)
+        ready = now if self.tokens >= 1 else now + (1 - self.tokens) / self.rate
+        return max(ready, self.paused_until)
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, until: float):
+        self.paused_until = max(self.paused_until, until)
+
+    def idle(self, now: float) -> bool:
+        """Корзина полна и не на паузе — её можно забыть"""
+        self._refill(now)
+        return self.tokens >= self.capacity and self.paused_until <= now
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """
+    Единая очередь исходящих запросов к Bot API.
+    Глобальная корзина и корзины по чатам, приоритеты (ответы на нажатия раньше
+    правок, правки раньше закрепов и пингов), RetryAfter ставит на паузу только
+    затронутую корзину: чат, а для методов без чата (ответы, пинги) — их класс.
+    Ответы на нажатия токенов не расходуют
+    """
+
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: float,
+                 max_retries: int = 3):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global: Optional[TokenBucket] = None
+        self._chats: Dict[Union[int, str], TokenBucket] = {}
+        # Пауза по RetryAfter для методов без чата: приоритет -> до какого момента
+        self._paused: Dict[int, float] = {}
+        # Ожидающие: [приоритет, порядковый номер, chat_id, future]
+        self._waiters: List[list] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._pump_task: Optional[asyncio.Task] = None
+        # Метрики
+        self.granted: Dict[str, int] = {name: 0 for name in PRIORITY_NAMES.values()}
+        self.wait_total: Dict[str, float] = {name: 0.0 for name in PRIORITY_NAMES.values()}
+        self.wait_max: Dict[str, float] = {name: 0.0 for name in PRIORITY_NAMES.values()}
+        self.retry_after = 0
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot,
+                       method: TelegramMethod):
+        priority = METHOD_PRIORITIES.get(type(method))
+        if priority is None:
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, "chat_id", None) if priority in CHAT_SCOPED_PRIORITIES else None
+        attempt = 0
+        while True:
+            await self._acquire(priority, chat_id)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.retry_after += 1
+                loop_time = asyncio.get_running_loop().time()
+                if chat_id is not None:
+                    self._chat_bucket(chat_id, loop_time).pause(loop_time + e.retry_after)
+                else:
+                    # Глобальная пауза остановила бы правки и рассылку всех чатов
+                    self._paused[priority] = max(self._paused.get(priority, 0.0),
+                                                 loop_time + e.retry_after)
+                logger.warning(
+                    f"RetryAfter {e.retry_after}s for {type(method).__name__} "
+                    f"({f'chat {chat_id}' if chat_id is not None else PRIORITY_NAMES[priority] + ' requests'})"
+                )
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+
+    def _chat_bucket(self, chat_id: Union[int, str], now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= 1024:
+                # Забываем простаивающие корзины, чтобы словарь не рос бесконечно
+                for key in [key for key, b in self._chats.items() if b.idle(now)]:
+                    del self._chats[key]
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+        return bucket
+
+    async def _acquire(self, priority: int, chat_id: Optional[Union[int, str]]):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if self._global is None:
+            self._global = TokenBucket(self.global_rate, self.global_rate, now)
+            self._wakeup = asyncio.Event()
+
+        entry = [priority, next(self._seq), chat_id, None]
+        # Быстрый путь: очереди нет и токены есть
+        if not self._waiters and self._ready_at(entry, now) <= now:
+            self._take(entry, now)
+            self._record(priority, 0.0)
+            return
+
+        future = entry[3] = loop.create_future()
+        heapq.heappush(self._waiters, entry)
+        self._wakeup.set()
+        if self._pump_task is None:
+            self._pump_task = asyncio.create_task(self._pump())
+        await future
+        self._record(priority, loop.time() - now)
+
+    def _record(self, priority: int, waited: float):
+        name = PRIORITY_NAMES[priority]
+        self.granted[name] += 1
+        self.wait_total[name] += waited
+        self.wait_max[name] = max(self.wait_max[name], waited)
+
+    def _ready_at(self, entry: list, now: float) -> float:
+        """Момент, когда запрос можно отправить с учётом всех его корзин"""
+        priority, _, chat_id, _ = entry
+        if priority in METERED_PRIORITIES:
+            ready = self._global.ready_at(now)
+        else:
+            ready = now
+        if chat_id is not None:
+            ready = max(ready, self._chat_bucket(chat_id, now).ready_at(now))
+        return max(ready, self._paused.get(priority, 0.0))
+
+    def _take(self, entry: list, now: float):
+        priority, _, chat_id, _ = entry
+        if priority in METERED_PRIORITIES:
+            self._global.take(now)
+        if chat_id is not None:
+            self._chat_bucket(chat_id, now).take(now)
+
+    async def _pump(self):
+        """Выдача токенов ожидающим в порядке приоритета"""
+        loop = asyncio.get_running_loop()
+        try:
+            while self._waiters:
+                self._wakeup.clear()
+                now = loop.time()
+                if self._grant_next(now):
+                    continue
+                if not self._waiters:
+                    break
+                next_time = min(self._ready_at(entry, now) for entry in self._waiters)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), max(next_time - now, 0))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._pump_task = None
+
+    def _grant_next(self, now: float) -> bool:
+        """Пропустить самый приоритетный запрос, чьи корзины готовы"""
+        blocked = []
+        granted = False
+        while self._waiters:
+            entry = heapq.heappop(self._waiters)
+            if entry[3].done():
+                continue
+            if self._ready_at(entry, now) > now:
+                # Чат на паузе или лимит исчерпан — не задерживаем остальных
+                blocked.append(entry)
+                continue
+            self._take(entry, now)
+            entry[3].set_result(None)
+            granted = True
+            break
+        for entry in blocked:
+            heapq.heappush(self._waiters, entry)
+        return granted
+
+    def stats(self) -> Dict[str, object]:
+        """Глубина очереди, число выданных токенов и время ожидания по классам"""
+        return {
+            "queue_depth": len(self._waiters),
+            "granted": dict(self.granted),
+            "wait_avg": {
+                name: (self.wait_total[name] / self.granted[name]) if self.granted[name] else 0.0
+                for name in self.granted
+            },
+            "wait_max": dict(self.wait_max),
+            "retry_after": self.retry_after,
+        }
@@ -0,0 +1,25 @@
+"""
+Разбиение обновлений между обработчиками (RUN_MODE=workers).
+Модуль без зависимостей: его импортирует bot.py в любом режиме,
+а aiohttp.web маршрутизатора (workers.py) нужен только в режиме workers
+"""
+
+
+def worker_for(key: int, workers: int) -> int:
+    """Номер обработчика для ключа разбиения"""
+    return key % workers
+
+
+def partition_key(update: dict) -> int:
+    """
+    Ключ разбиения обновления — id чата. Нажатия кнопок списка и команды чата
+    (/capacity, /schedule) попадают в один процесс: новый лимит сразу доходит
+    до кэша составов, по которому отвечают нажатия
+    """
+    payload = next((value for key, value in update.items()
+                    if key != "update_id" and isinstance(value, dict)), {})
+    chat = payload.get("chat") or (payload.get("message") or {}).get("chat")
+    if chat is not None:
+        return int(chat["id"])
+    # Личные обновления без чата (inline-кнопки) — по пользователю
+    return int((payload.get("from") or {}).get("id", 0))
@@ -6,28 +6,35 @@
 import asyncio
 import sys
 import logging
-from bot import main
-
-def setup_logging():
-    """Настройка логирования"""
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler('bot.log'),
-            logging.StreamHandler(sys.stdout)
-        ]
-    )
+import config
+from logging_setup import setup_logging, stop_logging
 
 if __name__ == "__main__":
-    setup_logging()
+    # Запись в файл и stdout идёт в отдельном потоке и не тормозит event loop
+    listener = setup_logging()
     logger = logging.getLogger(__name__)
     
+    # Режим можно передать аргументом: python run.py webhook
+    # (worker — процесс-обработчик, его запускает маршрутизатор режима workers)
+    mode = sys.argv[1] if len(sys.argv) > 1 else config.RUN_MODE
+    if mode not in ("polling", "webhook", "workers", "worker"):
+        logger.error(f"Unknown run mode: {mode}")
+        stop_logging(listener)
+        sys.exit(1)
+    
     try:
-        logger.info("Starting Telegram Bot...")
-        asyncio.run(main())
+        logger.info(f"Starting Telegram Bot ({mode})...")
+        if mode == "workers":
+            # Маршрутизатору не нужен ни aiogram, ни база: бот работает в обработчиках
+            from workers import run_workers
+            asyncio.run(run_workers())
+        else:
+            from bot import main
+            asyncio.run(main(mode))
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
     except Exception as e:
         logger.error(f"Fatal error: {e}")
-        sys.exit(1) 
\ No newline at end of file
+        sys.exit(1)
+    finally:
+        stop_logging(listener) 
\ No newline at end of file
@@ -0,0 +1,207 @@
+import itertools
+import os
+from typing import Callable, Dict, List, NamedTuple, Optional, Protocol, Tuple
+import config
+
+# Версии составов уникальны в пределах процесса: перезагруженный после
+# вытеснения состав никогда не совпадёт по версии с устаревшим
+_roster_versions = itertools.count(1)
+
+
+class ChatSettings(NamedTuple):
+    """Настройки чата: расписание рассылки и лимит участников"""
+    chat_id: int
+    schedule_day: int
+    schedule_hour: int
+    schedule_minute: int
+    max_participants: int
+    pin_message: bool
+    enabled: bool
+
+
+class Event:
+    """Событие чата: список участников на одну дату"""
+    __slots__ = ("id", "chat_id", "date", "message_id", "capacity")
+
+    def __init__(self, id: int, chat_id: int, date: str, message_id: Optional[int], capacity: int):
+        self.id = id
+        self.chat_id = chat_id
+        self.date = date
+        self.message_id = message_id
+        self.capacity = capacity
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Event) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    def __repr__(self) -> str:
+        return f"Event(id={self.id}, chat_id={self.chat_id}, date={self.date!r}, " \
+               f"message_id={self.message_id}, capacity={self.capacity})"
+
+
+class Participant:
+    """Участник события или стоящий в очереди; position — место в списке или очереди"""
+    __slots__ = ("user_id", "username", "first_name", "last_name", "position")
+
+    def __init__(self, user_id: int, username: str, first_name: str, last_name: str, position: int):
+        self.user_id = user_id
+        self.username = username
+        self.first_name = first_name
+        self.last_name = last_name
+        self.position = position
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Participant) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    def __repr__(self) -> str:
+        return f"Participant(user_id={self.user_id}, username={self.username!r}, " \
+               f"position={self.position})"
+
+
+class Roster:
+    """Состав участников события в порядке записи и лист ожидания"""
+    __slots__ = ("members", "waiting", "version", "capacity")
+
+    def __init__(self, rows=(), capacity: int = config.MAX_PARTICIPANTS, waiting=()):
+        self.capacity = capacity
+        # user_id -> (username, first_name, last_name); порядок словаря = порядок записи
+        self.members: Dict[int, Tuple[str, str, str]] = {
+            user_id: (username, first_name, last_name)
+            for user_id, username, first_name, last_name in rows
+        }
+        # Лист ожидания в том же формате; порядок словаря = порядок очереди
+        self.waiting: Dict[int, Tuple[str, str, str]] = {
+            user_id: (username, first_name, last_name)
+            for user_id, username, first_name, last_name in waiting
+        }
+        # Меняется при каждом изменении состава
+        self.version = next(_roster_versions)
+
+    def add(self, user_id: int, username: str, first_name: str, last_name: str):
+        self.waiting.pop(user_id, None)
+        self.members[user_id] = (username, first_name, last_name)
+        self.version = next(_roster_versions)
+
+    def wait(self, user_id: int, username: str, first_name: str, last_name: str):
+        self.waiting[user_id] = (username, first_name, last_name)
+        self.version = next(_roster_versions)
+
+    def remove(self, user_id: int):
+        """Удаление из списка или из листа ожидания"""
+        if (self.members.pop(user_id, None) or self.waiting.pop(user_id, None)) is not None:
+            self.version = next(_roster_versions)
+
+    def waiting_position(self, user_id: int) -> int:
+        """Место в листе ожидания (0, если пользователя в нём нет)"""
+        if user_id not in self.waiting:
+            return 0
+        return list(self.waiting).index(user_id) + 1
+
+    def admission(self, user_id: int) -> Optional[Tuple[bool, int]]:
+        """
+        Ответ на запись без обращения к хранилищу, если он уже известен:
+        (False, позиция) для записанного, (False, -1) для полного списка, иначе None
+        """
+        if user_id in self.members:
+            return False, list(self.members).index(user_id) + 1
+        if len(self.members) >= self.capacity:
+            return False, -1
+        return None
+
+    def set_capacity(self, capacity: int):
+        self.capacity = capacity
+        self.version = next(_roster_versions)
+
+    def rows(self) -> List[Participant]:
+        """Участники в порядке записи"""
+        return [
+            Participant(user_id, username, first_name, last_name, position)
+            for position, (user_id, (username, first_name, last_name))
+            in enumerate(self.members.items(), 1)
+        ]
+
+    def waiting_rows(self) -> List[Participant]:
+        """Лист ожидания, позиция — место в очереди"""
+        return [
+            Participant(user_id, username, first_name, last_name, position)
+            for position, (user_id, (username, first_name, last_name))
+            in enumerate(self.waiting.items(), 1)
+        ]
+
+
+class Storage(Protocol):
+    """
+    Хранилище событий, составов и настроек чатов, с которым работает бот.
+    Реализации: DatabaseManager (SQLite), EventLogManager (SQLite, журнал операций),
+    MemoryStorage (в памяти, со снимками на диск). Все проходят test_storage.py
+    """
+    # Отказы в записи без обращения к хранилищу: {"full": .., "joined": ..}
+    fast_rejects: Dict[str, int]
+    # on_promoted(chat_id, дата события, [(user_id, username, first_name, last_name), ...])
+    on_promoted: Optional[Callable[[int, str, List[Tuple]], None]]
+    promoted_total: int
+
+    async def init_database(self): ...
+
+    async def close(self): ...
+
+    async def create_event(self, date: str, message_id: Optional[int],
+                           chat_id: Optional[int] = None, capacity: Optional[int] = None) -> int: ...
+
+    async def set_event_message(self, event_id: int, message_id: int): ...
+
+    async def get_event_by_date(self, date: str, chat_id: Optional[int] = None) -> Optional[Event]: ...
+
+    async def get_chats(self) -> List[ChatSettings]: ...
+
+    async def get_chat(self, chat_id: int) -> Optional[ChatSettings]: ...
+
+    async def save_chat(self, settings: ChatSettings): ...
+
+    async def add_participant(self, event_id: int, user_id: int, username: str,
+                              first_name: str, last_name: str) -> Tuple[bool, int]: ...
+
+    async def remove_participant(self, event_id: int, user_id: int) -> bool: ...
+
+    async def wait_for_seat(self, event_id: int, user_id: int, username: str,
+                            first_name: str, last_name: str) -> Tuple[bool, int]: ...
+
+    async def get_roster(self, event_id: int) -> Roster: ...
+
+    async def get_participants(self, event_id: int) -> List[Participant]: ...
+
+    async def get_participant_count(self, event_id: int) -> int: ...
+
+    async def archive_events(self, before_date: str, batch_size: int) -> int: ...
+
+    async def compact(self): ...
+
+    async def get_event_history(self, limit: int, chat_id: Optional[int] = None) -> List[Tuple]: ...
+
+    async def get_archived_participants(self, event_id: int) -> List[Participant]: ...
+
+    async def warm_up(self, today: str) -> List[Event]: ...
+
+    async def reconcile_rosters(self) -> int: ...
+
+    # Аренда name на ttl секунд для owner (лидерство среди обработчиков, см. leader.py)
+    async def acquire_lease(self, name: str, owner: str, ttl: float) -> bool: ...
+
+    async def release_lease(self, name: str, owner: str): ...
+
+
+def create_storage(recorder=None) -> Storage:
+    """Хранилище, выбранное DB_STORAGE"""
+    # Реализации импортируются по выбору: database и event_log сами импортируют этот модуль
+    if config.DB_STORAGE == "memory":
+        from memory_storage import MemoryStorage
+        return MemoryStorage(config.MEMORY_SNAPSHOT_PATH
+                             or os.path.splitext(config.DATABASE_PATH)[0] + ".json")
+    if config.DB_STORAGE == "log":
+        from event_log import EventLogManager
+        return EventLogManager(recorder=recorder)
+    from database import DatabaseManager
+    return DatabaseManager(recorder=recorder)
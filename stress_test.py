@@ -4,13 +4,17 @@
 """
 
 import asyncio
+import os
+import tempfile
 import time
 from database import DatabaseManager
 import config
 
 class StressTest:
-    def __init__(self):
-        self.db_manager = DatabaseManager()
+    def __init__(self, batch_writes: bool = False):
+        # Временная база: тестовые события не попадают в рабочую participants.db
+        db_path = os.path.join(tempfile.mkdtemp(), "stress_test.db")
+        self.db_manager = DatabaseManager(db_path=db_path, batch_writes=batch_writes)
         
     async def setup(self):
         """Инициализация тестовой среды"""
@@ -114,7 +118,7 @@ class StressTest:
         else:
             print("   ⚠️  ПРЕВЫШЕН ЛИМИТ!")
         
-        user_ids = [p[0] for p in participants]
+        user_ids = [p.user_id for p in participants]
         if len(set(user_ids)) == len(user_ids):
             print("   ✅ Нет дублирования")
         else:
@@ -129,17 +133,11 @@ class StressTest:
             'db_records': count
         }
 
-async def main():
-    """Основная функция стресс-тестирования"""
-    test = StressTest()
+async def run_loads(test_loads, batch_writes: bool):
+    """Прогон всех нагрузок в одном режиме записи"""
+    test = StressTest(batch_writes=batch_writes)
     results_summary = []
     
-    # Тестируемые нагрузки
-    test_loads = [50, 100, 200, 500, 1000]
-    
-    print("🚀 ЗАПУСК СТРЕСС-ТЕСТИРОВАНИЯ TELEGRAM БОТА")
-    print("=" * 60)
-    
     for num_users in test_loads:
         try:
             # Новое событие для каждого теста
@@ -160,6 +158,22 @@ async def main():
             print(f"❌ Ошибка в тесте с {num_users} пользователей: {e}")
             continue
     
+    await test.db_manager.close()
+    return results_summary
+
+async def main():
+    """Основная функция стресс-тестирования"""
+    # Тестируемые нагрузки
+    test_loads = [50, 100, 200, 500, 1000]
+    
+    print("🚀 ЗАПУСК СТРЕСС-ТЕСТИРОВАНИЯ TELEGRAM БОТА")
+    print("=" * 60)
+    
+    results_summary = await run_loads(test_loads, batch_writes=False)
+    
+    print("\n📦 ГРУППОВАЯ ФИКСАЦИЯ ЗАПИСЕЙ")
+    batched_summary = await run_loads(test_loads, batch_writes=True)
+    
     # Итоговый отчет
     print("\n" + "=" * 60)
     print("📈 ИТОГОВЫЙ ОТЧЕТ ПРОИЗВОДИТЕЛЬНОСТИ")
@@ -186,6 +200,13 @@ async def main():
     print(f"   Максимальная скорость: {max_rps:.1f} запросов/сек")
     print(f"   Лимит участников: {config.MAX_PARTICIPANTS}")
     
+    print(f"\n📦 Поштучная фиксация против групповой (окно {config.DB_BATCH_WINDOW_MS} мс, "
+          f"пачка до {config.DB_BATCH_MAX_SIZE}):")
+    print(f"{'Пользователи':<12} {'Запр/сек':<10} {'Пакетно':<10}")
+    for single, batched in zip(results_summary, batched_summary):
+        print(f"{single['users']:<12} {single['requests_per_sec']:<10.1f} "
+              f"{batched['requests_per_sec']:<10.1f}")
+    
     if max_successful_load >= 100:
         print("   ✅ Бот отлично справляется с высокой нагрузкой!")
     elif max_successful_load >= 50:
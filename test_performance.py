@@ -5,20 +5,54 @@
 """
 
 import asyncio
+import os
+import sys
+import tempfile
 import time
-from database import DatabaseManager
+from datetime import datetime
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import AnswerCallbackQuery, EditMessageText
+from chat_scheduler import ChatScheduler, next_fire_time
+from database import (DatabaseManager, EVENT_BY_DATE_SQL, JOIN_SQL, LEAVE_SQL,
+                      POSITION_SQL, ROSTER_SQL, WAIT_POSITION_SQL, WAIT_SQL, WAITLIST_HEAD_SQL,
+                      WAITLIST_SQL)
+from event_log import LOG_TAIL_SQL, SNAPSHOT_SQL, EventLogManager
+from leader import LeaderLease
+from rate_limiter import OutboundScheduler
+from storage import ChatSettings
+from routing import partition_key, worker_for
 import config
 
+# Запросы горячего пути: ни один не должен сканировать таблицу целиком
+# или сортировать во временном B-дереве
+QUERY_PLAN_CHECKS = [
+    ("Чтение состава", ROSTER_SQL, (1,)),
+    ("Запись", JOIN_SQL, (1, 1, "user", "User", "1", 1, 1)),
+    ("Позиция участника", POSITION_SQL, (1, 1)),
+    ("Отказ", LEAVE_SQL, (1, 1)),
+    ("Событие по дате", EVENT_BY_DATE_SQL, (config.CHAT_ID, "2024-01-01")),
+    ("Лист ожидания", WAITLIST_SQL, (1,)),
+    ("Постановка в очередь", WAIT_SQL, (1, 1, "user", "User", "1", 1, config.WAITLIST_MAX)),
+    ("Место в очереди", WAIT_POSITION_SQL, (1, 1)),
+    ("Голова очереди", WAITLIST_HEAD_SQL, (1,)),
+    ("Снимок состава", SNAPSHOT_SQL, (1,)),
+    ("Хвост журнала", LOG_TAIL_SQL, (1, 0)),
+]
+
 class PerformanceTest:
     def __init__(self):
-        self.db_manager = DatabaseManager()
+        # Временная база: прогоны не влияют ни на рабочую базу, ни друг на друга
+        db_path = os.path.join(tempfile.mkdtemp(), "test_performance.db")
+        self.db_manager = DatabaseManager(db_path=db_path)
+        self.runs = 0
         
     async def setup(self):
         """Инициализация тестовой среды"""
         await self.db_manager.init_database()
         
-        # Создаем тестовое событие
-        test_date = "2024-01-01"
+        # Создаем новое тестовое событие для каждого прогона
+        self.runs += 1
+        test_date = f"2024-01-{self.runs:02d}"
         self.event_id = await self.db_manager.create_event(test_date, 12345)
         print(f"Created test event with ID: {self.event_id}")
         
@@ -96,7 +130,7 @@ class PerformanceTest:
         print(f"  Ожидалось: {min(len(results), config.MAX_PARTICIPANTS)}")
         
         # Проверяем на дублирование
-        unique_users = set(p[0] for p in participants)  # user_id
+        unique_users = set(p.user_id for p in participants)
         print(f"  Уникальных пользователей: {len(unique_users)}")
         
         if len(unique_users) != count:
@@ -105,7 +139,7 @@ class PerformanceTest:
             print("  ✅ Дублирования не обнаружено")
             
         # Проверяем корректность позиций
-        positions = [p[4] for p in participants]  # position
+        positions = [p.position for p in participants]
         expected_positions = list(range(1, len(participants) + 1))
         
         if sorted(positions) == expected_positions:
@@ -115,10 +149,267 @@ class PerformanceTest:
             print(f"      Ожидалось: {expected_positions}")
             print(f"      Получено: {sorted(positions)}")
     
+    async def check_query_plans(self) -> bool:
+        """EXPLAIN QUERY PLAN для запросов горячего пути; False при полном сканировании"""
+        print("\n=== ПЛАНЫ ЗАПРОСОВ ===")
+        ok = True
+        async with self.db_manager._reader() as db:
+            for name, sql, params in QUERY_PLAN_CHECKS:
+                cursor = await db.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+                details = [row[3] for row in await cursor.fetchall()]
+                # SCAN CONSTANT ROW — SELECT без таблицы, а не сканирование
+                bad = [d for d in details
+                       if (d.startswith("SCAN") and d != "SCAN CONSTANT ROW") or "TEMP B-TREE" in d]
+                print(f"  {'⚠️ ' if bad else '✅'} {name}: {'; '.join(details)}")
+                ok = ok and not bad
+        return ok
+    
+    async def check_archive(self) -> bool:
+        """Перенос тестовых событий 2024 года в архив: в основной базе их не остаётся"""
+        print("\n=== АРХИВАЦИЯ ===")
+        archived = await self.db_manager.archive_events("2025-01-01", batch_size=1)
+        await self.db_manager.compact()
+        history = await self.db_manager.get_event_history(10)
+        in_archive = [event for event in history if event[4]]
+        print(f"  Перенесено событий: {archived}, в архиве по истории: {len(in_archive)}")
+        roster = await self.db_manager.get_participants(self.event_id)
+        ok = archived == self.runs and len(in_archive) == self.runs and not roster
+        print("  ✅ Архив корректен" if ok else "  ⚠️  АРХИВ НЕКОРРЕКТЕН!")
+        return ok
+    
+    async def check_chats(self) -> bool:
+        """Лимит из настроек чата: новое значение действует для уже созданного события"""
+        print("\n=== НАСТРОЙКИ ЧАТОВ ===")
+        chat = ChatSettings(-42, 2, 18, 30, 2, False, True)
+        await self.db_manager.save_chat(chat)
+        event_id = await self.db_manager.create_event("2099-01-01", 1, chat_id=chat.chat_id)
+        joined = [(await self.db_manager.add_participant(event_id, u, "", "U", str(u)))[0]
+                  for u in range(4)]
+        await self.db_manager.save_chat(chat._replace(max_participants=3))
+        late, _ = await self.db_manager.add_participant(event_id, 10, "", "U", "10")
+        roster = await self.db_manager.get_roster(event_id)
+        ok = (joined == [True, True, False, False] and late and roster.capacity == 3
+              and await self.db_manager.get_chat(chat.chat_id) == chat._replace(max_participants=3))
+        print(f"  Записи при лимите 2: {joined}, после увеличения до 3: {late}")
+        
+        # Куча планировщика: ближайший запуск первым, правка расписания вытесняет старую запись
+        now = datetime.now()
+        scheduler = ChatScheduler(lambda chat_id: asyncio.sleep(0))
+        for chat_id in range(500):
+            scheduler.schedule(chat._replace(chat_id=chat_id, schedule_day=chat_id % 7,
+                                             schedule_minute=chat_id % 60))
+        scheduler.schedule(chat._replace(chat_id=7, schedule_day=now.weekday(), schedule_hour=23))
+        scheduler.schedule(chat._replace(chat_id=8, enabled=False))
+        ok = (ok and scheduler.stats()["chats"] == 499
+              and scheduler._peek()[0] == min(scheduler._due.values())
+              and scheduler.next_run(7) == next_fire_time(now.weekday(), 23, 30, now))
+        ok = ok and next_fire_time(6, 21, 2, datetime(2024, 1, 7, 21, 2)) == datetime(2024, 1, 14, 21, 2)
+        print(f"  Чатов в расписании: {scheduler.stats()['chats']}, ближайший: {scheduler._peek()[1]}")
+        print("  ✅ Настройки чатов корректны" if ok else "  ⚠️  НАСТРОЙКИ ЧАТОВ НЕКОРРЕКТНЫ!")
+        return ok
+    
+    async def check_admission(self) -> bool:
+        """Отказы при полном списке и повторной записи не доходят до блокировок и базы"""
+        print("\n=== ОТКАЗЫ БЕЗ БАЗЫ ===")
+        event_id = await self.db_manager.create_event("2099-02-01", 1)
+        for u in range(config.MAX_PARTICIPANTS):
+            await self.db_manager.add_participant(event_id, u, "", "U", str(u))
+        await self.db_manager.get_roster(event_id)
+        
+        totals = self.db_manager.perf.totals
+        before = (totals["lock_wait"].count, totals["query"].count)
+        rejected = await asyncio.gather(*(
+            self.db_manager.add_participant(event_id, u, "", "U", str(u))
+            for u in range(config.MAX_PARTICIPANTS + 100, -1, -1)
+        ))
+        untouched = (totals["lock_wait"].count, totals["query"].count) == before
+        ok = (untouched and not any(success for success, _ in rejected)
+              and rejected[-1] == (False, 1) and rejected[0] == (False, -1))
+        print(f"  Отказов: {len(rejected)}, без блокировок и запросов: {untouched}, "
+              f"счётчики: {self.db_manager.fast_rejects}")
+        
+        # Состав, изменённый мимо кэша, исправляется сверкой
+        async with self.db_manager._lock:
+            await self.db_manager._writer.execute(
+                "DELETE FROM participants WHERE event_id = ? AND user_id = 0", (event_id,)
+            )
+        fixed = await self.db_manager.reconcile_rosters()
+        joined, position = await self.db_manager.add_participant(event_id, 500, "", "U", "500")
+        ok = ok and fixed == 1 and joined and position == config.MAX_PARTICIPANTS
+        print(f"  Исправлено сверкой: {fixed}, запись на освободившееся место: {joined}")
+        print("  ✅ Отказы корректны" if ok else "  ⚠️  ОТКАЗЫ НЕКОРРЕКТНЫ!")
+        return ok
+    
+    async def check_waitlist(self) -> bool:
+        """Очередь при полном списке и перевод первого из неё в транзакции отказа"""
+        print("\n=== ЛИСТ ОЖИДАНИЯ ===")
+        promotions = []
+        self.db_manager.on_promoted = lambda chat_id, date, users: promotions.append(users)
+        event_id = await self.db_manager.create_event("2099-03-01", 1, capacity=2)
+        for u in (1, 2):
+            await self.db_manager.add_participant(event_id, u, "", "U", str(u))
+        await self.db_manager.get_roster(event_id)
+        places = [await self.db_manager.wait_for_seat(event_id, u, "", "U", str(u)) for u in (3, 4, 3)]
+        # Заполненная очередь отклоняет по кэшу, событие без строки — без записи в очередь
+        waitlist_max, config.WAITLIST_MAX = config.WAITLIST_MAX, 2
+        rejects = self.db_manager.fast_rejects["full"]
+        try:
+            overflow = await self.db_manager.wait_for_seat(event_id, 5, "", "U", "5")
+        finally:
+            config.WAITLIST_MAX = waitlist_max
+        fast_overflow = self.db_manager.fast_rejects["full"] == rejects + 1
+        missing = await self.db_manager.wait_for_seat(10**9, 6, "", "U", "6")
+        orphans = await self.db_manager._writer.execute_fetchall(
+            "SELECT COUNT(*) FROM waitlist WHERE event_id = ?", (10**9,)
+        )
+        await self.db_manager.remove_participant(event_id, 1)
+        await self.db_manager.remove_participant(event_id, 4)
+        cached = await self.db_manager.get_roster(event_id)
+        stored = await self.db_manager._load_roster(self.db_manager._writer, event_id)
+        ok = (places == [(False, 1), (False, 2), (False, 1)]
+              and overflow == (False, 0) and fast_overflow
+              and missing == (False, 0) and orphans[0][0] == 0
+              and list(cached.members) == list(stored.members) == [2, 3]
+              and not cached.waiting and not stored.waiting
+              and [[user[0] for user in users] for users in promotions] == [[3]])
+        print(f"  Места в очереди: {places}, после отказов: {list(stored.members)}, "
+              f"переведены: {promotions}")
+        print(f"  Очередь заполнена: {overflow} (по кэшу: {fast_overflow}), "
+              f"событие не найдено: {missing}")
+        print("  ✅ Лист ожидания корректен" if ok else "  ⚠️  ЛИСТ ОЖИДАНИЯ НЕКОРРЕКТЕН!")
+        return ok
+    
+    async def check_event_log(self) -> bool:
+        """
+        Режим журнала операций: конкурентные записи сверх лимита, очередь и перевод,
+        затем восстановление состава из снимка и хвоста журнала в новом процессе
+        """
+        print("\n=== ЖУРНАЛ ОПЕРАЦИЙ ===")
+        db_path = os.path.join(tempfile.mkdtemp(), "event_log.db")
+        manager = EventLogManager(db_path=db_path, snapshot_every=7)
+        await manager.init_database()
+        event_id = await manager.create_event("2099-04-01", 1)
+        results = await asyncio.gather(*[
+            manager.wait_for_seat(event_id, u, "", "U", str(u)) for u in range(25)
+        ])
+        for u in range(0, 10, 3):
+            await manager.remove_participant(event_id, u)
+        await manager.add_participant(event_id, 100, "", "U", "100")
+        cached = await manager.get_roster(event_id)
+        snapshots = manager.snapshots
+        await manager.close()
+        
+        restarted = EventLogManager(db_path=db_path, snapshot_every=7)
+        await restarted.init_database()
+        recovered = await restarted.get_roster(event_id)
+        archived = await restarted.archive_events("2100-01-01", batch_size=10)
+        in_archive = [p.user_id for p in await restarted.get_archived_participants(event_id)]
+        await restarted.close()
+        
+        joined = sum(1 for success, _ in results if success)
+        ok = (joined == config.MAX_PARTICIPANTS and snapshots > 0
+              and len(cached.members) == config.MAX_PARTICIPANTS
+              and list(recovered.members.items()) == list(cached.members.items())
+              and list(recovered.waiting.items()) == list(cached.waiting.items())
+              and archived == 1 and in_archive == list(cached.members))
+        print(f"  Записаны: {joined}, в очереди после отказов: {len(cached.waiting)}, снимков: {snapshots}")
+        print(f"  Восстановлено: {len(recovered.members)} + {len(recovered.waiting)}, в архиве: {len(in_archive)}")
+        print("  ✅ Журнал операций корректен" if ok else "  ⚠️  ЖУРНАЛ ОПЕРАЦИЙ НЕКОРРЕКТЕН!")
+        return ok
+    
+    async def check_outbound(self) -> bool:
+        """RetryAfter на ответе ставит на паузу только ответы, правка другого чата идёт сразу"""
+        print("\n=== ОЧЕРЕДЬ API ===")
+        outbound = OutboundScheduler(global_rate=30, chat_rate=1, chat_burst=3)
+        limited = asyncio.Event()
+        
+        async def make_request(bot, method):
+            if isinstance(method, AnswerCallbackQuery) and not limited.is_set():
+                limited.set()
+                raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=1)
+            return True
+        
+        started = time.perf_counter()
+        answer = asyncio.create_task(outbound(make_request, None, AnswerCallbackQuery(callback_query_id="1")))
+        await limited.wait()
+        await outbound(make_request, None, EditMessageText(chat_id=-2, message_id=1, text="x"))
+        edit_time = time.perf_counter() - started
+        await answer
+        answer_time = time.perf_counter() - started
+        
+        ok = edit_time < 0.2 and answer_time >= 1.0 and outbound.retry_after == 1
+        print(f"  Правка другого чата: {edit_time * 1000:.0f} мс, ответ после паузы: {answer_time:.2f} сек")
+        print("  ✅ Пауза затрагивает только ответы" if ok else "  ⚠️  RETRYAFTER ОСТАНОВИЛ ВСЮ ОЧЕРЕДЬ!")
+        return ok
+    
+    async def check_workers(self) -> bool:
+        """
+        Режим workers: два менеджера на одном файле ведут себя как два процесса.
+        Запись ждёт чужую транзакцию дольше busy_timeout и повторяется, лимит
+        при записи из обоих не превышается, аренду лидера держит один из них
+        """
+        print("\n=== НЕСКОЛЬКО ПРОЦЕССОВ ===")
+        db_path = os.path.join(tempfile.mkdtemp(), "workers.db")
+        first = DatabaseManager(db_path=db_path)
+        await first.init_database()
+        busy_timeout, config.DB_BUSY_TIMEOUT_MS = config.DB_BUSY_TIMEOUT_MS, 50
+        try:
+            second = DatabaseManager(db_path=db_path)
+            await second.init_database()
+        finally:
+            config.DB_BUSY_TIMEOUT_MS = busy_timeout
+        event_id = await first.create_event("2099-05-01", 1, capacity=10)
+        
+        # Первый держит блокировку записи дольше busy_timeout второго
+        async def hold():
+            async with first._lock:
+                await first._writer.execute("BEGIN IMMEDIATE")
+                await asyncio.sleep(0.2)
+                await first._writer.execute("COMMIT")
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0.02)
+        blocked_join = await second.add_participant(event_id, 1, "", "U", "1")
+        await holder
+        
+        results = await asyncio.gather(*[
+            (first if u % 2 else second).add_participant(event_id, u, "", "U", str(u))
+            for u in range(2, 30)
+        ])
+        stored = await first._load_roster(first._writer, event_id)
+        
+        leases = [LeaderLease(manager, "scheduler", name, 0.3, lambda: None, lambda: None)
+                  for manager, name in ((first, "first"), (second, "second"))]
+        for lease in leases:
+            await lease.start()
+        single_leader = [lease.held for lease in leases] == [True, False]
+        await leases[0].stop()
+        await asyncio.sleep(0.2)
+        taken_over = leases[1].held
+        await leases[1].stop()
+        await first.close()
+        await second.close()
+        
+        update = {"update_id": 1, "callback_query": {
+            "id": "1", "from": {"id": 7}, "data": f"e1:join:{event_id}:2099-05-01",
+            "message": {"message_id": 1, "chat": {"id": -100}}}}
+        message = {"update_id": 2, "message": {"message_id": 2, "chat": {"id": -100}, "from": {"id": 7}}}
+        partition_ok = (partition_key(update) == partition_key(message) == -100
+                        and worker_for(-100, 3) == worker_for(partition_key(message), 3))
+        
+        joined = 1 + sum(1 for success, _ in results if success)
+        ok = (blocked_join == (True, 1) and second.busy_retries > 0
+              and joined == len(stored.members) == 10 and len(set(stored.members)) == 10
+              and single_leader and taken_over and partition_ok)
+        print(f"  Запись при чужой транзакции: {blocked_join}, повторов: {second.busy_retries}")
+        print(f"  Записаны из двух процессов: {joined}, в базе: {len(stored.members)}")
+        print(f"  Один лидер: {single_leader}, аренда перешла: {taken_over}, разбиение: {partition_ok}")
+        print("  ✅ Работа нескольких процессов корректна" if ok else "  ⚠️  РАБОТА НЕСКОЛЬКИХ ПРОЦЕССОВ НЕКОРРЕКТНА!")
+        return ok
+    
     async def cleanup(self):
         """Очистка тестовых данных"""
         # В реальном тесте здесь можно удалить тестовые данные
-        pass
+        await self.db_manager.close()
 
 async def main():
     """Основная функция тестирования"""
@@ -146,10 +437,43 @@ async def main():
         results, duration = await test.run_concurrent_test(25)
         await test.analyze_results(results, duration)
         
+        # Тест 3: индексы используются запросами горячего пути
+        plans_ok = await test.check_query_plans()
+        
+        # Тест 4: перенос прошедших событий в архив
+        archive_ok = await test.check_archive()
+        
+        # Тест 5: лимит и расписание из настроек чатов
+        chats_ok = await test.check_chats()
+        
+        # Тест 6: отказы по кэшу составов
+        admission_ok = await test.check_admission()
+        
+        # Тест 7: лист ожидания
+        waitlist_ok = await test.check_waitlist()
+        
+        # Тест 8: хранение журналом операций со снимками
+        event_log_ok = await test.check_event_log()
+        
+        # Тест 9: общая база и аренда лидера для нескольких процессов
+        workers_ok = await test.check_workers()
+        
+        # Тест 10: RetryAfter на ответе не задерживает правки других чатов
+        outbound_ok = await test.check_outbound()
+        
         await test.cleanup()
         
+        if not plans_ok:
+            print("\n❌ Запросы горячего пути перешли на полное сканирование")
+            return 1
+        if not archive_ok or not chats_ok or not admission_ok or not waitlist_ok or not event_log_ok \
+                or not workers_ok or not outbound_ok:
+            return 1
+        
     except Exception as e:
         print(f"Ошибка тестирования: {e}")
+        return 1
+    return 0
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    sys.exit(asyncio.run(main())) 
\ No newline at end of file
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Общий набор проверок для всех реализаций хранилища (storage.Storage):
+конкурентные записи, очередь, отказы с переводом, лимиты чатов, архив
+и восстановление после перезапуска. Завершается с ошибкой, если хоть одна
+реализация ведёт себя иначе
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from typing import Callable, Dict, List
+from database import DatabaseManager
+from event_log import EventLogManager
+from memory_storage import MemoryStorage
+from storage import ChatSettings, Event, Participant, Storage
+import config
+
+# Реализация по пути к файлам во временном каталоге; повторный вызов
+# с тем же путём открывает то же хранилище после "перезапуска"
+IMPLEMENTATIONS: Dict[str, Callable[[str], Storage]] = {
+    "sqlite": lambda path: DatabaseManager(db_path=path + ".db"),
+    "sqlite-batch": lambda path: DatabaseManager(db_path=path + ".db", batch_writes=True),
+    "event-log": lambda path: EventLogManager(db_path=path + ".db", snapshot_every=5),
+    "memory": lambda path: MemoryStorage(snapshot_path=path + ".json"),
+}
+
+CAPACITY = 5
+
+
+class ConformanceTest:
+    def __init__(self, name: str, factory: Callable[[str], Storage]):
+        self.name = name
+        self.factory = factory
+        self.path = os.path.join(tempfile.mkdtemp(), name)
+        self.failures: List[str] = []
+
+    def check(self, condition: bool, description: str):
+        if not condition:
+            self.failures.append(description)
+
+    async def open(self) -> Storage:
+        storage = self.factory(self.path)
+        await storage.init_database()
+        return storage
+
+    async def run(self) -> bool:
+        storage = await self.open()
+        promotions = []
+        storage.on_promoted = lambda chat_id, date, users: promotions.append((chat_id, date, users))
+        try:
+            await self.check_records(storage)
+            await self.check_concurrent_joins(storage)
+            await self.check_waitlist(storage, promotions)
+            await self.check_capacity(storage, promotions)
+            event_id, expected = await self.check_churn(storage)
+        finally:
+            await storage.close()
+
+        storage = await self.open()
+        try:
+            roster = await storage.get_roster(event_id)
+            self.check([p.user_id for p in roster.rows()] == expected[0]
+                       and [p.user_id for p in roster.waiting_rows()] == expected[1],
+                       "состав после перезапуска не совпадает")
+            await self.check_archive(storage, event_id, expected[0])
+            await self.check_lease(storage)
+        finally:
+            await storage.close()
+        return not self.failures
+
+    async def check_records(self, storage: Storage):
+        """Записи хранилища — Event и Participant, а не строки базы"""
+        await storage.save_chat(ChatSettings(-1, 6, 21, 0, CAPACITY, True, True))
+        event_id = await storage.create_event("2099-01-01", 10, chat_id=-1)
+        await storage.set_event_message(event_id, 11)
+        event = await storage.get_event_by_date("2099-01-01", -1)
+        self.check(event == Event(event_id, -1, "2099-01-01", 11, CAPACITY), f"событие: {event}")
+        self.check(await storage.get_event_by_date("2099-01-02", -1) is None, "несуществующее событие")
+        await storage.add_participant(event_id, 1, "one", "One", "")
+        participants = await storage.get_participants(event_id)
+        self.check(participants == [Participant(1, "one", "One", "", 1)], f"участники: {participants}")
+        # Повторное создание на ту же дату сохраняет id (кнопки отправленных сообщений) и состав
+        again = await storage.create_event("2099-01-01", 12, chat_id=-1, capacity=CAPACITY + 1)
+        event = await storage.get_event_by_date("2099-01-01", -1)
+        roster = await storage.get_roster(event_id)
+        self.check(again == event_id and event == Event(event_id, -1, "2099-01-01", 12, CAPACITY + 1),
+                   f"повторное создание события: {again}, {event}")
+        self.check(list(roster.members) == [1] and roster.capacity == CAPACITY + 1,
+                   "состав после повторного создания")
+        self.check(await storage.get_chat(-1) == ChatSettings(-1, 6, 21, 0, CAPACITY, True, True),
+                   "настройки чата")
+
+    async def check_concurrent_joins(self, storage: Storage):
+        """Одновременные записи: ровно лимит, без дубликатов, позиции 1..N"""
+        event_id = await storage.create_event("2099-01-08", 1, chat_id=-1)
+        # Каждый пользователь нажимает дважды
+        results = await asyncio.gather(*[
+            storage.add_participant(event_id, u % 20, "", "U", str(u % 20)) for u in range(40)
+        ])
+        successes = sorted(position for success, position in results if success)
+        participants = await storage.get_participants(event_id)
+        self.check(successes == list(range(1, CAPACITY + 1)), f"успешные записи: {successes}")
+        self.check(len({p.user_id for p in participants}) == len(participants) == CAPACITY,
+                   "дубликаты или превышение лимита")
+        self.check([p.position for p in participants] == list(range(1, CAPACITY + 1)), "позиции")
+        self.check(all(position == -1 or position > 0 for success, position in results if not success),
+                   "ответ на отказ")
+        self.check(await storage.get_participant_count(event_id) == CAPACITY, "число участников")
+
+    async def check_waitlist(self, storage: Storage, promotions: list):
+        """Очередь ограничена WAITLIST_MAX, отказ переводит первого из неё"""
+        event_id = await storage.create_event("2099-01-15", 1, chat_id=-1)
+        users = range(CAPACITY + config.WAITLIST_MAX + 3)
+        results = await asyncio.gather(*[
+            storage.wait_for_seat(event_id, u, "", "U", str(u)) for u in users
+        ])
+        joined = [u for u, (success, _) in zip(users, results) if success]
+        queued = sorted(place for success, place in results if not success and place)
+        self.check(len(joined) == CAPACITY, f"записаны: {joined}")
+        self.check(queued == list(range(1, config.WAITLIST_MAX + 1)), f"места в очереди: {queued}")
+        self.check(await storage.wait_for_seat(event_id, joined[0], "", "U", "") == (True, 1),
+                   "повторное нажатие записанного")
+
+        roster = await storage.get_roster(event_id)
+        head = next(iter(roster.waiting))
+        promotions.clear()
+        removed = await asyncio.gather(*[storage.remove_participant(event_id, u) for u in joined[:2]])
+        roster = await storage.get_roster(event_id)
+        promoted = [user[0] for _, _, users in promotions for user in users]
+        self.check(all(removed) and len(roster.members) == CAPACITY, "отказ с переводом")
+        self.check(promoted[:1] == [head] and len(promoted) == 2
+                   and all(u in roster.members for u in promoted), f"переведены: {promoted}")
+        self.check(not set(roster.members) & set(roster.waiting), "в списке и в очереди одновременно")
+        self.check(await storage.remove_participant(event_id, next(iter(roster.waiting))),
+                   "отказ из очереди")
+        self.check(not await storage.remove_participant(event_id, 10 ** 6), "отказ не записанного")
+
+    async def check_capacity(self, storage: Storage, promotions: list):
+        """Увеличение лимита чата переводит стоящих в очереди"""
+        event_id = (await storage.get_event_by_date("2099-01-15", -1)).id
+        waiting = len((await storage.get_roster(event_id)).waiting)
+        promotions.clear()
+        await storage.save_chat(ChatSettings(-1, 6, 21, 0, CAPACITY + 2, True, True))
+        roster = await storage.get_roster(event_id)
+        self.check(roster.capacity == CAPACITY + 2 and len(roster.members) == CAPACITY + 2
+                   and len(roster.waiting) == waiting - 2, "перевод при увеличении лимита")
+        self.check(sum(len(users) for _, _, users in promotions) == 2, "уведомления о переводе")
+        await storage.save_chat(ChatSettings(-1, 6, 21, 0, CAPACITY, True, True))
+
+    async def check_churn(self, storage: Storage):
+        """Перемешанные записи, очередь и отказы; итог сверяется после перезапуска"""
+        event_id = await storage.create_event("2099-01-22", 1, chat_id=-1)
+        operations = []
+        for step in range(300):
+            user_id = step * 7 % 13
+            if step % 3 == 2:
+                operations.append(storage.remove_participant(event_id, user_id))
+            else:
+                operations.append(storage.wait_for_seat(event_id, user_id, "", "U", str(user_id)))
+        await asyncio.gather(*operations)
+        roster = await storage.get_roster(event_id)
+        self.check(len(roster.members) <= CAPACITY and len(roster.waiting) <= config.WAITLIST_MAX,
+                   "лимиты после перемешанных операций")
+        self.check(not roster.waiting or len(roster.members) == CAPACITY,
+                   "очередь при свободных местах")
+        return event_id, ([p.user_id for p in roster.rows()], [p.user_id for p in roster.waiting_rows()])
+
+    async def check_archive(self, storage: Storage, event_id: int, members: List[int]):
+        """Архив прошедших событий: история и участники сохраняются"""
+        archived = await storage.archive_events("2099-01-20", batch_size=2)
+        history = await storage.get_event_history(10, -1)
+        self.check(archived == 3, f"перенесено событий: {archived}")
+        self.check([entry[4] for entry in history] == [0, 1, 1, 1], f"история: {history}")
+        self.check(await storage.get_event_by_date("2099-01-01", -1) is None, "событие осталось")
+        self.check((await storage.add_participant(
+            (await storage.get_event_history(10, -1))[-1][0], 99, "", "U", "")) == (False, -1),
+            "запись в архивное событие")
+        archived_participants = await storage.get_archived_participants(history[-1][0])
+        self.check([p.user_id for p in archived_participants] == [1], "участники архивного события")
+        events = await storage.warm_up("2099-01-01")
+        self.check([event.id for event in events] == [event_id]
+                   and [p.user_id for p in await storage.get_participants(event_id)] == members,
+                   "события после архивации")
+
+    async def check_lease(self, storage: Storage):
+        """Аренда: держатель продлевает, другой получает её после истечения или освобождения"""
+        self.check(await storage.acquire_lease("leader", "a", 0.2), "захват свободной аренды")
+        self.check(not await storage.acquire_lease("leader", "b", 0.2), "захват чужой аренды")
+        self.check(await storage.acquire_lease("leader", "a", 0.2), "продление аренды")
+        await asyncio.sleep(0.3)
+        self.check(await storage.acquire_lease("leader", "b", 0.2), "захват истёкшей аренды")
+        await storage.release_lease("leader", "a")
+        self.check(not await storage.acquire_lease("leader", "a", 0.2), "освобождение чужой аренды")
+        await storage.release_lease("leader", "b")
+        self.check(await storage.acquire_lease("leader", "a", 0.2), "захват освобождённой аренды")
+
+
+async def main() -> int:
+    failed = 0
+    for name, factory in IMPLEMENTATIONS.items():
+        test = ConformanceTest(name, factory)
+        ok = await test.run()
+        print(f"{'✅' if ok else '❌'} {name}")
+        for failure in test.failures:
+            print(f"   {failure}")
+        failed += not ok
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
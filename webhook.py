@@ -0,0 +1,118 @@
+import asyncio
+import hmac
+import logging
+from typing import Callable, Optional, Set
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookHandler:
+    """
+    Приём обновлений от Telegram по webhook.
+    Проверяет секретный токен и ограничивает число одновременно обрабатываемых
+    обновлений: при насыщении ответ Telegram задерживается, и он сам снижает темп
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret: str, max_concurrency: int):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.secret = secret
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        # Без секрета любой мог бы прислать поддельное обновление: такие не принимаются
+        token = request.headers.get(SECRET_HEADER, "")
+        if not self.secret or not hmac.compare_digest(token, self.secret):
+            return web.Response(status=401)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            logger.warning(f"Bad webhook payload: {e}")
+            return web.Response(status=400)
+
+        await self._semaphore.acquire()
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update: Update):
+        try:
+            await self.dispatcher.feed_update(self.bot, update)
+        except Exception as e:
+            logger.error(f"Error processing update {update.update_id}: {e}")
+        finally:
+            self._semaphore.release()
+
+    async def close(self):
+        """Дождаться обработки уже принятых обновлений"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def create_webhook_app(dispatcher: Dispatcher, bot: Bot, path: str, secret: str,
+                       max_concurrency: int,
+                       setup: Optional[Callable[[web.Application], None]] = None) -> web.Application:
+    """aiohttp-приложение, принимающее обновления по пути path; setup добавляет свои маршруты"""
+    handler = WebhookHandler(dispatcher, bot, secret, max_concurrency)
+    app = web.Application()
+    app["webhook_handler"] = handler
+    app.router.add_post(path, handler.handle)
+    if setup is not None:
+        setup(app)
+
+    async def on_shutdown(app: web.Application):
+        await handler.close()
+
+    app.on_shutdown.append(on_shutdown)
+    return app
+
+
+def check_webhook_config(base_url: str, secret: str, register: bool = True):
+    """Проверка настроек до запуска: публичный адрес без секрета принял бы чужие обновления"""
+    if not secret:
+        raise ValueError("WEBHOOK_SECRET is required in webhook mode")
+    if register and not base_url:
+        raise ValueError("WEBHOOK_BASE_URL is required to register the webhook")
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot, base_url: str, path: str, secret: str,
+                      host: str, port: int, max_concurrency: int,
+                      setup: Optional[Callable[[web.Application], None]] = None,
+                      on_started: Optional[Callable[[], None]] = None, register: bool = True):
+    """
+    Регистрация webhook в Telegram и запуск встроенного HTTP-сервера;
+    on_started вызывается, когда обновления уже могут поступать.
+    register=False — только сервер: обработчик за маршрутизатором (workers.py).
+    Без секрета (и без адреса, если webhook регистрируется) сервер не запускается
+    """
+    check_webhook_config(base_url, secret, register)
+    app = create_webhook_app(dispatcher, bot, path, secret, max_concurrency, setup)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info(f"Webhook server listening on {host}:{port}{path}")
+
+    if register:
+        await bot.set_webhook(
+            url=f"{base_url.rstrip('/')}{path}",
+            secret_token=secret,
+            allowed_updates=dispatcher.resolve_used_update_types(),
+            drop_pending_updates=False
+        )
+        logger.info(f"Webhook set to {base_url.rstrip('/')}{path}")
+    if on_started is not None:
+        on_started()
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Сравнение задержки обработки нажатий: webhook против long polling.
+Работает без сети: запросы к Bot API перехватывает локальная сессия-заглушка
+"""
+
+import asyncio
+import datetime
+import logging
+import os
+import statistics
+import tempfile
+import time
+import config
+
+# Отдельная временная база, чтобы не трогать рабочую participants.db
+config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), "webhook_benchmark.db")
+config.WEBHOOK_SECRET = "benchmark-secret"
+
+import aiohttp
+from aiohttp import web
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import AnswerCallbackQuery, GetMe, GetUpdates, SendMessage
+from aiogram.types import Chat, Message, Update, User
+import bot as bot_module
+from webhook import SECRET_HEADER, create_webhook_app
+
+# Логирование каждого обновления исказило бы замер
+logging.getLogger().setLevel(logging.WARNING)
+
+CHAT_ID = config.CHAT_ID
+MESSAGE_ID = 4242
+
+
+class LocalSession(BaseSession):
+    """Сессия-заглушка: отдаёт обновления через getUpdates и засекает ответы на нажатия"""
+
+    def __init__(self):
+        super().__init__()
+        self.updates: asyncio.Queue = asyncio.Queue()
+        self.answered = {}
+
+    async def make_request(self, bot, method, timeout=None):
+        if isinstance(method, GetUpdates):
+            try:
+                first = await asyncio.wait_for(self.updates.get(), method.timeout or 1)
+            except asyncio.TimeoutError:
+                return []
+            batch = [first]
+            while not self.updates.empty() and len(batch) < (method.limit or 100):
+                batch.append(self.updates.get_nowait())
+            return [Update.model_validate(data, context={"bot": bot}) for data in batch]
+        if isinstance(method, AnswerCallbackQuery):
+            self.answered[method.callback_query_id] = time.perf_counter()
+            return True
+        if isinstance(method, GetMe):
+            return User(id=1, is_bot=True, first_name="Benchmark", username="benchmark_bot")
+        if isinstance(method, SendMessage):
+            return Message(
+                message_id=MESSAGE_ID,
+                date=datetime.datetime.now(),
+                chat=Chat(id=method.chat_id, type="supergroup"),
+                text=method.text
+            )
+        return True
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+
+def callback_update(update_id: int, user_id: int, data: str) -> dict:
+    """Синтетическое нажатие кнопки под сообщением со списком"""
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+            "chat_instance": "benchmark",
+            "data": data,
+            "message": {
+                "message_id": MESSAGE_ID,
+                "date": 0,
+                "chat": {"id": CHAT_ID, "type": "supergroup"},
+                "text": "📅 Список участников"
+            }
+        }
+    }
+
+
+async def make_updates(first_update_id: int, num_updates: int, event_date: str) -> list:
+    """Нажатия «Участвовать» от разных пользователей на новом событии"""
+    event_id = await bot_module.db_manager.create_event(event_date, MESSAGE_ID)
+    data = bot_module.EventCallback(action="join", event_id=event_id, date=event_date).pack()
+    return [
+        callback_update(first_update_id + i, 100000 + first_update_id + i, data)
+        for i in range(num_updates)
+    ]
+
+
+async def wait_answered(session: LocalSession, updates: list, timeout: float = 60):
+    deadline = time.perf_counter() + timeout
+    ids = [str(u["update_id"]) for u in updates]
+    while not all(i in session.answered for i in ids):
+        if time.perf_counter() > deadline:
+            raise TimeoutError("Не все нажатия получили ответ")
+        await asyncio.sleep(0.005)
+
+
+def latencies(session: LocalSession, updates: list, sent_at: dict) -> list:
+    return [
+        session.answered[str(u["update_id"])] - sent_at[u["update_id"]]
+        for u in updates
+    ]
+
+
+async def run_webhook(session: LocalSession, updates: list) -> tuple:
+    """Отправка обновлений POST-запросами во встроенный webhook-сервер"""
+    app = create_webhook_app(
+        bot_module.dp, bot_module.bot, config.WEBHOOK_PATH,
+        config.WEBHOOK_SECRET, config.WEBHOOK_MAX_CONCURRENCY
+    )
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}{config.WEBHOOK_PATH}"
+
+    sent_at = {}
+    async with aiohttp.ClientSession() as client:
+        # Запрос без секрета должен быть отклонён
+        async with client.post(url, json=updates[0]) as response:
+            assert response.status == 401, "webhook принял запрос без секрета"
+
+        async def post(update: dict):
+            sent_at[update["update_id"]] = time.perf_counter()
+            async with client.post(url, json=update,
+                                   headers={SECRET_HEADER: config.WEBHOOK_SECRET}) as response:
+                assert response.status == 200
+
+        start = time.perf_counter()
+        await asyncio.gather(*(post(u) for u in updates))
+        await wait_answered(session, updates)
+        total = time.perf_counter() - start
+
+    await runner.cleanup()
+    return latencies(session, updates, sent_at), total
+
+
+async def run_polling(session: LocalSession, updates: list) -> tuple:
+    """Выдача тех же обновлений через getUpdates"""
+    polling = asyncio.create_task(
+        bot_module.dp.start_polling(bot_module.bot, handle_signals=False, polling_timeout=1)
+    )
+    await asyncio.sleep(0.1)
+
+    sent_at = {}
+    start = time.perf_counter()
+    for update in updates:
+        sent_at[update["update_id"]] = time.perf_counter()
+        session.updates.put_nowait(update)
+    await wait_answered(session, updates)
+    total = time.perf_counter() - start
+
+    await bot_module.dp.stop_polling()
+    await polling
+    return latencies(session, updates, sent_at), total
+
+
+def report(name: str, values: list, total: float):
+    values = sorted(values)
+    p50, p95 = statistics.quantiles(values, n=100)[49], statistics.quantiles(values, n=100)[94]
+    print(f"{name:<10} {len(values) / total:<12.1f} {p50 * 1000:<10.2f} "
+          f"{p95 * 1000:<10.2f} {values[-1] * 1000:<10.2f}")
+
+
+async def main():
+    """Основная функция сравнения"""
+    session = LocalSession()
+    bot_module.bot.session = session
+    await bot_module.db_manager.init_database()
+
+    print("🚀 WEBHOOK ПРОТИВ LONG POLLING")
+    print("=" * 60)
+    print(f"{'Режим':<10} {'Обн/сек':<12} {'p50, мс':<10} {'p95, мс':<10} {'max, мс':<10}")
+    print("-" * 60)
+
+    for num_updates in (100, 1000):
+        webhook_updates = await make_updates(1_000_000 + num_updates * 10, num_updates,
+                                             f"webhook-{num_updates}")
+        values, total = await run_webhook(session, webhook_updates)
+        report("webhook", values, total)
+
+        polling_updates = await make_updates(2_000_000 + num_updates * 10, num_updates,
+                                             f"polling-{num_updates}")
+        values, total = await run_polling(session, polling_updates)
+        report("polling", values, total)
+        print(f"  ({num_updates} нажатий)")
+
+    await bot_module.edit_coalescer.close()
+    await bot_module.db_manager.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,199 @@
+import asyncio
+import hmac
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from typing import List, Optional
+import aiohttp
+from aiohttp import web
+import config
+from routing import partition_key, worker_for
+
+logger = logging.getLogger(__name__)
+
+# Заголовок с секретом webhook (тот же, что проверяет webhook.py)
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+RUN_PY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "run.py")
+
+
+class UpdateRouter:
+    """
+    Приём webhook в режиме RUN_MODE=workers: обновление пересылается обработчику
+    по ключу разбиения, так что обновления одного чата всегда обрабатывает
+    один процесс и его кэш составов не расходится с командами чата. Ответ Telegram —
+    ответ обработчика; недоступный обработчик даёт 503, и Telegram повторит доставку
+    """
+
+    def __init__(self, workers: int, base_port: int, path: str, secret: str):
+        self.workers = workers
+        self.path = path
+        self.secret = secret
+        self.urls = [f"http://127.0.0.1:{base_port + i}{path}" for i in range(workers)]
+        self._client: Optional[aiohttp.ClientSession] = None
+        # Метрики
+        self.forwarded = [0] * workers
+        self.failed = [0] * workers
+
+    async def start(self):
+        # Соединения с обработчиками переиспользуются: без этого каждое обновление — новый TCP
+        self._client = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=0, limit_per_host=config.WEBHOOK_MAX_CONCURRENCY)
+        )
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_HEADER, "")
+        if not self.secret or not hmac.compare_digest(token, self.secret):
+            return web.Response(status=401)
+
+        body = await request.read()
+        try:
+            update = json.loads(body)
+            worker = worker_for(partition_key(update), self.workers)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Bad webhook payload: {e}")
+            return web.Response(status=400)
+
+        try:
+            async with self._client.post(
+                self.urls[worker], data=body,
+                headers={"Content-Type": "application/json", SECRET_HEADER: self.secret}
+            ) as response:
+                self.forwarded[worker] += 1
+                return web.Response(status=response.status)
+        except aiohttp.ClientError as e:
+            self.failed[worker] += 1
+            logger.warning(f"Worker {worker} unavailable: {e}")
+            return web.Response(status=503)
+
+    def stats(self) -> dict:
+        return {"forwarded": list(self.forwarded), "failed": list(self.failed)}
+
+
+class WorkerPool:
+    """Процессы-обработчики: запуск, ожидание готовности, перезапуск упавших и остановка"""
+
+    def __init__(self, workers: int, base_port: int):
+        self.workers = workers
+        self.base_port = base_port
+        self._processes: List[Optional[asyncio.subprocess.Process]] = [None] * workers
+        self._stopping = False
+        # Метрики
+        self.restarts = 0
+
+    async def _spawn(self, index: int):
+        # Свой файл лога: ротация одного файла из нескольких процессов теряет записи
+        log_base, log_ext = os.path.splitext(config.LOG_FILE)
+        env = dict(os.environ, WORKERS=str(self.workers), WORKER_INDEX=str(index),
+                   WORKER_BASE_PORT=str(self.base_port), LOG_FILE=f"{log_base}.worker{index}{log_ext}")
+        self._processes[index] = await asyncio.create_subprocess_exec(
+            sys.executable, RUN_PY, "worker", env=env
+        )
+        logger.info(f"Worker {index} started (pid {self._processes[index].pid})")
+
+    async def wait_ready(self, index: int, timeout: float):
+        """Ожидание, пока обработчик не начнёт принимать соединения"""
+        deadline = time.monotonic() + timeout
+        while True:
+            process = self._processes[index]
+            if process is not None and process.returncode is not None:
+                raise RuntimeError(f"Worker {index} exited with code {process.returncode}")
+            try:
+                _, writer = await asyncio.open_connection("127.0.0.1", self.base_port + index)
+                writer.close()
+                return
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Worker {index} not ready after {timeout:.0f}s")
+                await asyncio.sleep(0.1)
+
+    async def start(self):
+        for index in range(self.workers):
+            await self._spawn(index)
+        await asyncio.gather(*(self.wait_ready(index, config.WORKER_START_TIMEOUT)
+                               for index in range(self.workers)))
+        logger.info(f"{self.workers} workers ready")
+
+    async def supervise(self):
+        """Перезапуск упавших обработчиков; пока обработчик поднимается, его обновления получают 503"""
+        while not self._stopping:
+            await asyncio.sleep(1)
+            for index, process in enumerate(self._processes):
+                if self._stopping or process is None or process.returncode is None:
+                    continue
+                logger.error(f"Worker {index} exited with code {process.returncode}, restarting")
+                self.restarts += 1
+                await self._spawn(index)
+
+    def alive(self) -> bool:
+        return all(process is not None and process.returncode is None for process in self._processes)
+
+    async def stop(self):
+        """Остановка как по Ctrl+C: обработчики закрывают базу и освобождают аренду лидера"""
+        self._stopping = True
+        running = [p for p in self._processes if p is not None and p.returncode is None]
+        for process in running:
+            if os.name == "posix":
+                process.send_signal(signal.SIGINT)
+            else:
+                process.terminate()
+        for process in running:
+            try:
+                await asyncio.wait_for(process.wait(), 10)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+
+
+async def run_workers(workers: Optional[int] = None):
+    """
+    Режим RUN_MODE=workers: WORKERS процессов бота и маршрутизатор webhook перед ними.
+    Все процессы работают с одной базой SQLite (запись — BEGIN IMMEDIATE с ожиданием
+    блокировки); задания APScheduler выполняет только держатель аренды лидера.
+    Webhook регистрирует обработчик 0 на адрес маршрутизатора
+    """
+    workers = workers or config.WORKERS
+    if config.DB_STORAGE == "memory":
+        raise ValueError("DB_STORAGE=memory keeps state in one process and cannot be shared by workers")
+    # Маршрутизатор публичный, а webhook на его адрес регистрирует обработчик 0
+    if not config.WEBHOOK_SECRET:
+        raise ValueError("WEBHOOK_SECRET is required in workers mode")
+    if not config.WEBHOOK_BASE_URL:
+        raise ValueError("WEBHOOK_BASE_URL is required in workers mode")
+
+    router = UpdateRouter(workers, config.WORKER_BASE_PORT, config.WEBHOOK_PATH, config.WEBHOOK_SECRET)
+    pool = WorkerPool(workers, config.WORKER_BASE_PORT)
+
+    async def healthz(request: web.Request) -> web.Response:
+        alive = pool.alive()
+        return web.Response(status=200 if alive else 503, text="ok" if alive else "worker down")
+
+    app = web.Application()
+    app.router.add_post(config.WEBHOOK_PATH, router.handle)
+    app.router.add_get("/healthz", healthz)
+    runner = web.AppRunner(app, access_log=None)
+    await router.start()
+    supervisor = None
+    try:
+        await pool.start()
+        await runner.setup()
+        await web.TCPSite(runner, config.WEBHOOK_HOST, config.WEBHOOK_PORT).start()
+        logger.info(f"Update router listening on {config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}"
+                    f"{config.WEBHOOK_PATH}, {workers} workers")
+        supervisor = asyncio.create_task(pool.supervise())
+        await supervisor
+    finally:
+        if supervisor is not None:
+            supervisor.cancel()
+        await pool.stop()
+        await runner.cleanup()
+        await router.close()
+        logger.info(f"Update router stopped: {router.stats()}, restarts {pool.restarts}")